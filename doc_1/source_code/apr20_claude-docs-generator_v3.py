@@ -1,10 +1,16 @@
 import os
 import sys
-import ast
-import boto3
 import json
 import argparse
 
+from bedrock_utils import build_claude_request, get_rate_limiter, get_response_cache, invoke_model_stream, invoke_model_with_retry
+from bedrock_utils import connection_stats, get_bedrock_client, get_latency_history, supports_prompt_caching
+from bedrock_utils import DEFAULT_MAX_CONTINUATIONS, set_max_continuations, truncation_tracker, usage_tracker
+from extraction_utils import iter_extracted_files, list_candidate_files
+from planning_utils import TokenHistogram, format_plan, plan_run
+from section_utils import generate_sections, section_prompts
+from token_utils import DEFAULT_TOKEN_COUNTER, TOKEN_COUNTERS, get_token_counter
+
 # Signature for generated documentation
 SIGNATURE = """# Auto-generated Documentation
 
@@ -83,8 +89,27 @@ parser.add_argument("--model", default="anthropic.claude-3-sonnet-20240229-v1:0"
 parser.add_argument("--region", default="us-east-1", help="AWS region for Bedrock")
 parser.add_argument("--extended", action="store_true", help="Generate extended documentation")
 parser.add_argument("--force", action="store_true", help="Skip token size confirmation")
+parser.add_argument("--rpm", type=int, default=None, help="Bedrock requests-per-minute budget")
+parser.add_argument("--tpm", type=int, default=None, help="Bedrock tokens-per-minute budget")
+parser.add_argument("--cache-db", default=None, help="SQLite file for cached model responses (default: <output>/llm_response_cache.sqlite)")
+parser.add_argument("--no-cache", action="store_true", help="Always call the model instead of reusing cached responses")
+parser.add_argument("--stream", action="store_true", help="Stream documentation into the output files as it is generated (Claude models only)")
+parser.add_argument("--workers", type=int, default=None, help="Processes used for file extraction (default: one per CPU)")
+parser.add_argument("--full-extract", action="store_true", help="Re-read every file instead of reusing the extraction manifest")
+parser.add_argument("--no-gitignore", action="store_true", help="Also extract files ignored by the repository's .gitignore")
+parser.add_argument("--token-counter", choices=list(TOKEN_COUNTERS), default=DEFAULT_TOKEN_COUNTER, help=f"How the input token size is counted (default: {DEFAULT_TOKEN_COUNTER})")
+parser.add_argument("--tokenizer-file", default=None, help="tokenizer.json for --token-counter tokenizer")
+parser.add_argument("--plan", action="store_true", help="Print the token, call and time plan of the run and exit without calling the model")
+parser.add_argument("--parallel-sections", action="store_true", help="Generate each section of the basic and extended documentation in its own concurrent call (Claude models only); each call resends the repository, which prompt caching shares on models that support it")
+parser.add_argument("--max-continuations", type=int, default=DEFAULT_MAX_CONTINUATIONS, help=f"Continuation calls for a response cut off at max_tokens (Claude models only, default: {DEFAULT_MAX_CONTINUATIONS})")
 args = parser.parse_args()
 
+# Configure how far responses cut off at max_tokens are continued
+set_max_continuations(args.max_continuations)
+
+# Configure the shared Bedrock rate limiter
+rate_limiter = get_rate_limiter(args.rpm, args.tpm)
+
 # Set repository and output directories
 REPO_DIR = args.repo
 OUTPUT_DIR = args.output
@@ -126,119 +151,108 @@ if not os.path.exists(REPO_DIR):
 # Create output directory if it doesn't exist
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
+# Reuse responses from earlier runs on unchanged input
+if not args.no_cache:
+    get_response_cache(args.cache_db or os.path.join(OUTPUT_DIR, "llm_response_cache.sqlite"))
+
+# Record call latencies so later runs (and --plan) can estimate their duration
+latency_history = get_latency_history(os.path.join(OUTPUT_DIR, "llm_call_history.sqlite"))
+
 # Extract code from repository
 print(f"Extracting code from {REPO_DIR}...")
 repo_name = os.path.basename(REPO_DIR)
 output_file = os.path.join(OUTPUT_DIR, f"{repo_name}_code.txt")
 
-# Open the output file for writing
-with open(output_file, "w", encoding="utf-8") as outfile:
-    # Walk through the repository directory
-    for root, _, files in os.walk(REPO_DIR):
-        for file in files:
-            file_path = os.path.join(root, file)
-            
-            # Skip if file path ends with "/"
-            if file_path.endswith("/"):
-                continue
-            
-            # Check if file has a desired extension
-            if not any(file_path.endswith(ext) for ext in code_extensions):
-                continue
-            
-            # Check if file is in excluded directory
-            check_path = file_path.replace("\\", "/")
-            parts = check_path.split(os.sep)[1:]
-            if any(part.startswith(".") for part in parts):
-                continue
-            
-            if "test" in check_path.lower():
-                continue
-                
-            skip_file = False
-            for excluded_dir in excluded_dirs:
-                if f"/{excluded_dir}/" in check_path or check_path.startswith(f"{excluded_dir}/"):
-                    skip_file = True
-                    break
-                    
-            if skip_file:
-                continue
-                
-            for file_name in utility_or_config_files:
-                if file_name in check_path:
-                    skip_file = True
-                    break
-                    
-            if skip_file:
-                continue
-                
-            if not all(doc_file not in check_path for doc_file in github_workflow_or_docs):
-                continue
-            
-            # Try to read the file
-            try:
-                with open(file_path, "r", encoding="utf-8") as file_content:
-                    # Skip files with insufficient substantive content
-                    file_lines = file_content.readlines()
-                    lines = [
-                        line
-                        for line in file_lines
-                        if line.strip() and not line.strip().startswith("//")
-                    ]
-                    
-                    if len(lines) < 5:  # Skip files with less than 5 substantive lines
-                        continue
-                        
-                    # Write file path and content to output file
-                    relative_path = os.path.relpath(file_path, REPO_DIR)
-                    outfile.write(f"# File: {relative_path}\n")
-                    
-                    # For Python files, try to clean comments and docstrings
-                    if file_path.endswith(".py"):
-                        try:
-                            source = "".join(file_lines)
-                            tree = ast.parse(source)
-                            for node in ast.walk(tree):
-                                if isinstance(node, (ast.FunctionDef, ast.ClassDef, ast.AsyncFunctionDef)) and ast.get_docstring(node):
-                                    node.body = node.body[1:]  # Remove docstring
-                                elif isinstance(node, ast.Expr) and isinstance(node.value, ast.Str):
-                                    node.value.s = ""  # Remove comments
-                            cleaned_source = ast.unparse(tree)
-                            outfile.write(cleaned_source)
-                        except:
-                            # If ast parsing fails, write the original source
-                            outfile.writelines(file_lines)
-                    # Handle Jupyter notebooks
-                    elif file_path.endswith(".ipynb"):
-                        try:
-                            import json
-                            notebook = json.load(open(file_path, 'r', encoding='utf-8'))
-                            for cell in notebook.get('cells', []):
-                                if cell.get('cell_type') == 'code':
-                                    outfile.write("```python\n")
-                                    outfile.write(''.join(cell.get('source', [])))
-                                    outfile.write("\n```\n\n")
-                        except:
-                            outfile.write("# Failed to parse notebook\n")
-                            outfile.writelines(file_lines)
-                    else:
-                        # For non-Python files, write original content
-                        outfile.writelines(file_lines)
-                        
-                    outfile.write("\n\n")
-                    print(f"  Processed: {relative_path}")
-            except Exception as e:
-                print(f"  Error reading file {file_path}: {e}")
+filters = dict(
+    code_extensions=code_extensions,
+    excluded_dirs=excluded_dirs,
+    utility_or_config_files=utility_or_config_files,
+    github_workflow_or_docs=github_workflow_or_docs,
+)
+candidate_files = list_candidate_files(REPO_DIR, not args.no_gitignore, **filters)
 
+# Each file is counted as it is extracted; counts are cached by content hash between runs
+counter_client = None
+if args.token_counter == "bedrock":
+    counter_client = get_bedrock_client(args.region)
+count_tokens = get_token_counter(
+    args.token_counter,
+    cache_path=None if args.no_cache else os.path.join(OUTPUT_DIR, "token_counts.sqlite"),
+    tokenizer_file=args.tokenizer_file,
+    bedrock_client=counter_client,
+    model_id=args.model
+)
+
+# Read and clean files across a process pool, in sorted path order. Each entry is
+# written to the corpus file and collected for the prompt as it arrives, so the
+# corpus is never read back and the prompt is the only full copy kept in memory.
+prompt_parts = ["Given this repo. \n"]
+files_written = 0
+token_size = 0
+histogram = TokenHistogram(count_tokens)
+with open(output_file, "w", encoding="utf-8") as outfile:
+    for file_path, entry in iter_extracted_files(
+        REPO_DIR,
+        workers=args.workers,
+        relative_paths=True,
+        notebook_cells=True,
+        manifest_path=None if args.full_extract else os.path.join(OUTPUT_DIR, "extraction_manifest.sqlite"),
+        file_paths=candidate_files,
+    ):
+        outfile.write(entry)
+        prompt_parts.append(entry)
+        files_written += 1
+        token_size += histogram.add(os.path.relpath(file_path, REPO_DIR), entry)
+        print(f"  Processed: {os.path.relpath(file_path, REPO_DIR)}")
+prompt_parts.append("\ncomplete your instruction")
+print(f"Extracted {files_written} of {len(candidate_files)} candidate files")
 print(f"Code extracted to {output_file}")
 
-# Estimate token size
-with open(output_file, "r", encoding="utf-8") as file:
-    repo_content = file.read()
-    # Very simple estimation - approximately 4 characters per token
-    token_size = len(repo_content) // 4
-    print(f"Input token size estimate: {token_size}")
-    print(f"File size: {os.path.getsize(output_file) / 1024:.2f} KB")
+print(f"Input token size estimate: {token_size} ({args.token_counter} counter)")
+if hasattr(count_tokens, "hits"):
+    print(f"Token counts: {count_tokens.hits} files reused from the cache, {count_tokens.misses} counted")
+print(f"File size: {os.path.getsize(output_file) / 1024:.2f} KB")
+
+# Determine max tokens based on model
+max_tokens = 4096
+if "claude-3" in args.model:
+    if "opus" in args.model:
+        max_tokens = 4096
+    elif "sonnet" in args.model:
+        max_tokens = 4096
+    elif "haiku" in args.model:
+        max_tokens = 2048
+
+# Sections are requested separately only from Claude models (the Messages API request format)
+parallel_sections = args.parallel_sections and ("anthropic" in args.model or "claude" in args.model)
+if args.parallel_sections and not parallel_sections:
+    print(f"Section-parallel documentation is not supported for {args.model}, using one call instead")
+
+# One call for the basic documentation (or one per section); each extended call resends the
+# repository with the follow-up prompt
+system_tokens = count_tokens(BASIC_DOCS_SYSTEM_PROMPT)
+basic_prompts = section_prompts(BASIC_DOCS_SYSTEM_PROMPT) if parallel_sections else [("", "")]
+extended_prompts = (section_prompts(REFINED_DOCS_FOLLOW_UP_PROMPT) if parallel_sections
+                    else [("", REFINED_DOCS_FOLLOW_UP_PROMPT)])
+extended_prompt_tokens = sum(count_tokens(prompt) for _, prompt in extended_prompts) // len(extended_prompts)
+plan = plan_run(
+    [token_size + count_tokens(prompt) for _, prompt in basic_prompts],
+    args.model,
+    max_tokens=max_tokens,
+    max_workers=len(basic_prompts),
+    system_tokens=system_tokens,
+    consolidation_mode=None,
+    extended_input_tokens=(token_size + system_tokens + extended_prompt_tokens
+                           if args.extended or not args.force else None),
+    extended_calls=len(extended_prompts),
+    history=latency_history,
+    limiter=rate_limiter,
+)
+print()
+print(format_plan(plan, histogram))
+print()
+if args.plan:
+    sys.exit()
 
 # Ask user if they want to proceed
 if not args.force:
@@ -248,41 +262,36 @@ if not args.force:
         sys.exit()
 
 try:
-    # Initialize Bedrock client
+    # Initialize Bedrock client; boto3 is imported on first use so --help and declined runs start fast
     print(f"Initializing AWS Bedrock client in region {args.region}...")
-    bedrock_runtime = boto3.client(
-        service_name="bedrock-runtime",
-        region_name=args.region,
-    )
+    bedrock_runtime = get_bedrock_client(args.region)
 
     # Prepare input prompt
-    input_prompt = f"Given this repo. \n{repo_content}\ncomplete your instruction"
+    input_prompt = "".join(prompt_parts)
+    del prompt_parts
 
     # Generate basic documentation
     print("Generating basic documentation...")
     
-    # Determine max tokens based on model
-    max_tokens = 4096
-    if "claude-3" in args.model:
-        if "opus" in args.model:
-            max_tokens = 4096
-        elif "sonnet" in args.model:
-            max_tokens = 4096
-        elif "haiku" in args.model:
-            max_tokens = 2048
+    # Streaming uses the Messages API event format, so it is limited to Claude models
+    stream = args.stream and ("anthropic" in args.model or "claude" in args.model)
+    if args.stream and not stream:
+        print(f"Streaming is not supported for {args.model}, waiting for the full response instead")
+    if stream and parallel_sections:
+        print("Sections are generated concurrently; the documentation files are written once all sections are done")
     
     # Set up request for different model types
     if "anthropic" in args.model or "claude" in args.model:
-        # Claude-specific request format
-        request_body = {
-            "anthropic_version": "bedrock-2023-05-31",
-            "max_tokens": max_tokens,
-            "system": BASIC_DOCS_SYSTEM_PROMPT,
-            "messages": [
-                {"role": "user", "content": input_prompt},
-            ],
-            "temperature": 0.5,
-        }
+        # Claude-specific request format; the system prompt and repository
+        # content are marked cacheable so the extended request can reuse them
+        request_body = build_claude_request(
+            args.model,
+            [{"role": "user", "content": input_prompt}],
+            system_prompt=BASIC_DOCS_SYSTEM_PROMPT,
+            max_tokens=max_tokens,
+            temperature=0.5,
+            cache_prefix_messages=1,
+        )
     else:
         # Generic format for other models (CodeLLama, DeepSeek, etc.)
         request_body = {
@@ -292,13 +301,28 @@ try:
         }
     
     # Invoke model
-    response = bedrock_runtime.invoke_model(
-        modelId=args.model,
-        body=json.dumps(request_body)
-    )
-    
-    # Parse response based on model
-    response_body = json.loads(response['body'].read().decode())
+    basic_docs_path = os.path.join(OUTPUT_DIR, f"{repo_name}-docs.md")
+    if parallel_sections:
+        # One call per section of the system prompt. The system prompt and repository are the
+        # shared cacheable prefix (also reused by the extended calls); only the trailing
+        # section instruction differs, and the first section warms the cache for the rest
+        response_body = {"content": [{"text": generate_sections(
+            BASIC_DOCS_SYSTEM_PROMPT,
+            lambda title, prompt: invoke_model_with_retry(bedrock_runtime, args.model, build_claude_request(
+                args.model,
+                [{"role": "user", "content": [{"type": "text", "text": input_prompt}, {"type": "text", "text": prompt}]}],
+                system_prompt=BASIC_DOCS_SYSTEM_PROMPT,
+                max_tokens=max_tokens,
+                temperature=0.5,
+                cache_prefix_messages=1,
+                cache_prefix_blocks=1,
+            )).get("content", [{"text": "No content received"}])[0]["text"],
+            warm_first=supports_prompt_caching(args.model)
+        )}]}
+    elif stream:
+        response_body = invoke_model_stream(bedrock_runtime, args.model, request_body, basic_docs_path, header=SIGNATURE)
+    else:
+        response_body = invoke_model_with_retry(bedrock_runtime, args.model, request_body)
     
     # Extract content based on model type
     if "anthropic" in args.model or "claude" in args.model:
@@ -307,10 +331,10 @@ try:
         # Format for other models like CodeLLama, DeepSeek, etc.
         basic_docs = response_body.get("generation", response_body.get("text", response_body.get("completion", "No content received")))
     
-    # Save basic documentation
-    basic_docs_path = os.path.join(OUTPUT_DIR, f"{repo_name}-docs.md")
-    with open(basic_docs_path, "w", encoding="utf-8") as file:
-        file.write(SIGNATURE + basic_docs)
+    # Save basic documentation (already written when streamed)
+    if not stream or parallel_sections:
+        with open(basic_docs_path, "w", encoding="utf-8") as file:
+            file.write(SIGNATURE + basic_docs)
     print(f"Basic documentation saved to {basic_docs_path}")
     
     # Generate extended documentation if requested
@@ -320,17 +344,18 @@ try:
         # Prepare extended documentation request
         if "anthropic" in args.model or "claude" in args.model:
             # Claude-specific format
-            extended_request_body = {
-                "anthropic_version": "bedrock-2023-05-31",
-                "max_tokens": max_tokens,
-                "system": BASIC_DOCS_SYSTEM_PROMPT,
-                "messages": [
+            extended_request_body = build_claude_request(
+                args.model,
+                [
                     {"role": "user", "content": input_prompt},
                     {"role": "assistant", "content": basic_docs},
                     {"role": "user", "content": REFINED_DOCS_FOLLOW_UP_PROMPT},
                 ],
-                "temperature": 0.5,
-            }
+                system_prompt=BASIC_DOCS_SYSTEM_PROMPT,
+                max_tokens=max_tokens,
+                temperature=0.5,
+                cache_prefix_messages=1,
+            )
         else:
             # Generic format
             extended_request_body = {
@@ -340,13 +365,30 @@ try:
             }
         
         # Call the model for extended documentation
-        extended_response = bedrock_runtime.invoke_model(
-            modelId=args.model,
-            body=json.dumps(extended_request_body)
-        )
-        
-        # Parse extended response
-        extended_response_body = json.loads(extended_response['body'].read().decode())
+        extended_docs_path = os.path.join(OUTPUT_DIR, f"{repo_name}-extended-docs.md")
+        if parallel_sections:
+            # One call per section against the same repository and basic documentation prefix,
+            # so the latency is that of the slowest section
+            extended_response_body = {"content": [{"text": generate_sections(
+                REFINED_DOCS_FOLLOW_UP_PROMPT,
+                lambda title, prompt: invoke_model_with_retry(bedrock_runtime, args.model, build_claude_request(
+                    args.model,
+                    [
+                        {"role": "user", "content": input_prompt},
+                        {"role": "assistant", "content": basic_docs},
+                        {"role": "user", "content": prompt},
+                    ],
+                    system_prompt=BASIC_DOCS_SYSTEM_PROMPT,
+                    max_tokens=max_tokens,
+                    temperature=0.5,
+                    cache_prefix_messages=1,
+                )).get("content", [{"text": "No content received"}])[0]["text"]
+            )}]}
+        elif stream:
+            extended_response_body = invoke_model_stream(bedrock_runtime, args.model, extended_request_body,
+                                                         extended_docs_path, header=SIGNATURE)
+        else:
+            extended_response_body = invoke_model_with_retry(bedrock_runtime, args.model, extended_request_body)
         
         # Extract content based on model type
         if "anthropic" in args.model or "claude" in args.model:
@@ -355,12 +397,19 @@ try:
             # Format for other models
             extended_docs = extended_response_body.get("generation", extended_response_body.get("text", extended_response_body.get("completion", "No content received")))
         
-        # Save extended documentation
-        extended_docs_path = os.path.join(OUTPUT_DIR, f"{repo_name}-extended-docs.md")
-        with open(extended_docs_path, "w", encoding="utf-8") as file:
-            file.write(SIGNATURE + extended_docs)
+        # Save extended documentation (already written when streamed)
+        if not stream or parallel_sections:
+            with open(extended_docs_path, "w", encoding="utf-8") as file:
+                file.write(SIGNATURE + extended_docs)
         print(f"Extended documentation saved to {extended_docs_path}")
 
+    response_cache = get_response_cache()
+    if response_cache is not None:
+        print(f"Response cache: {response_cache.hits} hits, {response_cache.misses} misses")
+    print(f"Token usage: {usage_tracker.summary()}")
+    print(f"Truncation: {truncation_tracker.summary()}")
+    print(f"Connections: {connection_stats.summary()}")
+
     print("Documentation generation complete!")
     
 except Exception as e:
@@ -12,6 +12,11 @@ import json
 import re
 import datetime
 
+from chunk_store_utils import CHUNK_STORE_EXTENSION, load_chunks, write_chunk_store
+from chunking_utils import report_packing_savings, split_content, split_into_chunks
+from extraction_utils import iter_extracted_files, list_candidate_files
+from token_utils import get_token_counter
+
 
 # In[2]:
 
@@ -229,89 +234,31 @@ output_file
 #repo_name = os.path.basename(REPO_DIR)
 #output_file = os.path.join(OUTPUT_DIR, f"{repo_name}_code2.txt")
 
+# Cleaned ASTs of Python files, reused by the "ast" chunking mode
+python_trees = {}
+
+# List the candidate files (excluded, hidden, test and .gitignored directories are pruned
+# during the walk, every path is checked by one precompiled PathFilter pattern) and
+# extract them in worker processes
+file_paths = list_candidate_files(
+    REPO_DIR,
+    code_extensions=code_extensions,
+    excluded_dirs=excluded_dirs,
+    utility_or_config_files=utility_or_config_files,
+    github_workflow_or_docs=github_workflow_or_docs
+)
+
 # Open the output file for writing
 with open(output_file, "w", encoding="utf-8") as outfile:
-    # Walk through the repository directory
-    for root, _, files in os.walk(REPO_DIR):
-        for file in files:
-            file_path = os.path.join(root, file)
-            
-            # Skip if file path ends with "/"
-            if file_path.endswith("/"):
-                continue
-            
-            # Check if file has a desired extension
-            if not any(file_path.endswith(ext) for ext in code_extensions):
-                continue
-            
-            # Check if file is in excluded directory
-            check_path = file_path.replace("\\", "/")
-            parts = check_path.split(os.sep)[1:]
-            if any(part.startswith(".") for part in parts):
-                continue
-            
-            if "test" in check_path.lower():
-                continue
-                
-            skip_file = False
-            for excluded_dir in excluded_dirs:
-                if f"/{excluded_dir}/" in check_path or check_path.startswith(f"{excluded_dir}/"):
-                    skip_file = True
-                    break
-                    
-            if skip_file:
-                continue
-                
-            for file_name in utility_or_config_files:
-                if file_name in check_path:
-                    skip_file = True
-                    break
-                    
-            if skip_file:
-                continue
-                
-            if not all(doc_file not in check_path for doc_file in github_workflow_or_docs):
-                continue
-            
-            # Try to read the file
+    for file_path, entry in iter_extracted_files(REPO_DIR, file_paths=file_paths):
+        outfile.write(entry)
+        
+        # Keep the AST of the cleaned Python source, keyed by its "# File:" header path
+        if file_path.endswith(".py"):
             try:
-                with open(file_path, "r", encoding="utf-8") as file_content:
-                    # Skip files with insufficient substantive content
-                    file_lines = file_content.readlines()
-                    lines = [
-                        line
-                        for line in file_lines
-                        if line.strip() and not line.strip().startswith("//")
-                    ]
-                    
-                    if len(lines) < 5:  # Skip files with less than 5 substantive lines
-                        continue
-                        
-                    # Write file path and content to output file
-                    outfile.write(f"# File: {file_path}\n")
-                    
-                    # For Python files, try to clean comments and docstrings
-                    if file_path.endswith(".py"):
-                        try:
-                            source = "".join(file_lines)
-                            tree = ast.parse(source)
-                            for node in ast.walk(tree):
-                                if isinstance(node, (ast.FunctionDef, ast.ClassDef, ast.AsyncFunctionDef)) and ast.get_docstring(node):
-                                    node.body = node.body[1:]  # Remove docstring
-                                elif isinstance(node, ast.Expr) and isinstance(node.value, ast.Str):
-                                    node.value.s = ""  # Remove comments
-                            cleaned_source = ast.unparse(tree)
-                            outfile.write(cleaned_source)
-                        except:
-                            # If ast parsing fails, write the original source
-                            outfile.writelines(file_lines)
-                    else:
-                        # For non-Python files, write original content
-                        outfile.writelines(file_lines)
-                        
-                    outfile.write("\n\n")
-            except Exception as e:
-                print(f"Error reading file {file_path}: {e}")
+                python_trees[file_path] = ast.parse(entry.split("\n", 1)[1])
+            except SyntaxError:
+                pass
 
 print(f"Code extracted to {output_file}")
 
@@ -404,29 +351,8 @@ def chunk_repository_content(content, chunk_size=1500, overlap=50):
     Returns:
         list: List of content chunks
     """
-    chunks = []
-    lines = content.split('\n')
-    current_chunk = []
-    current_length = 0
-    
-    # Simple token estimation - approximately 4 chars per token
-    for line in lines:
-        line_length = len(line) // 4
-        
-        # If adding this line would exceed chunk size, save current chunk
-        if current_length + line_length > chunk_size:
-            chunks.append('\n'.join(current_chunk))
-            # Keep overlap lines for the next chunk
-            current_chunk = current_chunk[-overlap:]
-            current_length = sum(len(l) // 4 for l in current_chunk)
-        
-        # Add line to current chunk
-        current_chunk.append(line)
-        current_length += line_length
-    
-    # Add the final chunk if not empty
-    if current_chunk:
-        chunks.append('\n'.join(current_chunk))
+    # Single pass over running line token counts (approximately 4 chars per token)
+    chunks = split_into_chunks(content, chunk_size, overlap)
     
     return chunks
 
@@ -452,64 +378,51 @@ len(chunks_1)
 # In[52]:
 
 
-def chunk_repository_content(content, chunk_size=1500, overlap=50, output_dir=None, repo_name=None):
+def chunk_repository_content(content, chunk_size=1500, overlap=50, output_dir=None, repo_name=None,
+                             mode="lines", trees=None, count_tokens=None):
     """
     Divide repository content into overlapping chunks and optionally save to disk.
     
     Args:
         content (str): The full repository content
-        chunk_size (int): Target chunk size in tokens (estimated)
+        chunk_size (int): Target chunk size in tokens
         overlap (int): Number of lines to overlap between chunks
         output_dir (str): Directory to save chunks (if None, won't save)
         repo_name (str): Repository name for filename
+        mode (str): "lines" for overlapping line windows, "ast" to cut on file, class
+            and function boundaries with the "# File:" header repeated in each chunk,
+            "pack" to bin-pack whole files into as few chunks as possible
+        trees (dict): ASTs built during extraction, keyed by file path ("ast" and "pack" modes)
+        count_tokens (callable): Token counter chunks are sized with
+            (default: the default counter of token_utils)
         
     Returns:
         list: List of content chunks
     """
-    chunks = []
-    lines = content.split('\n')
-    current_chunk = []
-    current_length = 0
-    
-    # Simple token estimation - approximately 4 chars per token
-    for line in lines:
-        line_length = len(line) // 4
-        
-        # If adding this line would exceed chunk size, save current chunk
-        if current_length + line_length > chunk_size:
-            chunks.append('\n'.join(current_chunk))
-            # Keep overlap lines for the next chunk
-            current_chunk = current_chunk[-overlap:]
-            current_length = sum(len(l) // 4 for l in current_chunk)
-        
-        # Add line to current chunk
-        current_chunk.append(line)
-        current_length += line_length
-    
-    # Add the final chunk if not empty
-    if current_chunk:
-        chunks.append('\n'.join(current_chunk))
+    # Single pass over running line token counts, each file counted once
+    count_tokens = count_tokens or get_token_counter()
+    chunks = split_content(content, chunk_size, overlap, mode=mode, trees=trees, count_tokens=count_tokens)
+    if mode == "pack":
+        report_packing_savings(content, chunks, chunk_size, overlap, count_tokens)
     
     # Save chunks to file if output directory is provided
     # if output_dir and repo_name:
     if output_dir:    
         timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        chunks_file = os.path.join(output_dir, f"chunks_{timestamp}.json")
-        
-        # Create output directory if it doesn't exist
-        os.makedirs(output_dir, exist_ok=True)
+        chunks_file = os.path.join(output_dir, f"chunks_{timestamp}{CHUNK_STORE_EXTENSION}")
         
-        # Save chunks to JSON file
-        with open(chunks_file, 'w', encoding='utf-8') as f:
-            json.dump({
-                'timestamp': timestamp,
-                'chunk_size': chunk_size,
-                'overlap': overlap,
-                'total_chunks': len(chunks),
-                'chunks': chunks
-            }, f, indent=2)
+        # Save chunks as corpus ranges (overlaps are not copied) with an offset index
+        stats = write_chunk_store(chunks_file, chunks, corpus=content, metadata={
+            'timestamp': timestamp,
+            'chunk_size': chunk_size,
+            'overlap': overlap,
+            'chunking': mode,
+            'token_counter': getattr(count_tokens, 'name', 'estimate'),
+            'total_chunks': len(chunks)
+        })
         
-        print(f"Saved {len(chunks)} chunks to {chunks_file}")
+        print(f"Saved {len(chunks)} chunks to {chunks_file} ({stats['references']} as corpus ranges, "
+              f"{stats['file_bytes'] / 1024:.0f} KB for {stats['chunk_bytes'] / 1024:.0f} KB of chunk text)")
     
     return chunks
 
@@ -524,12 +437,14 @@ OUTPUT_DIR
 # In[53]:
 
 
-# Create chunks and save them to disk
+# Create chunks on definition boundaries, reusing the ASTs parsed during extraction, and save them to disk
 chunks_1 = chunk_repository_content(
     content=repo_content,
     chunk_size=1500,
     overlap=50,
-    output_dir=OUTPUT_DIR
+    output_dir=OUTPUT_DIR,
+    mode="ast",
+    trees=python_trees
     #,
     #repo_name=repo_name
 )
@@ -543,17 +458,14 @@ def load_chunks_from_file(chunks_file):
     Load repository content chunks from a file.
     
     Args:
-        chunks_file (str): Path to the JSON file containing chunks
+        chunks_file (str): Path to the chunk store (or legacy JSON file) containing chunks
         
     Returns:
-        list: List of content chunks
+        Sequence: Content chunks, decoded lazily on access for chunk stores
         dict: Metadata about the chunks
     """
-    with open(chunks_file, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-    
-    chunks = data.pop('chunks')
-    metadata = data  # Contains timestamp, chunk_size, overlap, etc.
+    # Contains timestamp, chunk_size, overlap, etc.
+    chunks, metadata = load_chunks(chunks_file)
     
     print(f"Loaded {len(chunks)} chunks from {chunks_file}")
     print(f"Chunks metadata: {metadata}")
@@ -572,24 +484,59 @@ chunks_2, metadata = load_chunks_from_file('/home/gpt/Documents/dev_env/fannie3/
 
 import os
 import json
-import boto3
+import argparse
 import datetime
-from typing import List, Dict, Any, Tuple
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import List, Dict, Any, Callable, Iterable, Iterator, Optional, Sequence, Tuple
+
+from bedrock_utils import build_claude_request, get_response_cache, invoke_model_stream, invoke_model_with_retry
+from bedrock_utils import connection_stats, get_bedrock_client, get_latency_history, get_rate_limiter, usage_tracker
+from bedrock_utils import DEFAULT_MAX_CONTINUATIONS, set_max_continuations, truncation_tracker
+from bedrock_utils import ResponseCache, supports_prompt_caching
+from chunk_store_utils import CHUNK_STORE_EXTENSION, load_chunks
+from checkpoint_utils import ChunkCheckpoint, checkpoint_path_for
+from consolidation_utils import DEFAULT_CONSOLIDATION_BUDGET, merkle_reduce_fragments, tree_reduce_fragments
+from chunking_utils import iter_record_chunks
+from extraction_utils import iter_extracted_files
+from planning_utils import TokenHistogram, format_duration, format_plan, plan_run
+from routing_utils import DEFAULT_FAST_MODEL_ID, ModelRouter
+from section_utils import generate_sections, section_prompts
+from token_utils import DEFAULT_TOKEN_COUNTER, TOKEN_COUNTERS
 
 def generate_documentation_from_chunks(
     chunks_file: str,
     output_dir: str,
     repo_name: str,
-    bedrock_region: str = "us-east-1"
+    bedrock_region: str = "us-east-1",
+    max_workers: int = 1,
+    use_cache: bool = True,
+    consolidation_mode: str = "single",
+    stream: bool = False,
+    resume: bool = False,
+    parallel_sections: bool = False,
+    fast_model_id: Optional[str] = None,
+    model_id: str = "anthropic.claude-3-sonnet-20240229-v1:0"
 ) -> Tuple[str, str]:
     """
     Generate technical documentation from repository chunks using Claude Sonnet.
     
     Args:
-        chunks_file (str): Path to the JSON file containing repository chunks
+        chunks_file (str): Path to the chunk store (or legacy JSON file) containing repository chunks
         output_dir (str): Directory to save generated documentation
         repo_name (str): Name of the repository
         bedrock_region (str): AWS region for Bedrock
+        max_workers (int): Number of chunks processed concurrently
+        use_cache (bool): Reuse model responses cached in output_dir by earlier runs
+        consolidation_mode (str): "single" or "tree" (hierarchical merging for large repositories)
+        stream (bool): Stream extended documentation into its file as it is generated
+        resume (bool): Skip chunks already completed by an interrupted run on the same chunks file
+        parallel_sections (bool): Generate the sections of the extended documentation concurrently
+        fast_model_id (str): Send simple chunks to this model instead of model_id (None routes nothing)
+        model_id (str): Model that documents the chunks; the system prompt and the basic
+            documentation are only cached on models that support prompt caching
         
     Returns:
         Tuple[str, str]: Paths to basic and extended documentation files
@@ -597,11 +544,237 @@ def generate_documentation_from_chunks(
     # Load chunks from file
     chunks, metadata = load_chunks_from_file(chunks_file)
     
-    # Initialize Bedrock client
-    bedrock_runtime = boto3.client(
-        service_name="bedrock-runtime",
-        region_name=bedrock_region
+    try:
+        return generate_documentation(
+            chunks, checkpoint_path_for(chunks_file), output_dir, repo_name,
+            bedrock_region, max_workers, use_cache, consolidation_mode, stream, resume, parallel_sections, fast_model_id,
+            model_id
+        )
+    finally:
+        # Unmap the chunk store (legacy JSON files load as a plain list)
+        if hasattr(chunks, "close"):
+            chunks.close()
+
+def generate_documentation_from_repository(
+    repo_dir: str,
+    output_dir: str,
+    repo_name: str,
+    chunk_size: int = 1500,
+    extraction_workers: Optional[int] = None,
+    bedrock_region: str = "us-east-1",
+    max_workers: int = 1,
+    use_cache: bool = True,
+    consolidation_mode: str = "single",
+    stream: bool = False,
+    resume: bool = False,
+    count_tokens: Optional[Callable[[str], int]] = None,
+    parallel_sections: bool = False,
+    fast_model_id: Optional[str] = None,
+    model_id: str = "anthropic.claude-3-sonnet-20240229-v1:0"
+) -> Tuple[str, str]:
+    """
+    Generate technical documentation straight from a repository, without a corpus or chunks file.
+    
+    Files are extracted, cut into chunks on definition boundaries and sent to
+    Claude as a stream, so memory use is bounded by the chunk size and the
+    number of chunks in flight rather than by the size of the repository.
+    
+    Args:
+        repo_dir (str): Repository root
+        output_dir (str): Directory to save generated documentation
+        repo_name (str): Name of the repository
+        chunk_size (int): Target chunk size in tokens
+        extraction_workers (int): Worker processes for extraction (default: one per CPU)
+        bedrock_region (str): AWS region for Bedrock
+        max_workers (int): Number of chunks processed concurrently
+        use_cache (bool): Reuse model responses and extracted files cached in output_dir by earlier runs
+        consolidation_mode (str): "single" or "tree" (hierarchical merging for large repositories)
+        stream (bool): Stream extended documentation into its file as it is generated
+        resume (bool): Skip chunks already completed by an interrupted run on the same repository
+        count_tokens (callable): Token counter chunks are sized with (default: the default
+            counter of token_utils, with counts cached in output_dir when use_cache is set)
+        parallel_sections (bool): Generate the sections of the extended documentation concurrently
+        fast_model_id (str): Send simple chunks to this model instead of model_id (None routes nothing)
+        model_id (str): Model that documents the chunks; the system prompt and the basic
+            documentation are only cached on models that support prompt caching
+        
+    Returns:
+        Tuple[str, str]: Paths to basic and extended documentation files
+    """
+    # The extraction pool is forked here, before generate_documentation starts the chunk threads
+    chunks = iter_repository_chunks(repo_dir, output_dir, chunk_size, extraction_workers, use_cache, count_tokens)
+    
+    return generate_documentation(
+        chunks, os.path.join(output_dir, f"{repo_name}_stream.progress.jsonl"), output_dir, repo_name,
+        bedrock_region, max_workers, use_cache, consolidation_mode, stream, resume, parallel_sections, fast_model_id,
+        model_id
+    )
+
+def iter_repository_chunks(
+    repo_dir: str,
+    output_dir: str,
+    chunk_size: int = 1500,
+    extraction_workers: Optional[int] = None,
+    use_cache: bool = True,
+    count_tokens: Optional[Callable[[str], int]] = None,
+    histogram: Optional[TokenHistogram] = None
+) -> Iterator[str]:
+    """
+    Extract a repository and yield its chunks as they are cut.
+    
+    Args:
+        repo_dir (str): Repository root
+        output_dir (str): Directory holding the extraction manifest and token count cache
+        chunk_size (int): Target chunk size in tokens
+        extraction_workers (int): Worker processes for extraction (default: one per CPU)
+        use_cache (bool): Reuse extracted files and token counts cached in output_dir
+        count_tokens (callable): Token counter chunks are sized with (default: the default
+            counter of token_utils, with counts cached in output_dir when use_cache is set)
+        histogram (TokenHistogram): Collects the input tokens of each directory as files pass (optional)
+        
+    Yields:
+        str: Content chunks
+    """
+    if count_tokens is None:
+        count_tokens = get_token_counter(
+            DEFAULT_TOKEN_COUNTER,
+            cache_path=os.path.join(output_dir, "token_counts.sqlite") if use_cache else None
+        )
+    records = iter_extracted_files(
+        repo_dir,
+        workers=extraction_workers,
+        relative_paths=True,
+        manifest_path=os.path.join(output_dir, "extraction_manifest.sqlite") if use_cache else None
+    )
+    if histogram is not None:
+        records = histogram.observe(records, repo_dir)
+    return iter_record_chunks(records, chunk_size, count_tokens=count_tokens)
+
+def plan_documentation(
+    chunks: Iterable[str],
+    output_dir: str,
+    max_workers: int = 1,
+    use_cache: bool = True,
+    consolidation_mode: str = "single",
+    count_tokens: Optional[Callable[[str], int]] = None,
+    histogram: Optional[TokenHistogram] = None,
+    model_id: str = "anthropic.claude-3-sonnet-20240229-v1:0",
+    max_tokens: int = 4096,
+    parallel_sections: bool = False,
+    fast_model_id: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Print the calls, tokens and time a documentation run over these chunks would take.
+    
+    No model is called. The ETA uses the latencies recorded in output_dir by
+    earlier runs, at max_workers concurrent calls and the shared rate limits.
+    
+    Args:
+        chunks (Iterable[str]): Repository content chunks
+        output_dir (str): Directory holding the latency history
+        max_workers (int): Number of chunks processed concurrently
+        use_cache (bool): Whether the run would use the consolidation cache (tree mode)
+        consolidation_mode (str): "single" or "tree"
+        count_tokens (callable): Token counter (default: the default counter of token_utils)
+        histogram (TokenHistogram): Per-directory input tokens to include in the report
+        model_id (str): Model the run calls
+        max_tokens (int): Maximum tokens for each model response
+        parallel_sections (bool): Whether the extended documentation sections are generated concurrently
+        fast_model_id (str): Model simple chunks would be routed to (None routes nothing); the
+            ETA still assumes model_id for every chunk, so it is an upper bound
+        
+    Returns:
+        dict: Plan from planning_utils.plan_run()
+    """
+    count_tokens = count_tokens or get_token_counter()
+    router = ModelRouter(model_id, fast_model_id, count_tokens, verbose=False) if fast_model_id else None
+    chunk_tokens = []
+    for chunk in chunks:
+        chunk_tokens.append(count_tokens(chunk))
+        if router is not None:
+            router.route(chunk)
+    if chunk_tokens:
+        print(f"{len(chunk_tokens)} chunks, {sum(chunk_tokens) // len(chunk_tokens)} tokens on average, "
+              f"largest {max(chunk_tokens)}")
+    if router is not None:
+        print(f"Model routing: {router.summary()}")
+    
+    # Tree consolidation with a cache runs the incremental (Merkle) reduction
+    if consolidation_mode == "tree" and use_cache:
+        consolidation_mode = "merkle"
+    extended_prompts = (section_prompts(REFINED_DOCS_FOLLOW_UP_PROMPT) if parallel_sections
+                        else [("", REFINED_DOCS_FOLLOW_UP_PROMPT)])
+    extended_tokens = [count_tokens(prompt) for _, prompt in extended_prompts]
+    plan = plan_run(
+        chunk_tokens,
+        model_id,
+        max_tokens=max_tokens,
+        system_tokens=count_tokens(BASIC_DOCS_SYSTEM_PROMPT),
+        max_workers=max_workers,
+        consolidation_mode=consolidation_mode,
+        extended_input_tokens=sum(extended_tokens) // len(extended_tokens),
+        extended_calls=len(extended_tokens),
+        history=get_latency_history(os.path.join(output_dir, "llm_call_history.sqlite")),
+        limiter=get_rate_limiter(),
+        consolidation_budget=DEFAULT_CONSOLIDATION_BUDGET
     )
+    print(format_plan(plan, histogram))
+    return plan
+
+def generate_documentation(
+    chunks: Iterable[str],
+    checkpoint_path: str,
+    output_dir: str,
+    repo_name: str,
+    bedrock_region: str = "us-east-1",
+    max_workers: int = 1,
+    use_cache: bool = True,
+    consolidation_mode: str = "single",
+    stream: bool = False,
+    resume: bool = False,
+    parallel_sections: bool = False,
+    fast_model_id: Optional[str] = None,
+    model_id: str = "anthropic.claude-3-sonnet-20240229-v1:0"
+) -> Tuple[str, str]:
+    """
+    Generate basic and extended documentation from repository chunks.
+    
+    Args:
+        chunks (Iterable[str]): Repository content chunks; a generator is consumed lazily
+        checkpoint_path (str): File recording completed chunk results
+        output_dir (str): Directory to save generated documentation
+        repo_name (str): Name of the repository
+        bedrock_region (str): AWS region for Bedrock
+        max_workers (int): Number of chunks processed concurrently
+        use_cache (bool): Reuse model responses cached in output_dir by earlier runs
+        consolidation_mode (str): "single" or "tree" (hierarchical merging for large repositories)
+        stream (bool): Stream extended documentation into its file as it is generated
+        resume (bool): Skip chunks already completed by an interrupted run
+        parallel_sections (bool): Generate the sections of the extended documentation concurrently
+        fast_model_id (str): Send simple chunks to this model instead of model_id (None routes nothing);
+            consolidation and the extended documentation always use model_id
+        model_id (str): Model that documents the chunks; the system prompt and the basic
+            documentation are only cached on models that support prompt caching
+            (supports_prompt_caching), which Claude 3 Sonnet does not
+        
+    Returns:
+        Tuple[str, str]: Paths to basic and extended documentation files
+    """
+    # Chunk results are persisted as they arrive so an interrupted run can be resumed
+    checkpoint = ChunkCheckpoint(checkpoint_path, resume=resume)
+    
+    # Unchanged chunks, consolidation input and extended prompts are served from the cache
+    if use_cache:
+        get_response_cache(os.path.join(output_dir, "llm_response_cache.sqlite"))
+    
+    # Record call latencies so later runs can be planned
+    latency_history = get_latency_history(os.path.join(output_dir, "llm_call_history.sqlite"))
+    
+    # Shared client with a connection pool sized for the concurrent chunk calls
+    bedrock_runtime = get_bedrock_client(bedrock_region, max_workers)
+    
+    # Simple chunks (configuration, documentation, short straight-line code) go to the fast model
+    router = ModelRouter(model_id, fast_model_id) if fast_model_id else None
     
     # Define system prompts
     BASIC_DOCS_SYSTEM_PROMPT = """Your job is to act as the expert software engineer and provide detailed technical documentation broken into readable formats. 
@@ -680,7 +853,12 @@ This documentation was automatically generated using Claude Sonnet.
         chunks=chunks,
         system_prompt=BASIC_DOCS_SYSTEM_PROMPT,
         bedrock_client=bedrock_runtime,
-        model_id="anthropic.claude-3-sonnet-20240229-v1:0"
+        model_id=model_id,
+        max_workers=max_workers,
+        consolidation_mode=consolidation_mode,
+        consolidation_cache=os.path.join(output_dir, "consolidation_merkle.sqlite") if use_cache else None,
+        checkpoint=checkpoint,
+        router=router
     )
     
     # Save basic documentation
@@ -690,7 +868,21 @@ This documentation was automatically generated using Claude Sonnet.
         file.write(SIGNATURE + basic_docs)
     print(f"Basic documentation saved to {basic_docs_path}")
     
-    # Ask if user wants extended documentation
+    # Ask if user wants extended documentation, with what the call would take
+    count_tokens = get_token_counter()
+    basic_tokens = count_tokens(basic_docs)
+    extended_prompts = (section_prompts(REFINED_DOCS_FOLLOW_UP_PROMPT) if parallel_sections
+                        else [("", REFINED_DOCS_FOLLOW_UP_PROMPT)])
+    extended_plan = plan_run(
+        [basic_tokens + count_tokens(prompt) for _, prompt in extended_prompts],
+        model_id,
+        max_workers=len(extended_prompts),
+        consolidation_mode=None,
+        history=latency_history,
+        limiter=get_rate_limiter()
+    )
+    print(f"Extended documentation: {extended_plan['calls']} call(s), {extended_plan['input_tokens']} input tokens, "
+          f"about {extended_plan['output_tokens']} output tokens, about {format_duration(extended_plan['seconds'])}")
     proceed = input("Do you wish to generate extended documentation? (Y/N): ")
     extended_docs_path = None
     
@@ -698,104 +890,142 @@ This documentation was automatically generated using Claude Sonnet.
         print("Generating extended documentation...")
         
         # Generate extended documentation using basic docs as context
+        extended_docs_path = os.path.join(output_dir, f"{repo_name}-extended-docs-{timestamp}.md")
         extended_docs = generate_extended_documentation(
             basic_docs=basic_docs,
             follow_up_prompt=REFINED_DOCS_FOLLOW_UP_PROMPT,
             bedrock_client=bedrock_runtime,
-            model_id="anthropic.claude-3-sonnet-20240229-v1:0"
+            model_id=model_id,
+            stream_path=extended_docs_path if stream else None,
+            header=SIGNATURE,
+            parallel_sections=parallel_sections
         )
         
-        # Save extended documentation
-        extended_docs_path = os.path.join(output_dir, f"{repo_name}-extended-docs-{timestamp}.md")
-        with open(extended_docs_path, "w", encoding="utf-8") as file:
-            file.write(SIGNATURE + extended_docs)
+        # Save extended documentation (already written when streamed)
+        if not (stream and os.path.exists(extended_docs_path)):
+            with open(extended_docs_path, "w", encoding="utf-8") as file:
+                file.write(SIGNATURE + extended_docs)
         print(f"Extended documentation saved to {extended_docs_path}")
     
+    print(f"Token usage: {usage_tracker.summary()}")
+    print(f"Truncation: {truncation_tracker.summary()}")
+    print(f"Connections: {connection_stats.summary()}")
+    if router is not None:
+        print(f"Model routing: {router.summary()}")
     return basic_docs_path, extended_docs_path
 
-def load_chunks_from_file(chunks_file: str) -> Tuple[List[str], Dict[str, Any]]:
+def load_chunks_from_file(chunks_file: str) -> Tuple[Sequence[str], Dict[str, Any]]:
     """
     Load repository content chunks from a file.
     
     Args:
-        chunks_file (str): Path to the JSON file containing chunks
+        chunks_file (str): Path to the chunk store (or legacy JSON file) containing chunks
         
     Returns:
-        Tuple[List[str], Dict[str, Any]]: List of content chunks and metadata
+        Tuple[Sequence[str], Dict[str, Any]]: Content chunks (decoded lazily on
+            access for chunk stores) and metadata; a chunk store keeps its file
+            mapped until the caller closes it
     """
-    with open(chunks_file, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-    
-    chunks = data.pop('chunks')
-    metadata = data  # Contains timestamp, chunk_size, overlap, etc.
+    # Contains timestamp, chunk_size, overlap, etc.
+    chunks, metadata = load_chunks(chunks_file)
     
     print(f"Loaded {len(chunks)} chunks from {chunks_file}")
     print(f"Chunks metadata: {metadata}")
     
     return chunks, metadata
 
-def process_chunks_with_claude(
-    chunks: List[str],
+def process_single_chunk(
+    chunk: str,
+    index: int,
+    total_chunks: Optional[int],
     system_prompt: str,
     bedrock_client: Any,
     model_id: str,
     max_tokens: int = 4096,
-    temperature: float = 0.5
+    temperature: float = 0.5,
+    checkpoint: Optional[ChunkCheckpoint] = None,
+    router: Optional[ModelRouter] = None
 ) -> str:
     """
-    Process repository chunks with Claude to generate documentation.
+    Generate documentation for a single repository chunk with Claude.
     
     Args:
-        chunks (List[str]): List of repository content chunks
+        chunk (str): Repository content chunk
+        index (int): Zero-based position of the chunk
+        total_chunks (int): Total number of chunks, used for progress output (None if not known yet)
         system_prompt (str): System prompt for Claude
         bedrock_client: Initialized AWS Bedrock client
         model_id (str): Model ID to use
         max_tokens (int): Maximum tokens for model response
         temperature (float): Temperature for generation
+        checkpoint (ChunkCheckpoint): Store for completed chunk results (optional)
+        router (ModelRouter): Picks the model for the chunk instead of model_id (optional)
         
     Returns:
-        str: Combined documentation from all chunks
+        str: Documentation for the chunk, or an error message if the call failed
     """
-    all_responses = []
-    total_chunks = len(chunks)
+    progress = f"{index+1}/{total_chunks}" if total_chunks else f"{index+1}"
     
-    for i, chunk in enumerate(chunks):
-        print(f"Processing chunk {i+1}/{total_chunks}...")
+    if checkpoint is not None:
+        stored_docs = checkpoint.get(index, chunk)
+        if stored_docs is not None:
+            print(f"Chunk {progress} already completed, skipping")
+            return stored_docs
+    
+    print(f"Processing chunk {progress}...")
+    if router is not None:
+        model_id = router.route(chunk, f"Chunk {progress}")
+    
+    # Prepare request body for Claude
+    # The system prompt is identical for every chunk and is sent as a cacheable prefix
+    request_body = build_claude_request(
+        model_id,
+        [{"role": "user", "content": f"Given this code chunk: \n\n{chunk}\n\nGenerate documentation."}],
+        system_prompt=system_prompt,
+        max_tokens=max_tokens,
+        temperature=temperature,
+    )
+    
+    try:
+        # Call Claude via Bedrock
+        start_time = time.monotonic()
+        response_body = invoke_model_with_retry(bedrock_client, model_id, request_body)
+        if router is not None:
+            router.record_latency(model_id, time.monotonic() - start_time)
+        chunk_docs = response_body.get("content", [{"text": "No content received"}])[0]["text"]
         
-        # Prepare request body for Claude
-        request_body = {
-            "anthropic_version": "bedrock-2023-05-31",
-            "max_tokens": max_tokens,
-            "system": system_prompt,
-            "messages": [
-                {"role": "user", "content": f"Given this code chunk: \n\n{chunk}\n\nGenerate documentation."}
-            ],
-            "temperature": temperature,
-        }
+        # Failed chunks are not recorded, so a resumed run retries them
+        if checkpoint is not None:
+            checkpoint.record(index, chunk, chunk_docs)
         
-        try:
-            # Call Claude via Bedrock
-            response = bedrock_client.invoke_model(
-                modelId=model_id,
-                body=json.dumps(request_body)
-            )
-            
-            # Parse response
-            response_body = json.loads(response['body'].read().decode())
-            chunk_docs = response_body.get("content", [{"text": "No content received"}])[0]["text"]
-            all_responses.append(chunk_docs)
-            
-            print(f"Successfully processed chunk {i+1}")
-            
-        except Exception as e:
-            print(f"Error processing chunk {i+1}: {e}")
-            all_responses.append(f"Error processing chunk {i+1}: {str(e)}")
-    
-    # Combine responses and generate final documentation
-    combined_responses = "\n\n".join(all_responses)
+        print(f"Successfully processed chunk {index+1}")
+        return chunk_docs
+        
+    except Exception as e:
+        print(f"Error processing chunk {index+1}: {e}")
+        return f"Error processing chunk {index+1}: {str(e)}"
+
+def consolidate_fragments(
+    fragments: List[str],
+    system_prompt: str,
+    bedrock_client: Any,
+    model_id: str,
+    max_tokens: int = 4096
+) -> str:
+    """
+    Consolidate documentation fragments into a single document with Claude.
     
-    # Create a consolidated documentation using Claude
-    print("Generating consolidated documentation...")
+    Args:
+        fragments (List[str]): Documentation fragments in chunk order
+        system_prompt (str): System prompt for Claude
+        bedrock_client: Initialized AWS Bedrock client
+        model_id (str): Model ID to use
+        max_tokens (int): Maximum tokens for model response
+        
+    Returns:
+        str: Consolidated documentation
+    """
+    combined_responses = "\n\n".join(fragments)
     
     consolidation_prompt = f"""Below are documentation fragments generated from different parts of a code repository. 
 Please consolidate these into a single, coherent documentation that eliminates redundancy and organizes the information logically:
@@ -805,28 +1035,127 @@ Please consolidate these into a single, coherent documentation that eliminates r
 Create a well-structured technical documentation that covers all the key aspects of the codebase.
 """
     
-    consolidation_request = {
-        "anthropic_version": "bedrock-2023-05-31",
-        "max_tokens": max_tokens,
-        "system": system_prompt,
-        "messages": [
-            {"role": "user", "content": consolidation_prompt}
-        ],
-        "temperature": 0.3,  # Lower temperature for more consistent results
-    }
+    consolidation_request = build_claude_request(
+        model_id,
+        [{"role": "user", "content": consolidation_prompt}],
+        system_prompt=system_prompt,
+        max_tokens=max_tokens,
+        temperature=0.3,  # Lower temperature for more consistent results
+    )
+    
+    # Call Claude for consolidation
+    consolidation_body = invoke_model_with_retry(bedrock_client, model_id, consolidation_request)
+    return consolidation_body.get("content", [{"text": "No content received"}])[0]["text"]
+
+def map_in_order(
+    executor: ThreadPoolExecutor,
+    fn: Callable[[Any], Any],
+    items: Iterable[Any],
+    max_in_flight: int
+) -> Iterator[Any]:
+    """
+    Like executor.map, but pulls items from the iterable only as results are taken.
+    
+    executor.map submits every item up front, which would read a whole chunk
+    generator into memory; here at most max_in_flight items are pending at once.
+    
+    Args:
+        executor (ThreadPoolExecutor): Executor running fn
+        fn (callable): Function applied to each item
+        items (iterable): Items, consumed lazily
+        max_in_flight (int): Maximum number of submitted items without a taken result
+        
+    Yields:
+        Results of fn in item order
+    """
+    items = iter(items)
+    pending = deque(executor.submit(fn, item) for item in islice(items, max(1, max_in_flight)))
+    while pending:
+        result = pending.popleft().result()
+        for item in islice(items, 1):
+            pending.append(executor.submit(fn, item))
+        yield result
+
+def process_chunks_with_claude(
+    chunks: Iterable[str],
+    system_prompt: str,
+    bedrock_client: Any,
+    model_id: str,
+    max_tokens: int = 4096,
+    temperature: float = 0.5,
+    max_workers: int = 1,
+    consolidation_mode: str = "single",
+    consolidation_budget: int = DEFAULT_CONSOLIDATION_BUDGET,
+    consolidation_cache: Optional[str] = None,
+    checkpoint: Optional[ChunkCheckpoint] = None,
+    router: Optional[ModelRouter] = None
+) -> str:
+    """
+    Process repository chunks with Claude to generate documentation.
+    
+    Args:
+        chunks (Iterable[str]): Repository content chunks; a generator is consumed
+            lazily, a few chunks ahead of the running requests
+        system_prompt (str): System prompt for Claude
+        bedrock_client: Initialized AWS Bedrock client
+        model_id (str): Model ID to use
+        max_tokens (int): Maximum tokens for model response
+        temperature (float): Temperature for generation
+        max_workers (int): Number of chunks processed concurrently (1 keeps the sequential behaviour)
+        consolidation_mode (str): "single" for one consolidation prompt, "tree" for hierarchical merging
+        consolidation_budget (int): Maximum estimated input tokens per merge call in "tree" mode
+        consolidation_cache (str): SQLite file storing merged nodes by Merkle hash; makes
+            "tree" mode incremental so re-runs only re-merge what changed
+        checkpoint (ChunkCheckpoint): Persists each chunk result as it returns and
+            supplies the results of chunks completed by an earlier, interrupted run
+        router (ModelRouter): Picks the model for each chunk (optional); fragments are
+            consolidated with model_id
+        
+    Returns:
+        str: Combined documentation from all chunks
+    """
+    total_chunks = len(chunks) if isinstance(chunks, Sequence) else None
+    
+    # Results come back in chunk order regardless of which request finishes first
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        all_responses = list(map_in_order(
+            executor,
+            lambda item: process_single_chunk(
+                item[1], item[0], total_chunks, system_prompt,
+                bedrock_client, model_id, max_tokens, temperature, checkpoint, router
+            ),
+            enumerate(chunks),
+            max_in_flight=2 * max(1, max_workers)
+        ))
+    
+    # Combine responses and generate final documentation
+    combined_responses = "\n\n".join(all_responses)
+    
+    # Create a consolidated documentation using Claude
+    print("Generating consolidated documentation...")
     
     try:
-        # Call Claude for consolidation
-        consolidation_response = bedrock_client.invoke_model(
-            modelId=model_id,
-            body=json.dumps(consolidation_request)
-        )
+        if consolidation_mode == "tree" and consolidation_cache:
+            # Reuse every merged subtree whose input fragments are unchanged
+            return merkle_reduce_fragments(
+                all_responses,
+                lambda group: consolidate_fragments(group, system_prompt, bedrock_client, model_id, max_tokens),
+                ResponseCache(consolidation_cache),
+                namespace=f"{model_id}\n{max_tokens}\n{system_prompt}",
+                token_budget=consolidation_budget,
+                max_workers=max_workers
+            )
         
-        # Parse response
-        consolidation_body = json.loads(consolidation_response['body'].read().decode())
-        final_docs = consolidation_body.get("content", [{"text": "No content received"}])[0]["text"]
+        if consolidation_mode == "tree":
+            # Merge fragments in token-budgeted groups, level by level
+            return tree_reduce_fragments(
+                all_responses,
+                lambda group: consolidate_fragments(group, system_prompt, bedrock_client, model_id, max_tokens),
+                token_budget=consolidation_budget,
+                max_workers=max_workers
+            )
         
-        return final_docs
+        return consolidate_fragments(all_responses, system_prompt, bedrock_client, model_id, max_tokens)
         
     except Exception as e:
         print(f"Error consolidating documentation: {e}")
@@ -839,7 +1168,10 @@ def generate_extended_documentation(
     bedrock_client: Any,
     model_id: str,
     max_tokens: int = 4096,
-    temperature: float = 0.5
+    temperature: float = 0.5,
+    stream_path: Optional[str] = None,
+    header: str = "",
+    parallel_sections: bool = False
 ) -> str:
     """
     Generate extended documentation based on basic documentation.
@@ -849,33 +1181,49 @@ def generate_extended_documentation(
         follow_up_prompt (str): Follow-up prompt for extended documentation
         bedrock_client: Initialized AWS Bedrock client
         model_id (str): Model ID to use
-        max_tokens (int): Maximum tokens for model response
+        max_tokens (int): Maximum tokens for model response (per section with parallel_sections)
         temperature (float): Temperature for generation
+        stream_path (str): If set, stream the documentation into this file as it is generated
+        header (str): Text written above the streamed documentation (e.g. the signature)
+        parallel_sections (bool): Request each section of the follow-up prompt separately
+            and concurrently, then assemble them in prompt order (not streamed)
         
     Returns:
         str: Extended documentation
     """
     # Prepare request body for Claude
-    request_body = {
-        "anthropic_version": "bedrock-2023-05-31",
-        "max_tokens": max_tokens,
-        "messages": [
-            {"role": "user", "content": "Here is the basic documentation of a code repository:"},
-            {"role": "assistant", "content": basic_docs},
-            {"role": "user", "content": follow_up_prompt}
-        ],
-        "temperature": temperature,
-    }
+    # The basic documentation is the stable prefix; only the follow-up prompt varies
+    def extended_request(prompt: str) -> Dict[str, Any]:
+        return build_claude_request(
+            model_id,
+            [
+                {"role": "user", "content": "Here is the basic documentation of a code repository:"},
+                {"role": "assistant", "content": basic_docs},
+                {"role": "user", "content": prompt}
+            ],
+            max_tokens=max_tokens,
+            temperature=temperature,
+            cache_prefix_messages=2,
+        )
     
     try:
-        # Call Claude via Bedrock
-        response = bedrock_client.invoke_model(
-            modelId=model_id,
-            body=json.dumps(request_body)
-        )
+        if parallel_sections:
+            # One call per section, so the latency is that of the slowest section
+            if stream_path:
+                print("Sections are generated concurrently; the extended documentation is written once all are done")
+            return generate_sections(
+                follow_up_prompt,
+                lambda title, prompt: invoke_model_with_retry(bedrock_client, model_id, extended_request(prompt))
+                .get("content", [{"text": "No content received"}])[0]["text"],
+                warm_first=supports_prompt_caching(model_id)
+            )
         
-        # Parse response
-        response_body = json.loads(response['body'].read().decode())
+        # Call Claude via Bedrock
+        request_body = extended_request(follow_up_prompt)
+        if stream_path:
+            response_body = invoke_model_stream(bedrock_client, model_id, request_body, stream_path, header=header)
+        else:
+            response_body = invoke_model_with_retry(bedrock_client, model_id, request_body)
         extended_docs = response_body.get("content", [{"text": "No content received"}])[0]["text"]
         
         return extended_docs
@@ -886,27 +1234,99 @@ def generate_extended_documentation(
 
 # Example usage
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate documentation from saved repository chunks")
+    parser.add_argument("--resume", action="store_true",
+                        help="Skip chunks completed by an interrupted run and continue with consolidation")
+    parser.add_argument("--from-repo", action="store_true",
+                        help="Extract, chunk and document the repository in one streaming pass instead of reading a chunks file")
+    parser.add_argument("--token-counter", choices=list(TOKEN_COUNTERS), default=DEFAULT_TOKEN_COUNTER,
+                        help=f"How chunk sizes are counted with --from-repo (default: {DEFAULT_TOKEN_COUNTER})")
+    parser.add_argument("--tokenizer-file", default=None,
+                        help="tokenizer.json for --token-counter tokenizer")
+    parser.add_argument("--plan", action="store_true",
+                        help="Print the token, call and time plan of the run and exit without calling the model")
+    parser.add_argument("--parallel-sections", action="store_true",
+                        help="Generate each section of the extended documentation in its own concurrent call")
+    parser.add_argument("--route-models", action="store_true",
+                        help="Send simple chunks (configuration, documentation, short straight-line code) to --fast-model")
+    parser.add_argument("--fast-model", default=DEFAULT_FAST_MODEL_ID,
+                        help=f"Model for simple chunks with --route-models (default: {DEFAULT_FAST_MODEL_ID})")
+    parser.add_argument("--max-continuations", type=int, default=DEFAULT_MAX_CONTINUATIONS,
+                        help=f"Continuation calls for a response cut off at max_tokens (default: {DEFAULT_MAX_CONTINUATIONS})")
+    parser.add_argument("-m", "--model-id", default="anthropic.claude-3-sonnet-20240229-v1:0",
+                        help="Bedrock model ID; prompt caching of the system prompt and basic documentation "
+                             "needs a model that supports it (default: Claude 3 Sonnet, which does not)")
+    args = parser.parse_args()
+    set_max_continuations(args.max_continuations)
+    fast_model_id = args.fast_model if args.route_models else None
+    
     # Configuration
     REPO_DIR = '/path/to/repository'
     OUTPUT_DIR = '/path/to/output'
     
-    # Find the latest chunks file in the output directory
     repo_name = os.path.basename(REPO_DIR)
-    chunks_files = [f for f in os.listdir(OUTPUT_DIR) if f.startswith(f"{repo_name}_chunks_") and f.endswith(".json")]
     
-    if not chunks_files:
-        print(f"No chunk files found for repository {repo_name}")
-        exit(1)
+    if args.from_repo:
+        # Counts are cached by content hash, so unchanged files are not recounted on later runs
+        counter_client = None
+        if args.token_counter == "bedrock":
+            counter_client = get_bedrock_client("us-east-1")
+        count_tokens = get_token_counter(
+            args.token_counter,
+            cache_path=os.path.join(OUTPUT_DIR, "token_counts.sqlite"),
+            tokenizer_file=args.tokenizer_file,
+            bedrock_client=counter_client,
+            model_id=args.model_id
+        )
         
-    latest_chunks_file = sorted(chunks_files)[-1]  # Get the most recent file
-    chunks_path = os.path.join(OUTPUT_DIR, latest_chunks_file)
-    
-    # Generate documentation
-    basic_docs_path, extended_docs_path = generate_documentation_from_chunks(
-        chunks_file=chunks_path,
-        output_dir=OUTPUT_DIR,
-        repo_name=repo_name
-    )
+        if args.plan:
+            histogram = TokenHistogram(count_tokens)
+            chunks = iter_repository_chunks(REPO_DIR, OUTPUT_DIR, count_tokens=count_tokens, histogram=histogram)
+            plan_documentation(chunks, OUTPUT_DIR, count_tokens=count_tokens, histogram=histogram, model_id=args.model_id,
+                               parallel_sections=args.parallel_sections, fast_model_id=fast_model_id)
+            sys.exit()
+        
+        # Generate documentation straight from the repository
+        basic_docs_path, extended_docs_path = generate_documentation_from_repository(
+            repo_dir=REPO_DIR,
+            output_dir=OUTPUT_DIR,
+            repo_name=repo_name,
+            resume=args.resume,
+            count_tokens=count_tokens,
+            parallel_sections=args.parallel_sections,
+            fast_model_id=fast_model_id,
+            model_id=args.model_id
+        )
+    else:
+        # Find the latest chunks file in the output directory
+        chunks_files = [f for f in os.listdir(OUTPUT_DIR) if f.startswith(f"{repo_name}_chunks_") and f.endswith((CHUNK_STORE_EXTENSION, ".json"))]
+        
+        if not chunks_files:
+            print(f"No chunk files found for repository {repo_name}")
+            exit(1)
+            
+        latest_chunks_file = sorted(chunks_files)[-1]  # Get the most recent file
+        chunks_path = os.path.join(OUTPUT_DIR, latest_chunks_file)
+        
+        if args.plan:
+            # Chunks files hold no per-file paths; the directory histogram needs --from-repo
+            chunks, _ = load_chunks_from_file(chunks_path)
+            plan_documentation(chunks, OUTPUT_DIR, model_id=args.model_id,
+                               parallel_sections=args.parallel_sections, fast_model_id=fast_model_id)
+            if hasattr(chunks, "close"):
+                chunks.close()
+            sys.exit()
+        
+        # Generate documentation
+        basic_docs_path, extended_docs_path = generate_documentation_from_chunks(
+            chunks_file=chunks_path,
+            output_dir=OUTPUT_DIR,
+            repo_name=repo_name,
+            resume=args.resume,
+            parallel_sections=args.parallel_sections,
+            fast_model_id=fast_model_id,
+            model_id=args.model_id
+        )
     
     print("Documentation generation complete!")
     print(f"Basic documentation: {basic_docs_path}")
@@ -989,20 +1409,19 @@ ls
 # In[41]:
 
 
-bedrock = boto3.client("bedrock-runtime", region_name="us-east-1")
+bedrock = get_bedrock_client("us-east-1")
+model_id = "anthropic.claude-3-sonnet-20240229-v1:0"
 responses = []
 
 for i, chunk in enumerate(chunks):
-    response = bedrock.invoke_model(
-        modelId="anthropic.claude-3-sonnet-20240229-v1:0",
-        body=json.dumps({
-            "anthropic_version": "bedrock-2023-05-31",
-            "max_tokens": 4096,
-            "system": SYSTEM_PROMPT,
-            "messages": [{"role": "user", "content": chunk}]
-        })
+    request_body = build_claude_request(
+        model_id,
+        [{"role": "user", "content": chunk}],
+        system_prompt=SYSTEM_PROMPT,
+        max_tokens=4096,
     )
-    responses.append(json.loads(response["body"].read())["content"][0]["text"])
+    response_body = invoke_model_with_retry(bedrock, model_id, request_body)
+    responses.append(response_body["content"][0]["text"])
 
 
 # In[40]:
@@ -1104,6 +1523,7 @@ if proceed.upper() != "Y":
     sys.exit()
 
 # Initialize Bedrock client
+import boto3
 bedrock_runtime = boto3.client(
     service_name="bedrock-runtime",
     region_name="us-east-1",  # Change to your region
@@ -1114,25 +1534,19 @@ input_prompt = f"Given this repo. \n{repo_content}\ncomplete your instruction"
 
 # Generate basic documentation
 print("Generating basic documentation...")
-request_body = {
-    "anthropic_version": "bedrock-2023-05-31",
-    "max_tokens": 4096,
-    "system": BASIC_DOCS_SYSTEM_PROMPT,
-    "messages": [
-        {"role": "user", "content": input_prompt},
-    ],
-    "temperature": 0.5,
-}
+# The repository prompt is marked cacheable so the extended request can reuse it
+request_body = build_claude_request(
+    "anthropic.claude-3-sonnet-20240229-v1:0",
+    [{"role": "user", "content": input_prompt}],
+    system_prompt=BASIC_DOCS_SYSTEM_PROMPT,
+    max_tokens=4096,
+    temperature=0.5,
+    cache_prefix_messages=1,
+)
 
 try:
     # You can replace this with any LLM API call (DeepSeek Code, CodeLlama, Llama 3.2)
-    response = bedrock_runtime.invoke_model(
-        modelId="anthropic.claude-3-sonnet-20240229-v1:0",  # Replace with your desired model
-        body=json.dumps(request_body)
-    )
-    
-    # Parse response
-    response_body = json.loads(response['body'].read().decode())
+    response_body = invoke_model_with_retry(bedrock_runtime, "anthropic.claude-3-sonnet-20240229-v1:0", request_body)  # Replace with your desired model
     basic_docs = response_body.get("content", [{"text": "No content received"}])[0]["text"]
     
     # Save basic documentation
@@ -1147,26 +1561,21 @@ try:
         print("Generating extended documentation...")
         
         # Prepare extended documentation request
-        extended_request_body = {
-            "anthropic_version": "bedrock-2023-05-31",
-            "max_tokens": 4096,
-            "system": BASIC_DOCS_SYSTEM_PROMPT,
-            "messages": [
+        extended_request_body = build_claude_request(
+            "anthropic.claude-3-sonnet-20240229-v1:0",
+            [
                 {"role": "user", "content": input_prompt},
                 {"role": "assistant", "content": basic_docs},
                 {"role": "user", "content": REFINED_DOCS_FOLLOW_UP_PROMPT},
             ],
-            "temperature": 0.5,
-        }
-        
-        # Call the LLM again for extended documentation
-        extended_response = bedrock_runtime.invoke_model(
-            modelId="anthropic.claude-3-sonnet-20240229-v1:0",  # Replace with your desired model
-            body=json.dumps(extended_request_body)
+            system_prompt=BASIC_DOCS_SYSTEM_PROMPT,
+            max_tokens=4096,
+            temperature=0.5,
+            cache_prefix_messages=1,
         )
         
-        # Parse extended response
-        extended_response_body = json.loads(extended_response['body'].read().decode())
+        # Call the LLM again for extended documentation
+        extended_response_body = invoke_model_with_retry(bedrock_runtime, "anthropic.claude-3-sonnet-20240229-v1:0", extended_request_body)  # Replace with your desired model
         extended_docs = extended_response_body.get("content", [{"text": "No content received"}])[0]["text"]
         
         # Save extended documentation
@@ -1,3 +1,5 @@
+from bedrock_utils import build_claude_request, invoke_model_with_retry
+
 # Inputs
 chunks = []  # List of repository content chunks
 system_prompt = ""  # System prompt for Claude  
@@ -17,24 +19,16 @@ while i < total_chunks:
     print(f"Processing chunk {i+1}/{total_chunks}...")
     
     # Prepare request body for Claude
-    request_body = {
-        "anthropic_version": "bedrock-2023-05-31",
-        "max_tokens": max_tokens,
-        "system": system_prompt,
-        "messages": [
-            {"role": "user", "content": f"Given this code chunk: \n\n{chunk}\n\nGenerate documentation."}
-        ],
-        "temperature": temperature,
-    }
-    
-    # Call Claude via Bedrock
-    response = bedrock_client.invoke_model(
-        modelId=model_id,
-        body=json.dumps(request_body)
+    request_body = build_claude_request(
+        model_id,
+        [{"role": "user", "content": f"Given this code chunk: \n\n{chunk}\n\nGenerate documentation."}],
+        system_prompt=system_prompt,
+        max_tokens=max_tokens,
+        temperature=temperature,
     )
     
-    # Parse response
-    response_body = json.loads(response['body'].read().decode())
+    # Call Claude via Bedrock (rate limited, retried when throttled, cached when a cache is open)
+    response_body = invoke_model_with_retry(bedrock_client, model_id, request_body)
     chunk_docs = response_body.get("content", [{"text": "No content received"}])[0]["text"]
     all_responses.append(chunk_docs)
     print(f"Successfully processed chunk {i+1}")
@@ -59,24 +53,16 @@ Please consolidate these into a single, coherent documentation that eliminates r
 Create a well-structured technical documentation that covers all the key aspects of the codebase.
 """
 
-consolidation_request = {
-    "anthropic_version": "bedrock-2023-05-31",
-    "max_tokens": max_tokens,
-    "system": system_prompt,
-    "messages": [
-        {"role": "user", "content": consolidation_prompt}
-    ],
-    "temperature": 0.3,  # Lower temperature for more consistent results
-}
-
-# Call Claude for consolidation
-consolidation_response = bedrock_client.invoke_model(
-    modelId=model_id,
-    body=json.dumps(consolidation_request)
+consolidation_request = build_claude_request(
+    model_id,
+    [{"role": "user", "content": consolidation_prompt}],
+    system_prompt=system_prompt,
+    max_tokens=max_tokens,
+    temperature=0.3,  # Lower temperature for more consistent results
 )
 
-# Parse response
-consolidation_body = json.loads(consolidation_response['body'].read().decode())
+# Call Claude for consolidation
+consolidation_body = invoke_model_with_retry(bedrock_client, model_id, consolidation_request)
 final_docs = consolidation_body.get("content", [{"text": "No content received"}])[0]["text"]
 
 # final_docs now contains the combined documentation
@@ -89,35 +75,21 @@ model_id = "anthropic.claude-3-sonnet-20240229-v1:0"  # Model ID to use
 max_tokens = 4096  # Maximum tokens for model response
 temperature = 0.5  # Temperature for generation
 
-# Prepare request body for Claude
-request_body = {
-    "anthropic_version": "bedrock-2023-05-31",
-    "max_tokens": max_tokens,
-    "messages": [
+# Prepare request body for Claude; the basic documentation is the stable prefix
+request_body = build_claude_request(
+    model_id,
+    [
         {"role": "user", "content": "Here is the basic documentation of a code repository:"},
         {"role": "assistant", "content": basic_docs},
         {"role": "user", "content": follow_up_prompt}
     ],
-    "temperature": temperature,
-}
-
-# Convert request to JSON string
-request_json = json.dumps(request_body)
-
-# Call Claude via Bedrock
-response = bedrock_client.invoke_model(
-    modelId=model_id,
-    body=request_json
+    max_tokens=max_tokens,
+    temperature=temperature,
+    cache_prefix_messages=2,
 )
 
-# Read response body
-response_raw = response['body'].read()
-
-# Decode response to string
-response_string = response_raw.decode()
-
-# Parse JSON
-response_body = json.loads(response_string)
+# Call Claude via Bedrock
+response_body = invoke_model_with_retry(bedrock_client, model_id, request_body)
 
 # Extract content from response
 content_list = response_body.get("content", [{"text": "No content received"}])
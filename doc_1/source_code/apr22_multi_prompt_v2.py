@@ -11,8 +11,11 @@ import json
 import re
 import datetime
 import argparse
-import nbformat
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Callable, Optional
+
+from extraction_utils import PathFilter
+from notebook_utils import notebook_to_python
+from token_utils import get_token_counter
 
 # Signature for generated documentation
 SIGNATURE = """# Auto-generated Documentation
@@ -103,6 +106,9 @@ EXCLUDED_DIRS = [
 UTILITY_OR_CONFIG_FILES = ["hubconf.py", "setup.py", "package-lock.json"]
 GITHUB_WORKFLOW_OR_DOCS = ["stale.py", "gen-card-", "write_model_card"]
 
+# All path filters above, compiled into one matcher
+PATH_FILTER = PathFilter(CODE_EXTENSIONS, EXCLUDED_DIRS, UTILITY_OR_CONFIG_FILES, GITHUB_WORKFLOW_OR_DOCS)
+
 
 # In[4]:
 
@@ -131,38 +137,7 @@ def is_valid_file(file_path: str) -> bool:
     Returns:
         bool: True if file should be processed, False otherwise
     """
-    # Skip if file path ends with "/"
-    if file_path.endswith("/"):
-        return False
-    
-    # Check if file has a desired extension
-    if not any(file_path.endswith(ext) for ext in CODE_EXTENSIONS):
-        return False
-    
-    # Check if file is in excluded directory
-    check_path = file_path.replace("\\", "/")
-    parts = check_path.split(os.sep)[1:]
-    if any(part.startswith(".") for part in parts):
-        return False
-    
-    if "test" in check_path.lower():
-        return False
-            
-    # Check for excluded directories
-    for excluded_dir in EXCLUDED_DIRS:
-        if f"/{excluded_dir}/" in check_path or check_path.startswith(f"{excluded_dir}/"):
-            return False
-                
-    # Check for utility or config files
-    for file_name in UTILITY_OR_CONFIG_FILES:
-        if file_name in check_path:
-            return False
-            
-    # Check for GitHub workflow or docs files
-    if not all(doc_file not in check_path for doc_file in GITHUB_WORKFLOW_OR_DOCS):
-        return False
-    
-    return True
+    return PATH_FILTER.matches(file_path)
 
 
 # In[ ]:
@@ -246,59 +221,47 @@ def extract_content(file_path: str, output_file: str) -> bool:
     try:
         # For Jupyter notebooks, convert to Python script first
         if file_extension == '.ipynb':
-            try:
-                import nbformat
-                from nbconvert import PythonExporter
-                
-                print(f"Converting notebook {file_path} to Python script...")
-                
-                # Read the notebook
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    notebook = nbformat.read(f, as_version=4)
-                
-                # Convert to Python
-                python_exporter = PythonExporter()
-                python_code, _ = python_exporter.from_notebook_node(notebook)
-                
-                # Process the converted Python code
-                lines = python_code.split('\n')
-                
-                # Filter out installation-related lines
-                filtered_lines = []
-                for line in lines:
-                    if not any(term in line for term in ["pip install", "Requirement already satisfied", "Installing", "Collecting", "Downloading"]):
-                        filtered_lines.append(line)
-                
-                # Remove lines with less than 5 substantive lines
-                if len(filtered_lines) < 5:
-                    print(f"Converted notebook has less than 5 substantive lines, skipping...")
-                    return False
-                
-                # Create output file with header
-                with open(output_file, "w", encoding="utf-8") as outfile:
-                    outfile.write(f"# File: {file_path} (converted from notebook)\n\n")
+            print(f"Converting notebook {file_path} to Python script...")
+            
+            # Read the notebook and convert it to Python; cell outputs are skipped unparsed
+            with open(file_path, 'r', encoding='utf-8') as f:
+                python_code = notebook_to_python(f.read())
+            
+            # Process the converted Python code
+            lines = python_code.split('\n')
+            
+            # Filter out installation-related lines
+            filtered_lines = []
+            for line in lines:
+                if not any(term in line for term in ["pip install", "Requirement already satisfied", "Installing", "Collecting", "Downloading"]):
+                    filtered_lines.append(line)
+            
+            # Remove lines with less than 5 substantive lines
+            if len(filtered_lines) < 5:
+                print(f"Converted notebook has less than 5 substantive lines, skipping...")
+                return False
+            
+            # Create output file with header
+            with open(output_file, "w", encoding="utf-8") as outfile:
+                outfile.write(f"# File: {file_path} (converted from notebook)\n\n")
                     
-                    # Try to clean comments and docstrings using AST
-                    try:
-                        source = "\n".join(filtered_lines)
-                        tree = ast.parse(source)
-                        for node in ast.walk(tree):
-                            if isinstance(node, (ast.FunctionDef, ast.ClassDef, ast.AsyncFunctionDef)) and ast.get_docstring(node):
-                                node.body = node.body[1:]  # Remove docstring
-                            elif isinstance(node, ast.Expr) and isinstance(node.value, ast.Str):
-                                node.value.s = ""  # Remove comments
-                        cleaned_source = ast.unparse(tree)
-                        outfile.write(cleaned_source)
-                    except Exception as e:
-                        print(f"AST parsing failed: {e}, using filtered lines")
-                        outfile.write("\n".join(filtered_lines))
-                
-                print(f"Notebook converted and processed to {output_file}")
-                return True
-                
-            except ImportError:
-                print("nbformat or nbconvert not installed, processing notebook as text...")
-                # If conversion libraries aren't available, revert to original processing
+                # Try to clean comments and docstrings using AST
+                try:
+                    source = "\n".join(filtered_lines)
+                    tree = ast.parse(source)
+                    for node in ast.walk(tree):
+                        if isinstance(node, (ast.FunctionDef, ast.ClassDef, ast.AsyncFunctionDef)) and ast.get_docstring(node):
+                            node.body = node.body[1:]  # Remove docstring
+                        elif isinstance(node, ast.Expr) and isinstance(node.value, ast.Str):
+                            node.value.s = ""  # Remove comments
+                    cleaned_source = ast.unparse(tree)
+                    outfile.write(cleaned_source)
+                except Exception as e:
+                    print(f"AST parsing failed: {e}, using filtered lines")
+                    outfile.write("\n".join(filtered_lines))
+            
+            print(f"Notebook converted and processed to {output_file}")
+            return True
         
         # For Python scripts and other files
         with open(file_path, 'r', encoding='utf-8') as file_content:
@@ -370,12 +333,13 @@ print(file_path)
 
 test_2 = extract_content(file_path, output_file)
 
-def estimate_token_size(content_file: str) -> int:
+def estimate_token_size(content_file: str, count_tokens: Optional[Callable[[str], int]] = None) -> int:
     """
     Estimate the token size of a file.
     
     Args:
         content_file (str): Path to the file
+        count_tokens (callable): Token counter (default: the default counter of token_utils)
         
     Returns:
         int: Estimated token size
@@ -384,8 +348,8 @@ def estimate_token_size(content_file: str) -> int:
         with open(content_file, 'r', encoding='utf-8') as f:
             content = f.read()
             
-        # Very simple estimation - approximately 4 characters per token
-        token_size = len(content) // 4
+        count_tokens = count_tokens or get_token_counter()
+        token_size = count_tokens(content)
         print(f"Input token size estimate: {token_size}")
         return token_size
     except Exception as e:
@@ -439,9 +403,16 @@ import sys
 import json
 import datetime
 import argparse
-import boto3
 from typing import Optional
 
+from bedrock_utils import build_claude_request, get_response_cache, invoke_model_stream, invoke_model_with_retry
+from bedrock_utils import supports_prompt_caching
+from bedrock_utils import connection_stats, get_bedrock_client, get_latency_history, usage_tracker
+from bedrock_utils import DEFAULT_MAX_CONTINUATIONS, set_max_continuations, truncation_tracker
+from planning_utils import format_plan, plan_run
+from section_utils import generate_sections, section_prompts
+from token_utils import get_token_counter
+
 # Signature for generated documentation
 SIGNATURE = """# Auto-generated Documentation
 
@@ -513,6 +484,11 @@ def parse_arguments():
     parser.add_argument('-r', '--region', default='us-east-1', help='AWS region for Bedrock (default: us-east-1)')
     parser.add_argument('-m', '--model-id', default='anthropic.claude-3-sonnet-20240229-v1:0', 
                       help='Bedrock model ID (default: anthropic.claude-3-sonnet-20240229-v1:0)')
+    parser.add_argument('--no-cache', action='store_true', help='Always call the model instead of reusing cached responses')
+    parser.add_argument('--stream', action='store_true', help='Stream generated text into the output files as it arrives')
+    parser.add_argument('--parallel-sections', action='store_true', help='Generate each section of the basic and extended documentation in its own concurrent call')
+    parser.add_argument('--max-continuations', type=int, default=DEFAULT_MAX_CONTINUATIONS, help=f'Continuation calls for a response cut off at max_tokens (default: {DEFAULT_MAX_CONTINUATIONS})')
+    parser.add_argument('--plan', action='store_true', help='Print the token, call and time plan of the run and exit without calling the model')
     return parser.parse_args()
 
 def initialize_bedrock_client(region_name: str = 'us-east-1'):
@@ -526,17 +502,14 @@ def initialize_bedrock_client(region_name: str = 'us-east-1'):
         boto3.client: Initialized Bedrock client
     """
     try:
-        # Initialize Bedrock client
-        bedrock_runtime = boto3.client(
-            service_name="bedrock-runtime",
-            region_name=region_name
-        )
-        return bedrock_runtime
+        # Shared client; boto3 is only imported once a client is needed
+        return get_bedrock_client(region_name)
     except Exception as e:
         print(f"Error initializing Bedrock client: {e}")
         return None
 
-def generate_basic_documentation(file_content: str, system_prompt: str, model_id: str, bedrock_client) -> str:
+def generate_basic_documentation(file_content: str, system_prompt: str, model_id: str, bedrock_client,
+                                 stream_path: Optional[str] = None, parallel_sections: bool = False) -> str:
     """
     Generate basic documentation for the given file content using Claude Sonnet.
     
@@ -545,6 +518,9 @@ def generate_basic_documentation(file_content: str, system_prompt: str, model_id
         system_prompt (str): System prompt for Claude
         model_id (str): Bedrock model ID
         bedrock_client: Initialized Bedrock client
+        stream_path (str): If set, stream the documentation into this file as it is generated
+        parallel_sections (bool): Request each section of the system prompt separately
+            and concurrently, sharing the file as a cached prefix (not streamed)
         
     Returns:
         str: Generated documentation
@@ -555,26 +531,42 @@ def generate_basic_documentation(file_content: str, system_prompt: str, model_id
     
     print("Generating basic documentation...")
     
+    if parallel_sections:
+        # The system prompt and the file are the shared cacheable prefix; only the trailing
+        # section instruction differs, and the first section warms the cache for the rest
+        return generate_sections(
+            system_prompt,
+            lambda title, prompt: invoke_model_with_retry(bedrock_client, model_id, build_claude_request(
+                model_id,
+                [{"role": "user", "content": [
+                    {"type": "text", "text": f"Given this code file: \n\n{file_content}\n\n"},
+                    {"type": "text", "text": prompt},
+                ]}],
+                system_prompt=system_prompt,
+                max_tokens=4096,
+                temperature=0.5,
+                cache_prefix_messages=1,
+                cache_prefix_blocks=1,
+            )).get("content", [{"text": "No content received"}])[0]["text"],
+            warm_first=supports_prompt_caching(model_id)
+        )
+    
     # Prepare request body for Claude
-    request_body = {
-        "anthropic_version": "bedrock-2023-05-31",
-        "max_tokens": 4096,
-        "system": system_prompt,
-        "messages": [
-            {"role": "user", "content": f"Given this code file: \n\n{file_content}\n\nGenerate documentation."}
-        ],
-        "temperature": 0.5,
-    }
+    # The system prompt is shared by every file and is sent as a cacheable prefix
+    request_body = build_claude_request(
+        model_id,
+        [{"role": "user", "content": f"Given this code file: \n\n{file_content}\n\nGenerate documentation."}],
+        system_prompt=system_prompt,
+        max_tokens=4096,
+        temperature=0.5,
+    )
     
     try:
         # Call Claude via Bedrock
-        response = bedrock_client.invoke_model(
-            modelId=model_id,
-            body=json.dumps(request_body)
-        )
-        
-        # Parse response
-        response_body = json.loads(response['body'].read().decode())
+        if stream_path:
+            response_body = invoke_model_stream(bedrock_client, model_id, request_body, stream_path, header=SIGNATURE)
+        else:
+            response_body = invoke_model_with_retry(bedrock_client, model_id, request_body)
         documentation = response_body.get("content", [{"text": "No content received"}])[0]["text"]
         
         return documentation
@@ -583,7 +575,8 @@ def generate_basic_documentation(file_content: str, system_prompt: str, model_id
         print(f"Error generating documentation: {e}")
         return f"Error generating documentation: {str(e)}"
 
-def generate_extended_documentation(basic_docs: str, follow_up_prompt: str, model_id: str, bedrock_client) -> str:
+def generate_extended_documentation(basic_docs: str, follow_up_prompt: str, model_id: str, bedrock_client,
+                                    stream_path: Optional[str] = None, parallel_sections: bool = False) -> str:
     """
     Generate extended documentation based on basic documentation.
     
@@ -592,6 +585,9 @@ def generate_extended_documentation(basic_docs: str, follow_up_prompt: str, mode
         follow_up_prompt (str): Follow-up prompt for extended documentation
         model_id (str): Bedrock model ID
         bedrock_client: Initialized Bedrock client
+        stream_path (str): If set, stream the documentation into this file as it is generated
+        parallel_sections (bool): Request each section of the follow-up prompt separately
+            and concurrently, then assemble them in prompt order (not streamed)
         
     Returns:
         str: Extended documentation
@@ -602,26 +598,37 @@ def generate_extended_documentation(basic_docs: str, follow_up_prompt: str, mode
     
     print("Generating extended documentation...")
     
-    try:
-        # Call Claude for extended documentation
-        extended_request = {
-            "anthropic_version": "bedrock-2023-05-31",
-            "max_tokens": 4096,
-            "messages": [
+    # The basic documentation is the stable prefix; only the follow-up prompt varies
+    def extended_request(prompt: str) -> dict:
+        return build_claude_request(
+            model_id,
+            [
                 {"role": "user", "content": "Here is the basic documentation for a code file:"},
                 {"role": "assistant", "content": basic_docs},
-                {"role": "user", "content": follow_up_prompt}
+                {"role": "user", "content": prompt}
             ],
-            "temperature": 0.5,
-        }
-        
-        extended_response = bedrock_client.invoke_model(
-            modelId=model_id,
-            body=json.dumps(extended_request)
+            max_tokens=4096,
+            temperature=0.5,
+            cache_prefix_messages=2,
         )
+    
+    try:
+        if parallel_sections:
+            # One call per section, so the latency is that of the slowest section
+            return generate_sections(
+                follow_up_prompt,
+                lambda title, prompt: invoke_model_with_retry(bedrock_client, model_id, extended_request(prompt))
+                .get("content", [{"text": "No content received"}])[0]["text"],
+                warm_first=supports_prompt_caching(model_id)
+            )
+        
+        # Call Claude for extended documentation
+        request_body = extended_request(follow_up_prompt)
         
-        # Parse response
-        extended_body = json.loads(extended_response['body'].read().decode())
+        if stream_path:
+            extended_body = invoke_model_stream(bedrock_client, model_id, request_body, stream_path, header=SIGNATURE)
+        else:
+            extended_body = invoke_model_with_retry(bedrock_client, model_id, request_body)
         extended_docs = extended_body.get("content", [{"text": "No content received"}])[0]["text"]
         
         return extended_docs
@@ -639,6 +646,7 @@ def main():
     output_dir = args.output_dir
     region_name = args.region
     model_id = args.model_id
+    set_max_continuations(args.max_continuations)
     
     # Create output directory if it doesn't exist
     os.makedirs(output_dir, exist_ok=True)
@@ -666,44 +674,82 @@ def main():
     # Add file header
     file_content_with_header = f"# File: {input_file}\n\n{file_content}"
     
+    if args.plan:
+        # One call for the whole file (one per section with --parallel-sections), no consolidation
+        count_tokens = get_token_counter()
+        file_tokens = count_tokens(file_content_with_header)
+        basic_prompts = (section_prompts(BASIC_DOCS_SYSTEM_PROMPT) if args.parallel_sections
+                         else [("", "Generate documentation.")])
+        extended_prompts = (section_prompts(REFINED_DOCS_FOLLOW_UP_PROMPT) if args.parallel_sections
+                            else [("", REFINED_DOCS_FOLLOW_UP_PROMPT)])
+        extended_tokens = [count_tokens(prompt) for _, prompt in extended_prompts]
+        plan = plan_run(
+            [file_tokens + count_tokens(prompt) for _, prompt in basic_prompts],
+            model_id,
+            system_tokens=count_tokens(BASIC_DOCS_SYSTEM_PROMPT),
+            max_workers=len(basic_prompts),
+            consolidation_mode=None,
+            extended_input_tokens=sum(extended_tokens) // len(extended_tokens),
+            extended_calls=len(extended_tokens),
+            history=get_latency_history(os.path.join(output_dir, "llm_call_history.sqlite"))
+        )
+        print(format_plan(plan))
+        return
+    
     # Initialize Bedrock client
     bedrock_client = initialize_bedrock_client(region_name)
     if bedrock_client is None:
         print("Failed to initialize Bedrock client. Exiting.")
         return
     
+    # Reuse responses from earlier runs on unchanged input
+    if not args.no_cache:
+        get_response_cache(os.path.join(output_dir, "llm_response_cache.sqlite"))
+    
+    # Record call latencies so later runs can be planned
+    get_latency_history(os.path.join(output_dir, "llm_call_history.sqlite"))
+    
     # Generate basic documentation
+    basic_docs_path = os.path.join(output_dir, f"{file_base_name}-docs-{timestamp}.md")
     basic_docs = generate_basic_documentation(
         file_content=file_content_with_header,
         system_prompt=BASIC_DOCS_SYSTEM_PROMPT,
         model_id=model_id,
-        bedrock_client=bedrock_client
+        bedrock_client=bedrock_client,
+        stream_path=basic_docs_path if args.stream and not args.parallel_sections else None,
+        parallel_sections=args.parallel_sections
     )
     
-    # Save basic documentation
-    basic_docs_path = os.path.join(output_dir, f"{file_base_name}-docs-{timestamp}.md")
-    with open(basic_docs_path, "w", encoding="utf-8") as file:
-        file.write(SIGNATURE + basic_docs)
+    # Save basic documentation (already written when streamed)
+    if not (args.stream and os.path.exists(basic_docs_path)):
+        with open(basic_docs_path, "w", encoding="utf-8") as file:
+            file.write(SIGNATURE + basic_docs)
     print(f"Basic documentation saved to {basic_docs_path}")
     
     # Ask if user wants extended documentation
     proceed = input("Do you wish to generate extended documentation? (Y/N): ")
     if proceed.upper() == "Y":
         # Generate extended documentation
+        extended_docs_path = os.path.join(output_dir, f"{file_base_name}-extended-docs-{timestamp}.md")
         extended_docs = generate_extended_documentation(
             basic_docs=basic_docs,
             follow_up_prompt=REFINED_DOCS_FOLLOW_UP_PROMPT,
             model_id=model_id,
-            bedrock_client=bedrock_client
+            bedrock_client=bedrock_client,
+            stream_path=extended_docs_path if args.stream and not args.parallel_sections else None,
+            parallel_sections=args.parallel_sections
         )
         
-        # Save extended documentation
-        extended_docs_path = os.path.join(output_dir, f"{file_base_name}-extended-docs-{timestamp}.md")
-        with open(extended_docs_path, "w", encoding="utf-8") as file:
-            file.write(SIGNATURE + extended_docs)
+        # Save extended documentation (already written when streamed)
+        if not (args.stream and os.path.exists(extended_docs_path)):
+            with open(extended_docs_path, "w", encoding="utf-8") as file:
+                file.write(SIGNATURE + extended_docs)
         
         print(f"Extended documentation saved to {extended_docs_path}")
     
+    print(f"Token usage: {usage_tracker.summary()}")
+    print(f"Truncation: {truncation_tracker.summary()}")
+    print(f"Connections: {connection_stats.summary()}")
     print("Documentation generation complete!")
 
 if __name__ == "__main__":
@@ -5,14 +5,26 @@
 
 
 import os
-import sys
 import ast
-import json
-import re
+import time
 import datetime
 import argparse
-import nbformat
-from typing import List, Dict, Any, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Callable, Optional
+
+from bedrock_utils import build_claude_request, get_response_cache, invoke_model_stream, invoke_model_with_retry
+from bedrock_utils import ResponseCache, get_bedrock_client, get_rate_limiter, supports_prompt_caching, usage_tracker
+from bedrock_utils import DEFAULT_MAX_CONTINUATIONS, connection_stats, set_max_continuations, truncation_tracker
+from bedrock_utils import get_latency_history
+from checkpoint_utils import ChunkCheckpoint
+from chunk_store_utils import CHUNK_STORE_EXTENSION, load_chunks, write_chunk_store
+from chunking_utils import CHUNKING_MODES, report_packing_savings, split_content
+from consolidation_utils import DEFAULT_CONSOLIDATION_BUDGET, merkle_reduce_fragments, tree_reduce_fragments
+from extraction_utils import PathFilter
+from planning_utils import format_plan, plan_run
+from routing_utils import DEFAULT_FAST_MODEL_ID, ModelRouter
+from section_utils import generate_sections, section_prompts
+from token_utils import DEFAULT_TOKEN_COUNTER, TOKEN_COUNTERS, get_token_counter
 
 
 # In[2]:
@@ -85,6 +97,9 @@ Developer Onboarding:
 # In[3]:
 
 
+# Default directory for extracted content, chunks and documentation
+OUTPUT_DIR = "output_docs"
+
 # List of file extensions to include
 CODE_EXTENSIONS = [
     ".py", ".ipynb", ".js", ".jsx", ".ts", ".tsx", ".java", ".c", ".cpp", ".h", 
@@ -106,6 +121,9 @@ EXCLUDED_DIRS = [
 UTILITY_OR_CONFIG_FILES = ["hubconf.py", "setup.py", "package-lock.json"]
 GITHUB_WORKFLOW_OR_DOCS = ["stale.py", "gen-card-", "write_model_card"]
 
+# All path filters above, compiled into one matcher
+PATH_FILTER = PathFilter(CODE_EXTENSIONS, EXCLUDED_DIRS, UTILITY_OR_CONFIG_FILES, GITHUB_WORKFLOW_OR_DOCS)
+
 
 # In[4]:
 
@@ -115,9 +133,29 @@ def parse_arguments():
     parser = argparse.ArgumentParser(description='Generate documentation for a code file.')
     parser.add_argument('input_file', help='Path to the file to document (.py, .ipynb, .js, etc.)')
     parser.add_argument('-o', '--output-dir', default=OUTPUT_DIR, help=f'Output directory (default: {OUTPUT_DIR})')
+    parser.add_argument('-m', '--model-id', default='anthropic.claude-3-sonnet-20240229-v1:0',
+                        help='Bedrock model ID; the system prompt and basic documentation are only cached on models '
+                             'that support prompt caching (default: Claude 3 Sonnet, which does not)')
     parser.add_argument('-s', '--simulate', action='store_true', help='Run in simulation mode (no actual API calls)')
     parser.add_argument('-c', '--chunk-size', type=int, default=1500, help='Chunk size in tokens (default: 1500)')
     parser.add_argument('-ol', '--overlap', type=int, default=50, help='Overlap between chunks (default: 50)')
+    parser.add_argument('--chunking', choices=list(CHUNKING_MODES), default='lines', help='Chunk by line windows, on class/function/cell boundaries, or bin-pack whole units (default: lines)')
+    parser.add_argument('--token-counter', choices=list(TOKEN_COUNTERS), default=DEFAULT_TOKEN_COUNTER, help=f'How chunk sizes are counted (default: {DEFAULT_TOKEN_COUNTER})')
+    parser.add_argument('--tokenizer-file', default=None, help='tokenizer.json for --token-counter tokenizer')
+    parser.add_argument('--token-cache', default=None, help='SQLite file caching token counts by content hash between runs')
+    parser.add_argument('-w', '--workers', type=int, default=1, help='Number of chunks processed concurrently (default: 1)')
+    parser.add_argument('--consolidation', choices=['single', 'tree'], default='single', help='Consolidate fragments in one prompt or as a tree of merges (default: single)')
+    parser.add_argument('--consolidation-cache', default=None, help='SQLite file for incremental tree consolidation (reuses unchanged subtree summaries)')
+    parser.add_argument('--stream', action='store_true', help='Stream extended documentation into the output file as it arrives')
+    parser.add_argument('--parallel-sections', action='store_true', help='Generate each section of the extended documentation in its own concurrent call (not streamed)')
+    parser.add_argument('--plan', action='store_true', help='Print the token, call and time plan of the run and exit without calling the model')
+    parser.add_argument('--resume', action='store_true', help='Skip chunks completed by an interrupted run on the same input file')
+    parser.add_argument('--no-cache', action='store_true', help='Always call the model instead of reusing cached responses')
+    parser.add_argument('--route-models', action='store_true', help='Send simple chunks (configuration, documentation, short straight-line code) to --fast-model')
+    parser.add_argument('--fast-model', default=DEFAULT_FAST_MODEL_ID, help=f'Model for simple chunks with --route-models (default: {DEFAULT_FAST_MODEL_ID})')
+    parser.add_argument('--max-continuations', type=int, default=DEFAULT_MAX_CONTINUATIONS, help=f'Continuation calls for a response cut off at max_tokens (default: {DEFAULT_MAX_CONTINUATIONS})')
+    parser.add_argument('--rpm', type=int, default=None, help='Bedrock requests-per-minute budget shared by all workers')
+    parser.add_argument('--tpm', type=int, default=None, help='Bedrock tokens-per-minute budget shared by all workers')
     return parser.parse_args()
 
 
@@ -134,38 +172,7 @@ def is_valid_file(file_path: str) -> bool:
     Returns:
         bool: True if file should be processed, False otherwise
     """
-    # Skip if file path ends with "/"
-    if file_path.endswith("/"):
-        return False
-    
-    # Check if file has a desired extension
-    if not any(file_path.endswith(ext) for ext in CODE_EXTENSIONS):
-        return False
-    
-    # Check if file is in excluded directory
-    check_path = file_path.replace("\\", "/")
-    parts = check_path.split(os.sep)[1:]
-    if any(part.startswith(".") for part in parts):
-        return False
-    
-    if "test" in check_path.lower():
-        return False
-            
-    # Check for excluded directories
-    for excluded_dir in EXCLUDED_DIRS:
-        if f"/{excluded_dir}/" in check_path or check_path.startswith(f"{excluded_dir}/"):
-            return False
-                
-    # Check for utility or config files
-    for file_name in UTILITY_OR_CONFIG_FILES:
-        if file_name in check_path:
-            return False
-            
-    # Check for GitHub workflow or docs files
-    if not all(doc_file not in check_path for doc_file in GITHUB_WORKFLOW_OR_DOCS):
-        return False
-    
-    return True
+    return PATH_FILTER.matches(file_path)
 
 
 # In[6]:
@@ -342,12 +349,13 @@ def extract_content(file_path: str, output_file: str) -> bool:
 # In[7]:
 
 
-def estimate_token_size(content_file: str) -> int:
+def estimate_token_size(content_file: str, count_tokens: Optional[Callable[[str], int]] = None) -> int:
     """
     Estimate the token size of a file.
     
     Args:
         content_file (str): Path to the file
+        count_tokens (callable): Token counter (default: the default counter of token_utils)
         
     Returns:
         int: Estimated token size
@@ -356,8 +364,8 @@ def estimate_token_size(content_file: str) -> int:
         with open(content_file, 'r', encoding='utf-8') as f:
             content = f.read()
             
-        # Very simple estimation - approximately 4 characters per token
-        token_size = len(content) // 4
+        count_tokens = count_tokens or get_token_counter()
+        token_size = count_tokens(content)
         print(f"Input token size estimate: {token_size}")
         return token_size
     except Exception as e:
@@ -368,15 +376,20 @@ def estimate_token_size(content_file: str) -> int:
 # In[8]:
 
 
-def chunk_content(content_file: str, chunk_size: int = 1500, overlap: int = 50, output_dir: Optional[str] = None) -> List[str]:
+def chunk_content(content_file: str, chunk_size: int = 1500, overlap: int = 50, output_dir: Optional[str] = None,
+                  mode: str = "lines", count_tokens: Optional[Callable[[str], int]] = None) -> List[str]:
     """
     Divide file content into overlapping chunks and optionally save to disk.
     
     Args:
         content_file (str): Path to the file containing content
-        chunk_size (int): Target chunk size in tokens (estimated)
+        chunk_size (int): Target chunk size in tokens
         overlap (int): Number of lines to overlap between chunks
         output_dir (str): Directory to save chunks (if None, won't save)
+        mode (str): "lines" for overlapping line windows, "ast" to cut on class,
+            function and notebook cell boundaries, "pack" to bin-pack definitions
+        count_tokens (callable): Token counter chunks are sized with
+            (default: the default counter of token_utils)
         
     Returns:
         list: List of content chunks
@@ -385,49 +398,29 @@ def chunk_content(content_file: str, chunk_size: int = 1500, overlap: int = 50,
     with open(content_file, 'r', encoding='utf-8') as f:
         content = f.read()
     
-    chunks = []
-    lines = content.split('\n')
-    current_chunk = []
-    current_length = 0
-    
-    # Simple token estimation - approximately 4 chars per token
-    for line in lines:
-        line_length = len(line) // 4
-        
-        # If adding this line would exceed chunk size, save current chunk
-        if current_length + line_length > chunk_size:
-            chunks.append('\n'.join(current_chunk))
-            # Keep overlap lines for the next chunk
-            current_chunk = current_chunk[-overlap:]
-            current_length = sum(len(l) // 4 for l in current_chunk)
-        
-        # Add line to current chunk
-        current_chunk.append(line)
-        current_length += line_length
-    
-    # Add the final chunk if not empty
-    if current_chunk:
-        chunks.append('\n'.join(current_chunk))
+    # Single pass over running line token counts, each file counted once
+    count_tokens = count_tokens or get_token_counter()
+    chunks = split_content(content, chunk_size, overlap, mode=mode, count_tokens=count_tokens)
+    if mode == "pack":
+        report_packing_savings(content, chunks, chunk_size, overlap, count_tokens)
     
     # Save chunks to file if output directory is provided
     if output_dir:    
         timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        chunks_file = os.path.join(output_dir, f"chunks_{timestamp}.json")
-        
-        # Create output directory if it doesn't exist
-        os.makedirs(output_dir, exist_ok=True)
+        chunks_file = os.path.join(output_dir, f"chunks_{timestamp}{CHUNK_STORE_EXTENSION}")
         
-        # Save chunks to JSON file
-        with open(chunks_file, 'w', encoding='utf-8') as f:
-            json.dump({
-                'timestamp': timestamp,
-                'chunk_size': chunk_size,
-                'overlap': overlap,
-                'total_chunks': len(chunks),
-                'chunks': chunks
-            }, f, indent=2)
+        # Save chunks as content ranges (overlaps are not copied) with an offset index
+        stats = write_chunk_store(chunks_file, chunks, corpus=content, metadata={
+            'timestamp': timestamp,
+            'chunk_size': chunk_size,
+            'overlap': overlap,
+            'chunking': mode,
+            'token_counter': getattr(count_tokens, 'name', 'estimate'),
+            'total_chunks': len(chunks)
+        })
         
-        print(f"Saved {len(chunks)} chunks to {chunks_file}")
+        print(f"Saved {len(chunks)} chunks to {chunks_file} ({stats['references']} as content ranges, "
+              f"{stats['file_bytes'] / 1024:.0f} KB for {stats['chunk_bytes'] / 1024:.0f} KB of chunk text)")
     
     return chunks
 
@@ -440,17 +433,15 @@ def load_chunks_from_file(chunks_file: str) -> tuple:
     Load repository content chunks from a file.
     
     Args:
-        chunks_file (str): Path to the JSON file containing chunks
+        chunks_file (str): Path to the chunk store (or legacy JSON file) containing chunks
         
     Returns:
-        tuple: List of content chunks and metadata dict
+        tuple: Content chunks (decoded lazily on access for chunk stores) and metadata dict;
+            a chunk store keeps its file mapped until the caller closes it
     """
     try:
-        with open(chunks_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        
-        chunks = data.pop('chunks')
-        metadata = data  # Contains timestamp, chunk_size, overlap, etc.
+        # Contains timestamp, chunk_size, overlap, etc.
+        chunks, metadata = load_chunks(chunks_file)
         
         print(f"Loaded {len(chunks)} chunks from {chunks_file}")
         print(f"Chunks metadata: {metadata}")
@@ -464,7 +455,115 @@ def load_chunks_from_file(chunks_file: str) -> tuple:
 # In[10]:
 
 
-def process_chunks_with_claude(chunks: List[str], system_prompt: str, simulation: bool = True) -> str:
+def process_single_chunk(bedrock_runtime: Any, chunk: str, index: int, total_chunks: int, system_prompt: str,
+                         router: Optional[ModelRouter] = None, checkpoint: Optional[ChunkCheckpoint] = None,
+                         model_id: str = "anthropic.claude-3-sonnet-20240229-v1:0") -> str:
+    """
+    Generate documentation for a single content chunk with Claude.
+    
+    Args:
+        bedrock_runtime: Initialized AWS Bedrock client
+        chunk (str): Content chunk to document
+        index (int): Zero-based position of the chunk
+        total_chunks (int): Total number of chunks, used for progress output
+        system_prompt (str): System prompt for Claude
+        router (ModelRouter): Picks the model for the chunk instead of model_id (optional)
+        checkpoint (ChunkCheckpoint): Store for completed chunk results (optional)
+        model_id (str): Bedrock model ID
+        
+    Returns:
+        str: Documentation for the chunk, or an error message if the call failed
+    """
+    if checkpoint is not None:
+        stored_docs = checkpoint.get(index, chunk)
+        if stored_docs is not None:
+            print(f"Chunk {index+1}/{total_chunks} already completed, skipping")
+            return stored_docs
+    
+    print(f"Processing chunk {index+1}/{total_chunks}...")
+    if router is not None:
+        model_id = router.route(chunk, f"Chunk {index+1}/{total_chunks}")
+    
+    # Prepare request body for Claude
+    # The system prompt is identical for every chunk and is sent as a cacheable prefix
+    # (only on models with prompt caching; Claude 3 Sonnet sends it uncached)
+    request_body = build_claude_request(
+        model_id,
+        [{"role": "user", "content": f"Given this code chunk: \n\n{chunk}\n\nGenerate documentation."}],
+        system_prompt=system_prompt,
+        max_tokens=4096,
+        temperature=0.5,
+    )
+    
+    try:
+        # Call Claude via Bedrock
+        start_time = time.monotonic()
+        response_body = invoke_model_with_retry(bedrock_runtime, model_id, request_body)
+        if router is not None:
+            router.record_latency(model_id, time.monotonic() - start_time)
+        chunk_docs = response_body.get("content", [{"text": "No content received"}])[0]["text"]
+        
+        # Failed chunks are not recorded, so a resumed run retries them
+        if checkpoint is not None:
+            checkpoint.record(index, chunk, chunk_docs)
+        
+        print(f"Successfully processed chunk {index+1}")
+        return chunk_docs
+        
+    except Exception as e:
+        print(f"Error processing chunk {index+1}: {e}")
+        return f"Error processing chunk {index+1}: {str(e)}"
+
+
+def consolidate_fragments(bedrock_runtime: Any, fragments: List[str], system_prompt: str,
+                          model_id: str = "anthropic.claude-3-sonnet-20240229-v1:0") -> str:
+    """
+    Consolidate documentation fragments into a single document with Claude.
+    
+    Args:
+        bedrock_runtime: Initialized AWS Bedrock client
+        fragments (list): Documentation fragments in chunk order
+        system_prompt (str): System prompt for Claude
+        model_id (str): Bedrock model ID
+        
+    Returns:
+        str: Consolidated documentation
+    """
+    combined_responses = "\n\n".join(fragments)
+    
+    consolidation_prompt = f"""Below are documentation fragments generated from different parts of a code file. 
+Please consolidate these into a single, coherent documentation that eliminates redundancy and organizes the information logically:
+
+{combined_responses}
+
+Create a well-structured technical documentation that covers all the key aspects of the code.
+"""
+    
+    # Call Claude for consolidation
+    consolidation_request = build_claude_request(
+        model_id,
+        [{"role": "user", "content": consolidation_prompt}],
+        system_prompt=system_prompt,
+        max_tokens=4096,
+        temperature=0.3,  # Lower temperature for more consistent results
+    )
+    
+    consolidation_body = invoke_model_with_retry(bedrock_runtime, model_id, consolidation_request)
+    return consolidation_body.get("content", [{"text": "No content received"}])[0]["text"]
+
+
+def process_chunks_with_claude(
+    chunks: List[str],
+    system_prompt: str,
+    simulation: bool = True,
+    max_workers: int = 1,
+    consolidation_mode: str = "single",
+    consolidation_budget: int = DEFAULT_CONSOLIDATION_BUDGET,
+    consolidation_cache: Optional[str] = None,
+    router: Optional[ModelRouter] = None,
+    checkpoint: Optional[ChunkCheckpoint] = None,
+    model_id: str = "anthropic.claude-3-sonnet-20240229-v1:0"
+) -> str:
     """
     Process content chunks with Claude to generate documentation.
     
@@ -472,6 +571,16 @@ def process_chunks_with_claude(chunks: List[str], system_prompt: str, simulation
         chunks (list): List of content chunks
         system_prompt (str): System prompt for Claude
         simulation (bool): Whether to run in simulation mode
+        max_workers (int): Number of chunks processed concurrently (1 keeps the sequential behaviour)
+        consolidation_mode (str): "single" for one consolidation prompt, "tree" for hierarchical merging
+        consolidation_budget (int): Maximum estimated input tokens per merge call in "tree" mode
+        consolidation_cache (str): SQLite file storing merged nodes by Merkle hash; makes
+            "tree" mode incremental so re-runs only re-merge what changed
+        router (ModelRouter): Picks the model for each chunk (optional); fragments are
+            consolidated with model_id
+        checkpoint (ChunkCheckpoint): Persists each chunk result as it returns and
+            supplies the results of chunks completed by an earlier, interrupted run
+        model_id (str): Bedrock model ID
         
     Returns:
         str: Combined documentation from all chunks
@@ -488,13 +597,9 @@ def process_chunks_with_claude(chunks: List[str], system_prompt: str, simulation
         
         return "\n\n".join(all_responses)
     
-    # Real processing with Claude via AWS Bedrock
+    # Real processing with Claude via AWS Bedrock; the shared client's pool holds a connection per worker
     try:
-        import boto3
-        bedrock_runtime = boto3.client(
-            service_name="bedrock-runtime",
-            region_name="us-east-1",  # Change to your region
-        )
+        bedrock_runtime = get_bedrock_client("us-east-1", max_workers)  # Change to your region
     except ImportError:
         print("boto3 library not installed. Please install it with 'pip install boto3'.")
         print("Falling back to simulation mode.")
@@ -504,38 +609,16 @@ def process_chunks_with_claude(chunks: List[str], system_prompt: str, simulation
         print("Falling back to simulation mode.")
         return process_chunks_with_claude(chunks, system_prompt, simulation=True)
     
-    # Process chunks with Claude
-    for i, chunk in enumerate(chunks):
-        print(f"Processing chunk {i+1}/{total_chunks}...")
-        
-        # Prepare request body for Claude
-        request_body = {
-            "anthropic_version": "bedrock-2023-05-31",
-            "max_tokens": 4096,
-            "system": system_prompt,
-            "messages": [
-                {"role": "user", "content": f"Given this code chunk: \n\n{chunk}\n\nGenerate documentation."}
-            ],
-            "temperature": 0.5,
-        }
-        
-        try:
-            # Call Claude via Bedrock
-            response = bedrock_runtime.invoke_model(
-                modelId="anthropic.claude-3-sonnet-20240229-v1:0",  # Update with current model version
-                body=json.dumps(request_body)
-            )
-            
-            # Parse response
-            response_body = json.loads(response['body'].read().decode())
-            chunk_docs = response_body.get("content", [{"text": "No content received"}])[0]["text"]
-            all_responses.append(chunk_docs)
-            
-            print(f"Successfully processed chunk {i+1}")
-            
-        except Exception as e:
-            print(f"Error processing chunk {i+1}: {e}")
-            all_responses.append(f"Error processing chunk {i+1}: {str(e)}")
+    # Process chunks with Claude; executor.map yields results in chunk order
+    # regardless of which request finishes first
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        all_responses = list(executor.map(
+            lambda item: process_single_chunk(bedrock_runtime, item[1], item[0], total_chunks, system_prompt, router,
+                                              checkpoint, model_id),
+            enumerate(chunks)
+        ))
+    if router is not None:
+        print(f"Model routing: {router.summary()}")
     
     # Combine responses
     combined_responses = "\n\n".join(all_responses)
@@ -543,36 +626,28 @@ def process_chunks_with_claude(chunks: List[str], system_prompt: str, simulation
     # Create a consolidated documentation using Claude
     print("Generating consolidated documentation...")
     
-    consolidation_prompt = f"""Below are documentation fragments generated from different parts of a code file. 
-Please consolidate these into a single, coherent documentation that eliminates redundancy and organizes the information logically:
-
-{combined_responses}
-
-Create a well-structured technical documentation that covers all the key aspects of the code.
-"""
-    
     try:
-        # Call Claude for consolidation
-        consolidation_request = {
-            "anthropic_version": "bedrock-2023-05-31",
-            "max_tokens": 4096,
-            "system": system_prompt,
-            "messages": [
-                {"role": "user", "content": consolidation_prompt}
-            ],
-            "temperature": 0.3,  # Lower temperature for more consistent results
-        }
-        
-        consolidation_response = bedrock_runtime.invoke_model(
-            modelId="anthropic.claude-3-sonnet-20240229-v1:0",
-            body=json.dumps(consolidation_request)
-        )
+        if consolidation_mode == "tree" and consolidation_cache:
+            # Reuse every merged subtree whose input fragments are unchanged
+            return merkle_reduce_fragments(
+                all_responses,
+                lambda group: consolidate_fragments(bedrock_runtime, group, system_prompt, model_id),
+                ResponseCache(consolidation_cache),
+                namespace=model_id + "\n" + system_prompt,
+                token_budget=consolidation_budget,
+                max_workers=max_workers
+            )
         
-        # Parse response
-        consolidation_body = json.loads(consolidation_response['body'].read().decode())
-        final_docs = consolidation_body.get("content", [{"text": "No content received"}])[0]["text"]
+        if consolidation_mode == "tree":
+            # Merge fragments in token-budgeted groups, level by level
+            return tree_reduce_fragments(
+                all_responses,
+                lambda group: consolidate_fragments(bedrock_runtime, group, system_prompt, model_id),
+                token_budget=consolidation_budget,
+                max_workers=max_workers
+            )
         
-        return final_docs
+        return consolidate_fragments(bedrock_runtime, all_responses, system_prompt, model_id)
         
     except Exception as e:
         print(f"Error consolidating documentation: {e}")
@@ -583,7 +658,10 @@ Create a well-structured technical documentation that covers all the key aspects
 # In[11]:
 
 
-def generate_extended_documentation(basic_docs: str, follow_up_prompt: str, simulation: bool = True) -> str:
+def generate_extended_documentation(basic_docs: str, follow_up_prompt: str, simulation: bool = True,
+                                    stream_path: Optional[str] = None, parallel_sections: bool = False,
+                                    max_workers: Optional[int] = None,
+                                    model_id: str = "anthropic.claude-3-sonnet-20240229-v1:0") -> str:
     """
     Generate extended documentation based on basic documentation.
     
@@ -591,6 +669,11 @@ def generate_extended_documentation(basic_docs: str, follow_up_prompt: str, simu
         basic_docs (str): Basic documentation
         follow_up_prompt (str): Follow-up prompt for extended documentation
         simulation (bool): Whether to run in simulation mode
+        stream_path (str): If set, stream the documentation into this file as it is generated
+        parallel_sections (bool): Request each section of the follow-up prompt separately
+            and concurrently, then assemble them in prompt order (not streamed)
+        max_workers (int): Sections requested concurrently with parallel_sections (default: all of them)
+        model_id (str): Bedrock model ID
         
     Returns:
         str: Extended documentation
@@ -599,13 +682,9 @@ def generate_extended_documentation(basic_docs: str, follow_up_prompt: str, simu
         print("Simulating extended documentation generation...")
         return "# Extended Documentation (Simulation)\n\nThis is simulated extended documentation based on the basic documentation."
     
-    # Real processing with Claude via AWS Bedrock
+    # Real processing with Claude via AWS Bedrock, reusing the client (and connections) of the chunk calls
     try:
-        import boto3
-        bedrock_runtime = boto3.client(
-            service_name="bedrock-runtime",
-            region_name="us-east-1",  # Change to your region
-        )
+        bedrock_runtime = get_bedrock_client("us-east-1", max_workers or 1)  # Change to your region
     except ImportError:
         print("boto3 library not installed. Please install it with 'pip install boto3'.")
         print("Falling back to simulation mode.")
@@ -615,26 +694,39 @@ def generate_extended_documentation(basic_docs: str, follow_up_prompt: str, simu
         print("Falling back to simulation mode.")
         return generate_extended_documentation(basic_docs, follow_up_prompt, simulation=True)
     
-    try:
-        # Call Claude for extended documentation
-        extended_request = {
-            "anthropic_version": "bedrock-2023-05-31",
-            "max_tokens": 4096,
-            "messages": [
+    # The basic documentation is the stable prefix; only the follow-up prompt varies
+    def extended_request(prompt: str) -> Dict[str, Any]:
+        return build_claude_request(
+            model_id,
+            [
                 {"role": "user", "content": "Here is the basic documentation for a code file:"},
                 {"role": "assistant", "content": basic_docs},
-                {"role": "user", "content": follow_up_prompt}
+                {"role": "user", "content": prompt}
             ],
-            "temperature": 0.5,
-        }
-        
-        extended_response = bedrock_runtime.invoke_model(
-            modelId="anthropic.claude-3-sonnet-20240229-v1:0",
-            body=json.dumps(extended_request)
+            max_tokens=4096,
+            temperature=0.5,
+            cache_prefix_messages=2,
         )
+    
+    try:
+        if parallel_sections:
+            # One call per section, so the latency is that of the slowest section
+            return generate_sections(
+                follow_up_prompt,
+                lambda title, prompt: invoke_model_with_retry(
+                    bedrock_runtime, model_id, extended_request(prompt)
+                ).get("content", [{"text": "No content received"}])[0]["text"],
+                max_workers=max_workers,
+                warm_first=supports_prompt_caching(model_id)
+            )
         
-        # Parse response
-        extended_body = json.loads(extended_response['body'].read().decode())
+        # Call Claude for extended documentation
+        request_body = extended_request(follow_up_prompt)
+        if stream_path:
+            extended_body = invoke_model_stream(bedrock_runtime, model_id, request_body,
+                                                stream_path, header=SIGNATURE)
+        else:
+            extended_body = invoke_model_with_retry(bedrock_runtime, model_id, request_body)
         extended_docs = extended_body.get("content", [{"text": "No content received"}])[0]["text"]
         
         return extended_docs
@@ -644,8 +736,123 @@ def generate_extended_documentation(basic_docs: str, follow_up_prompt: str, simu
         return f"Error generating extended documentation: {str(e)}"
 
 
-# In[ ]:
-
-
+# In[12]:
+
+
+def main():
+    """Main function to run the script."""
+    args = parse_arguments()
+    
+    # Configure the shared Bedrock rate limiter for all chunk workers
+    get_rate_limiter(args.rpm, args.tpm)
+    set_max_continuations(args.max_continuations)
+    
+    input_file = args.input_file
+    output_dir = args.output_dir
+    os.makedirs(output_dir, exist_ok=True)
+    
+    # Reuse responses to identical requests from earlier runs unless disabled
+    if not args.no_cache:
+        get_response_cache(os.path.join(output_dir, "llm_response_cache.sqlite"))
+    
+    # Record call latencies so later runs can be planned
+    latency_history = get_latency_history(os.path.join(output_dir, "llm_call_history.sqlite"))
+    
+    if not os.path.isfile(input_file):
+        print(f"Input file '{input_file}' does not exist.")
+        return
+    
+    file_base_name = os.path.splitext(os.path.basename(input_file))[0]
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    
+    # Extract the cleaned file content with its "# File:" header
+    content_file = os.path.join(output_dir, f"{file_base_name}_content_{timestamp}.txt")
+    if not extract_content(input_file, content_file):
+        print(f"Nothing to document in {input_file}.")
+        return
+    
+    # Size the input and the chunks with the selected counter (counts cached with --token-cache)
+    count_tokens = get_token_counter(
+        args.token_counter,
+        cache_path=args.token_cache,
+        tokenizer_file=args.tokenizer_file,
+        bedrock_client=get_bedrock_client("us-east-1") if args.token_counter == "bedrock" else None,
+        model_id=args.model_id
+    )
+    estimate_token_size(content_file, count_tokens)
+    
+    # Simple chunks (configuration, documentation, short straight-line code) go to the fast model
+    router = ModelRouter(args.model_id, args.fast_model, count_tokens) if args.route_models else None
+    
+    # Chunk the content (the chunks are saved next to it unless the run is only planned)
+    chunks = chunk_content(content_file, args.chunk_size, args.overlap, output_dir=None if args.plan else output_dir,
+                           mode=args.chunking, count_tokens=count_tokens)
+    
+    if args.plan:
+        # Tree consolidation with a cache runs the incremental (Merkle) reduction
+        consolidation_mode = "merkle" if args.consolidation == "tree" and args.consolidation_cache else args.consolidation
+        extended_prompts = (section_prompts(REFINED_DOCS_FOLLOW_UP_PROMPT) if args.parallel_sections
+                            else [("", REFINED_DOCS_FOLLOW_UP_PROMPT)])
+        extended_tokens = [count_tokens(prompt) for _, prompt in extended_prompts]
+        plan = plan_run(
+            [count_tokens(chunk) for chunk in chunks],
+            args.model_id,
+            system_tokens=count_tokens(BASIC_DOCS_SYSTEM_PROMPT),
+            max_workers=args.workers,
+            consolidation_mode=consolidation_mode,
+            extended_input_tokens=sum(extended_tokens) // len(extended_tokens),
+            extended_calls=len(extended_tokens),
+            history=latency_history,
+            limiter=get_rate_limiter()
+        )
+        print(format_plan(plan))
+        return
+    
+    # Document each chunk; chunk results are persisted as they arrive so an interrupted run can be resumed
+    checkpoint = ChunkCheckpoint(os.path.join(output_dir, f"{file_base_name}.progress.jsonl"), resume=args.resume)
+    basic_docs = process_chunks_with_claude(
+        chunks,
+        BASIC_DOCS_SYSTEM_PROMPT,
+        simulation=args.simulate,
+        max_workers=args.workers,
+        consolidation_mode=args.consolidation,
+        consolidation_cache=args.consolidation_cache,
+        router=router,
+        checkpoint=checkpoint,
+        model_id=args.model_id
+    )
+    
+    basic_docs_path = os.path.join(output_dir, f"{file_base_name}-docs-{timestamp}.md")
+    with open(basic_docs_path, "w", encoding="utf-8") as file:
+        file.write(SIGNATURE + basic_docs)
+    print(f"Basic documentation saved to {basic_docs_path}")
+    
+    # Ask if user wants extended documentation
+    proceed = input("Do you wish to generate extended documentation? (Y/N): ")
+    if proceed.upper() == "Y":
+        extended_docs_path = os.path.join(output_dir, f"{file_base_name}-extended-docs-{timestamp}.md")
+        extended_docs = generate_extended_documentation(
+            basic_docs,
+            REFINED_DOCS_FOLLOW_UP_PROMPT,
+            simulation=args.simulate,
+            stream_path=extended_docs_path if args.stream else None,
+            parallel_sections=args.parallel_sections,
+            # All sections run at once, as in apr22_code_v2; -w only sizes the chunk workers
+            max_workers=None if args.parallel_sections else args.workers,
+            model_id=args.model_id
+        )
+        
+        # Save extended documentation (already written when streamed)
+        if not (args.stream and os.path.exists(extended_docs_path)):
+            with open(extended_docs_path, "w", encoding="utf-8") as file:
+                file.write(SIGNATURE + extended_docs)
+        print(f"Extended documentation saved to {extended_docs_path}")
+    
+    print("Documentation generation complete!")
+    print(f"Token usage: {usage_tracker.summary()}")
+    print(f"Truncation: {truncation_tracker.summary()}")
+    print(f"Connections: {connection_stats.summary()}")
 
 
+if __name__ == "__main__":
+    main()
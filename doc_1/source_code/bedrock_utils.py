@@ -0,0 +1,1161 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Shared helpers for calling models through AWS Bedrock.
+
+The documentation scripts build their own request bodies; these helpers take
+care of everything around the actual invoke_model call so that every script
+gets the same rate limiting, retry and response caching behaviour.
+build_claude_request assembles Messages API request bodies, marking stable
+prompt prefixes as cacheable on models that support Bedrock prompt caching.
+Responses cut off at max_tokens are continued by the invoke helpers and the
+truncation rate of a run is kept in truncation_tracker.
+"""
+
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+
+# Default account budgets for a single model; override per run where needed
+DEFAULT_REQUESTS_PER_MINUTE = 50
+DEFAULT_TOKENS_PER_MINUTE = 200000
+
+# Default limits for the on-disk response cache
+DEFAULT_CACHE_MAX_SIZE_MB = 512
+DEFAULT_CACHE_MAX_AGE_DAYS = 30
+
+# Latency model used until a model has enough recorded calls
+DEFAULT_CALL_OVERHEAD_SECONDS = 2.0
+DEFAULT_OUTPUT_TOKENS_PER_SECOND = 40.0
+MIN_LATENCY_SAMPLES = 5
+
+# Continuation requests made for a response cut off at max_tokens, unless configured otherwise
+DEFAULT_MAX_CONTINUATIONS = 2
+
+# botocore's default HTTP connection pool size per client
+DEFAULT_MAX_POOL_CONNECTIONS = 10
+
+# Model families that accept cache_control blocks (Bedrock prompt caching)
+PROMPT_CACHING_MODELS = (
+    "claude-3-5-haiku",
+    "claude-3-7-sonnet",
+    "claude-sonnet-4",
+    "claude-opus-4",
+    "claude-haiku-4",
+)
+
+# Error codes Bedrock returns when a request should simply be tried again later
+RETRYABLE_ERROR_CODES = {
+    "ThrottlingException",
+    "TooManyRequestsException",
+    "ServiceUnavailableException",
+    "ModelNotReadyException",
+}
+
+
+class RateLimiter:
+    """
+    Token-bucket limiter enforcing requests-per-minute and tokens-per-minute budgets.
+
+    Both buckets start full and refill continuously, so short bursts are allowed
+    while the average rate stays within the configured budget. The limiter is
+    thread-safe and meant to be shared by every caller in the process.
+    """
+
+    def __init__(self, requests_per_minute: int = DEFAULT_REQUESTS_PER_MINUTE,
+                 tokens_per_minute: int = DEFAULT_TOKENS_PER_MINUTE):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._request_allowance = float(requests_per_minute)
+        self._token_allowance = float(tokens_per_minute)
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        self._request_allowance = min(
+            self.requests_per_minute,
+            self._request_allowance + elapsed * self.requests_per_minute / 60.0
+        )
+        self._token_allowance = min(
+            self.tokens_per_minute,
+            self._token_allowance + elapsed * self.tokens_per_minute / 60.0
+        )
+
+    def acquire(self, tokens: int = 0) -> float:
+        """
+        Block until one request and the given number of tokens fit the budget.
+
+        Args:
+            tokens (int): Estimated tokens the request will consume
+
+        Returns:
+            float: Seconds spent waiting
+        """
+        # A single request larger than the whole budget would never fit otherwise
+        tokens = min(tokens, self.tokens_per_minute)
+        waited = 0.0
+
+        while True:
+            with self._lock:
+                self._refill()
+                if self._request_allowance >= 1 and self._token_allowance >= tokens:
+                    self._request_allowance -= 1
+                    self._token_allowance -= tokens
+                    return waited
+
+                wait = max(
+                    (1 - self._request_allowance) * 60.0 / self.requests_per_minute,
+                    (tokens - self._token_allowance) * 60.0 / self.tokens_per_minute,
+                    0.01
+                )
+
+            time.sleep(wait)
+            waited += wait
+
+    def settle(self, reserved_tokens: int, used_tokens: int) -> None:
+        """
+        Correct the token bucket once the real usage of a request is known.
+
+        Args:
+            reserved_tokens (int): Tokens taken by acquire()
+            used_tokens (int): Tokens actually reported by the model
+        """
+        with self._lock:
+            self._token_allowance = min(
+                self.tokens_per_minute,
+                self._token_allowance + reserved_tokens - used_tokens
+            )
+
+
+_shared_limiter = None
+_shared_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter(requests_per_minute: Optional[int] = None,
+                     tokens_per_minute: Optional[int] = None) -> RateLimiter:
+    """
+    Return the process-wide rate limiter, creating it on first use.
+
+    Passing budgets reconfigures the shared limiter, so a script can set them
+    once from its command-line arguments and every helper picks them up.
+
+    Args:
+        requests_per_minute (int): Requests-per-minute budget
+        tokens_per_minute (int): Tokens-per-minute budget
+
+    Returns:
+        RateLimiter: Shared limiter instance
+    """
+    global _shared_limiter
+
+    with _shared_limiter_lock:
+        if _shared_limiter is None:
+            _shared_limiter = RateLimiter(
+                requests_per_minute or DEFAULT_REQUESTS_PER_MINUTE,
+                tokens_per_minute or DEFAULT_TOKENS_PER_MINUTE
+            )
+        else:
+            if requests_per_minute:
+                _shared_limiter.requests_per_minute = requests_per_minute
+            if tokens_per_minute:
+                _shared_limiter.tokens_per_minute = tokens_per_minute
+        return _shared_limiter
+
+
+class ResponseCache:
+    """
+    Persistent, content-addressed cache of model responses stored in SQLite.
+
+    Entries are keyed by a hash of the model id and the full request body
+    (system prompt, messages, temperature, max_tokens), so any change to the
+    prompt or its inputs is a miss. Entries older than max_age_days are dropped,
+    and the least recently used entries are evicted once the stored responses
+    exceed max_size_mb.
+    """
+
+    def __init__(self, db_path: str, max_size_mb: float = DEFAULT_CACHE_MAX_SIZE_MB,
+                 max_age_days: float = DEFAULT_CACHE_MAX_AGE_DAYS):
+        self.db_path = db_path
+        self.max_size_bytes = int(max_size_mb * 1024 * 1024)
+        self.max_age_seconds = max_age_days * 24 * 3600
+        self.hits = 0
+        self.misses = 0
+        self._puts_since_eviction = 0
+        self._lock = threading.Lock()
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, response TEXT NOT NULL, size INTEGER NOT NULL, "
+            "created_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.commit()
+        self.evict()
+
+    @staticmethod
+    def make_key(model_id: str, request_body: Dict[str, Any]) -> str:
+        """
+        Build the cache key for a request.
+
+        Args:
+            model_id (str): Model ID the request is sent to
+            request_body (dict): Request body for the model
+
+        Returns:
+            str: Hex SHA-256 digest identifying the request
+        """
+        payload = json.dumps({"model_id": model_id, "request": request_body}, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Return the stored response for a key, or None on a miss or expired entry.
+
+        Args:
+            key (str): Cache key from make_key()
+
+        Returns:
+            dict: Parsed response body, or None
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row is None or now - row[1] > self.max_age_seconds:
+                self.misses += 1
+                return None
+
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return json.loads(row[0])
+
+    def put(self, key: str, response_body: Dict[str, Any]) -> None:
+        """
+        Store a response, evicting old entries every so often.
+
+        Args:
+            key (str): Cache key from make_key()
+            response_body (dict): Parsed response body to store
+        """
+        data = json.dumps(response_body)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, size, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, data, len(data), now, now)
+            )
+            self._conn.commit()
+            self._puts_since_eviction += 1
+            evict_now = self._puts_since_eviction >= 100
+
+        if evict_now:
+            self.evict()
+
+    def evict(self) -> int:
+        """
+        Drop expired entries, then least recently used ones until under the size limit.
+
+        Returns:
+            int: Number of entries removed
+        """
+        with self._lock:
+            self._puts_since_eviction = 0
+            cursor = self._conn.execute(
+                "DELETE FROM responses WHERE created_at < ?", (time.time() - self.max_age_seconds,)
+            )
+            removed = cursor.rowcount
+
+            total_size = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total_size > self.max_size_bytes:
+                excess = total_size - self.max_size_bytes
+                stale_keys = []
+                for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY last_access"):
+                    if excess <= 0:
+                        break
+                    stale_keys.append((key,))
+                    excess -= size
+                self._conn.executemany("DELETE FROM responses WHERE key = ?", stale_keys)
+                removed += len(stale_keys)
+
+            self._conn.commit()
+            return removed
+
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_response_cache(db_path: Optional[str] = None,
+                       max_size_mb: float = DEFAULT_CACHE_MAX_SIZE_MB,
+                       max_age_days: float = DEFAULT_CACHE_MAX_AGE_DAYS) -> Optional[ResponseCache]:
+    """
+    Return the process-wide response cache.
+
+    The cache is off until a script opens it by passing db_path; after that every
+    call to invoke_model_with_retry reads from and writes to it.
+
+    Args:
+        db_path (str): SQLite file to open (None returns the current cache)
+        max_size_mb (float): Size limit for stored responses in megabytes
+        max_age_days (float): Age after which entries are dropped
+
+    Returns:
+        ResponseCache: Shared cache instance, or None if caching is disabled
+    """
+    global _shared_cache
+
+    with _shared_cache_lock:
+        if db_path and (_shared_cache is None or _shared_cache.db_path != db_path):
+            _shared_cache = ResponseCache(db_path, max_size_mb, max_age_days)
+            print(f"Using LLM response cache at {db_path}")
+        return _shared_cache
+
+
+class LatencyHistory:
+    """
+    Persistent record of model call latencies, stored in SQLite.
+
+    Every uncached call is recorded with its token usage and wall time (from
+    the successful attempt, so rate-limiter waits and retries are not
+    counted). Calls of a model are fitted to overhead + output tokens / rate,
+    which lets a run be planned from how the model has actually performed.
+    """
+
+    def __init__(self, db_path: str, max_samples: int = 500):
+        """
+        Args:
+            db_path (str): SQLite file holding the history
+            max_samples (int): Number of most recent calls per model used for estimates
+        """
+        self.db_path = db_path
+        self.max_samples = max_samples
+        self._lock = threading.Lock()
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS calls ("
+            "model_id TEXT NOT NULL, input_tokens INTEGER NOT NULL, output_tokens INTEGER NOT NULL, "
+            "seconds REAL NOT NULL, recorded_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS calls_by_model ON calls (model_id, recorded_at)")
+        self._conn.commit()
+
+    def record(self, model_id: str, input_tokens: int, output_tokens: int, seconds: float) -> None:
+        """
+        Store one completed call.
+
+        Args:
+            model_id (str): Model the call was sent to
+            input_tokens (int): Input tokens reported by the model (including prompt-cache tokens)
+            output_tokens (int): Output tokens reported by the model
+            seconds (float): Wall time of the call
+        """
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO calls (model_id, input_tokens, output_tokens, seconds, recorded_at) VALUES (?, ?, ?, ?, ?)",
+                (model_id, input_tokens, output_tokens, seconds, time.time())
+            )
+            self._conn.commit()
+
+    def estimate(self, model_id: str) -> Dict[str, Any]:
+        """
+        Fit the recent calls of a model to a latency model.
+
+        Args:
+            model_id (str): Model ID
+
+        Returns:
+            dict: "calls" (samples used), "overhead_seconds", "output_tokens_per_second"
+                and "mean_output_tokens" (None without history); defaults are
+                returned while fewer than MIN_LATENCY_SAMPLES calls are recorded
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT output_tokens, seconds FROM calls WHERE model_id = ? ORDER BY recorded_at DESC LIMIT ?",
+                (model_id, self.max_samples)
+            ).fetchall()
+
+        estimate = {
+            "calls": len(rows),
+            "overhead_seconds": DEFAULT_CALL_OVERHEAD_SECONDS,
+            "output_tokens_per_second": DEFAULT_OUTPUT_TOKENS_PER_SECOND,
+            "mean_output_tokens": sum(row[0] for row in rows) / len(rows) if rows else None,
+        }
+        if len(rows) < MIN_LATENCY_SAMPLES:
+            return estimate
+
+        # Least-squares line through (output tokens, seconds)
+        mean_tokens = estimate["mean_output_tokens"]
+        mean_seconds = sum(row[1] for row in rows) / len(rows)
+        spread = sum((tokens - mean_tokens) ** 2 for tokens, _ in rows)
+        slope = sum((tokens - mean_tokens) * (seconds - mean_seconds) for tokens, seconds in rows) / spread if spread else 0.0
+        if slope > 0:
+            estimate["overhead_seconds"] = max(0.0, mean_seconds - slope * mean_tokens)
+            estimate["output_tokens_per_second"] = 1.0 / slope
+        else:
+            # Output size does not explain the latency; every call takes about the mean
+            estimate["overhead_seconds"] = mean_seconds
+            estimate["output_tokens_per_second"] = float("inf")
+        return estimate
+
+    def predict_seconds(self, model_id: str, output_tokens: float) -> float:
+        """
+        Predict the wall time of one call.
+
+        Args:
+            model_id (str): Model ID
+            output_tokens (float): Expected output tokens
+
+        Returns:
+            float: Predicted seconds
+        """
+        estimate = self.estimate(model_id)
+        return estimate["overhead_seconds"] + output_tokens / estimate["output_tokens_per_second"]
+
+
+_shared_history = None
+_shared_history_lock = threading.Lock()
+
+
+def get_latency_history(db_path: Optional[str] = None) -> Optional[LatencyHistory]:
+    """
+    Return the process-wide latency history.
+
+    Recording is off until a script opens the history by passing db_path;
+    after that every uncached model call is added to it.
+
+    Args:
+        db_path (str): SQLite file to open (None returns the current history)
+
+    Returns:
+        LatencyHistory: Shared history instance, or None if not opened
+    """
+    global _shared_history
+
+    with _shared_history_lock:
+        if db_path and (_shared_history is None or _shared_history.db_path != db_path):
+            _shared_history = LatencyHistory(db_path)
+        return _shared_history
+
+
+def record_call_latency(model_id: str, usage: Dict[str, Any], seconds: float) -> None:
+    """
+    Add a completed call to the shared latency history, if one is open.
+
+    Args:
+        model_id (str): Model the call was sent to
+        usage (dict): "usage" entry of the response body
+        seconds (float): Wall time of the call
+    """
+    history = get_latency_history()
+    if history is None or not usage:
+        return
+    input_tokens = sum(usage.get(field) or 0 for field in
+                       ("input_tokens", "cache_read_input_tokens", "cache_creation_input_tokens"))
+    history.record(model_id, input_tokens, usage.get("output_tokens") or 0, seconds)
+
+
+class ConnectionStats:
+    """
+    Counts of HTTP requests and of the connections that served them.
+
+    The counts are read from the urllib3 connection pools of the shared
+    clients, which count the connections they open (each a TLS handshake) and
+    the requests they send, so no logger is touched. A connection reopened
+    after the server dropped it is not counted as opened.
+    """
+
+    def __init__(self):
+        self._clients: List[Any] = []
+        self._lock = threading.Lock()
+
+    def track(self, client: Any) -> None:
+        """
+        Include the connection pools of a client in the counts.
+
+        Args:
+            client (boto3.client): Client created by get_bedrock_client()
+        """
+        with self._lock:
+            self._clients.append(client)
+
+    def _pools(self) -> List[Any]:
+        """Return the urllib3 connection pools of the tracked clients."""
+        with self._lock:
+            clients = list(self._clients)
+        pools = []
+        for client in clients:
+            session = getattr(getattr(client, "_endpoint", None), "http_session", None)
+            managers = [getattr(session, "_manager", None), *getattr(session, "_proxy_managers", {}).values()]
+            for manager in managers:
+                container = getattr(manager, "pools", None)
+                if container is None:
+                    continue
+                for key in container.keys():
+                    pool = container.get(key)
+                    if pool is not None:
+                        pools.append(pool)
+        return pools
+
+    def counts(self) -> Dict[str, int]:
+        """
+        Sum the counters of the tracked connection pools.
+
+        Returns:
+            dict: "requests", "connections" (opened) and "pool_size" (connections
+                the pools keep open for reuse)
+        """
+        counts = {"requests": 0, "connections": 0, "pool_size": 0}
+        for pool in self._pools():
+            counts["requests"] += getattr(pool, "num_requests", 0)
+            counts["connections"] += getattr(pool, "num_connections", 0)
+            counts["pool_size"] += getattr(getattr(pool, "pool", None), "maxsize", 0)
+        return counts
+
+    def summary(self) -> str:
+        """
+        Return a one-line summary of connection reuse.
+
+        Returns:
+            str: Human-readable connection summary
+        """
+        counts = self.counts()
+        requests, opened = counts["requests"], counts["connections"]
+        reused = max(0, requests - opened)
+        reuse_rate = reused / requests * 100 if requests else 0.0
+        summary = (f"{requests} HTTP requests, {opened} connections opened, "
+                   f"{reuse_rate:.1f}% served on a reused connection")
+        if opened > counts["pool_size"]:
+            # Connections beyond the pool size are closed after one use instead of being kept
+            summary += f", {opened - counts['pool_size']} more than the pool keeps ({counts['pool_size']})"
+        return summary
+
+
+connection_stats = ConnectionStats()
+
+_shared_clients: Dict[str, Any] = {}
+_shared_clients_lock = threading.Lock()
+
+
+def get_bedrock_client(region_name: str = "us-east-1", max_workers: int = 1) -> Any:
+    """
+    Return the process-wide Bedrock runtime client for a region, creating it on first use.
+
+    boto3 clients are thread-safe, so every caller shares one client and its
+    pool of open connections instead of paying a TLS handshake per new client.
+    The pool holds at least max_workers connections, so concurrent calls do
+    not queue for a connection or discard one after use; asking for more
+    workers than the current client was sized for replaces it with a larger one.
+
+    Args:
+        region_name (str): AWS region
+        max_workers (int): Number of calls the caller makes concurrently
+
+    Returns:
+        boto3.client: Shared bedrock-runtime client
+    """
+    pool_size = max(DEFAULT_MAX_POOL_CONNECTIONS, max_workers)
+
+    with _shared_clients_lock:
+        client = _shared_clients.get(region_name)
+        if client is not None and client.meta.config.max_pool_connections >= pool_size:
+            return client
+
+        # Imported here: scripts that only plan or simulate never need boto3
+        import boto3
+        from botocore.config import Config
+
+        client = boto3.client(
+            service_name="bedrock-runtime",
+            region_name=region_name,
+            # botocore makes a single attempt; throttled calls are retried by _call_with_backoff under the limiter
+            config=Config(max_pool_connections=pool_size, tcp_keepalive=True,
+                          retries={"mode": "standard", "total_max_attempts": 1})
+        )
+        connection_stats.track(client)
+        _shared_clients[region_name] = client
+        return client
+
+
+def supports_prompt_caching(model_id: str) -> bool:
+    """
+    Check whether a Bedrock model accepts prompt caching (cache_control) blocks.
+
+    Args:
+        model_id (str): Model ID or inference profile ID
+
+    Returns:
+        bool: True if stable prefixes can be marked as cacheable
+    """
+    return any(family in model_id for family in PROMPT_CACHING_MODELS)
+
+
+def build_claude_request(
+    model_id: str,
+    messages: List[Dict[str, Any]],
+    system_prompt: Optional[str] = None,
+    max_tokens: int = 4096,
+    temperature: float = 0.5,
+    cache_prefix_messages: int = 0,
+    cache_prefix_blocks: int = 0
+) -> Dict[str, Any]:
+    """
+    Build an Anthropic Messages API request body for Bedrock.
+
+    On models that support prompt caching, the system prompt and the first
+    cache_prefix_messages messages are marked as a cacheable prefix, so
+    requests repeating them (every chunk, or the extended request after the
+    basic one) skip re-processing those input tokens. On other models the body
+    is identical to the plain request format.
+
+    Args:
+        model_id (str): Model ID the request will be sent to
+        messages (list): Conversation messages
+        system_prompt (str): System prompt (optional)
+        max_tokens (int): Maximum tokens for model response
+        temperature (float): Temperature for generation
+        cache_prefix_messages (int): Number of leading messages that are stable across requests
+        cache_prefix_blocks (int): Number of leading content blocks of the last of those
+            messages that are stable (0: all of them), for a shared context followed
+            by a varying instruction in the same message
+
+    Returns:
+        dict: Request body for invoke_model
+    """
+    caching = supports_prompt_caching(model_id)
+    request_body = {
+        "anthropic_version": "bedrock-2023-05-31",
+        "max_tokens": max_tokens,
+    }
+
+    if system_prompt:
+        if caching:
+            request_body["system"] = [
+                {"type": "text", "text": system_prompt, "cache_control": {"type": "ephemeral"}}
+            ]
+        else:
+            request_body["system"] = system_prompt
+
+    request_messages = [dict(message) for message in messages]
+    if caching and cache_prefix_messages:
+        # The cache breakpoint goes on the last block of the stable prefix
+        prefix_end = request_messages[min(cache_prefix_messages, len(request_messages)) - 1]
+        content = prefix_end["content"]
+        if isinstance(content, str):
+            content = [{"type": "text", "text": content}]
+        content = [dict(block) for block in content]
+        content[cache_prefix_blocks - 1 if cache_prefix_blocks else -1]["cache_control"] = {"type": "ephemeral"}
+        prefix_end["content"] = content
+
+    request_body["messages"] = request_messages
+    request_body["temperature"] = temperature
+    return request_body
+
+
+class UsageTracker:
+    """
+    Thread-safe running totals of token usage reported by the model.
+
+    Prompt-cache reads and writes are tracked separately from regular input
+    tokens, so a run can report how much of its input was served from cache.
+    """
+
+    FIELDS = ("input_tokens", "output_tokens", "cache_read_input_tokens", "cache_creation_input_tokens")
+
+    def __init__(self):
+        self.requests = 0
+        self.totals = {field: 0 for field in self.FIELDS}
+        self._lock = threading.Lock()
+
+    def record(self, usage: Dict[str, Any]) -> None:
+        """
+        Add the usage block of one response to the totals.
+
+        Args:
+            usage (dict): "usage" entry of a response body
+        """
+        with self._lock:
+            self.requests += 1
+            for field in self.FIELDS:
+                self.totals[field] += usage.get(field) or 0
+
+    def summary(self) -> str:
+        """
+        Return a one-line summary of token usage and prompt-cache hits.
+
+        Returns:
+            str: Human-readable usage summary
+        """
+        with self._lock:
+            cache_read = self.totals["cache_read_input_tokens"]
+            cache_write = self.totals["cache_creation_input_tokens"]
+            prompt_tokens = self.totals["input_tokens"] + cache_read + cache_write
+            hit_rate = cache_read / prompt_tokens * 100 if prompt_tokens else 0.0
+            return (f"{self.requests} model calls, {self.totals['input_tokens']} uncached input tokens, "
+                    f"{self.totals['output_tokens']} output tokens, prompt cache: {cache_read} tokens read "
+                    f"(hit), {cache_write} tokens written (miss), {hit_rate:.1f}% of input served from cache")
+
+
+usage_tracker = UsageTracker()
+
+
+class TruncationTracker:
+    """
+    Thread-safe counts of responses cut off at max_tokens and of the continuations requested for them.
+    """
+
+    def __init__(self):
+        self.responses = 0
+        self.truncated = 0
+        self.continuations = 0
+        self.still_truncated = 0
+        self._lock = threading.Lock()
+
+    def record(self, truncated: bool, continuations: int, still_truncated: bool) -> None:
+        """
+        Add one response, after any continuations, to the counts.
+
+        Args:
+            truncated (bool): The first call stopped at max_tokens
+            continuations (int): Continuation calls made for it
+            still_truncated (bool): The last continuation stopped at max_tokens too
+        """
+        with self._lock:
+            self.responses += 1
+            self.truncated += truncated
+            self.continuations += continuations
+            self.still_truncated += still_truncated
+
+    def summary(self) -> str:
+        """
+        Return a one-line summary of truncated responses.
+
+        Returns:
+            str: Human-readable truncation summary
+        """
+        with self._lock:
+            rate = self.truncated / self.responses * 100 if self.responses else 0.0
+            return (f"{self.truncated} of {self.responses} responses stopped at max_tokens ({rate:.1f}%), "
+                    f"{self.continuations} continuation calls, {self.still_truncated} still truncated "
+                    f"after the continuation limit")
+
+
+truncation_tracker = TruncationTracker()
+
+_max_continuations = DEFAULT_MAX_CONTINUATIONS
+
+
+def set_max_continuations(max_continuations: int) -> None:
+    """
+    Set how many continuation calls the invoke helpers make for a response cut off at max_tokens.
+
+    Args:
+        max_continuations (int): Continuation calls per response (0 disables continuation)
+    """
+    global _max_continuations
+    _max_continuations = max(0, max_continuations)
+
+
+def _response_text(body: Dict[str, Any]) -> str:
+    """Join the text blocks of a response body (or of a message's content)."""
+    content = body.get("content", "")
+    if isinstance(content, str):
+        return content
+    return "".join(block.get("text", "") for block in content if block.get("type", "text") == "text")
+
+
+def continue_truncated_response(
+    request_body: Dict[str, Any],
+    response_body: Dict[str, Any],
+    invoke: Any,
+    max_continuations: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Complete a Messages API response that stopped at max_tokens.
+
+    Each continuation resends the request with the text so far as a prefilled
+    assistant turn, so the model picks up where it was cut off; the request
+    prefix is unchanged, so a cached prompt prefix is read from the cache. The
+    texts are joined and the usage summed; other request formats are
+    returned unchanged.
+
+    Args:
+        request_body (dict): Request that produced the response
+        response_body (dict): Parsed response body
+        invoke (callable): Sends a request body and returns the parsed response
+        max_continuations (int): Maximum continuation calls (default: set_max_continuations())
+
+    Returns:
+        dict: The response with the continued text, the last stop_reason, the
+            summed usage and the number of "continuations" made
+    """
+    if "messages" not in request_body:
+        return response_body
+    if max_continuations is None:
+        max_continuations = _max_continuations
+
+    truncated = response_body.get("stop_reason") == "max_tokens"
+    messages = list(request_body["messages"])
+    # A prefilled assistant turn is not part of the response text; continuations extend it
+    prefill = _response_text(messages.pop()) if messages and messages[-1]["role"] == "assistant" else ""
+    text = _response_text(response_body)
+    usage = dict(response_body.get("usage") or {})
+
+    continuations = 0
+    while response_body.get("stop_reason") == "max_tokens" and continuations < max_continuations:
+        # The API rejects a final assistant turn ending in whitespace
+        partial = (prefill + text).rstrip()
+        if not partial:
+            break
+        continuations += 1
+        print(f"Response stopped at max_tokens, requesting continuation {continuations}/{max_continuations}...")
+        response_body = invoke(dict(request_body, messages=messages + [{"role": "assistant", "content": partial}]))
+        text += _response_text(response_body)
+        for field, value in (response_body.get("usage") or {}).items():
+            if isinstance(value, (int, float)):
+                usage[field] = usage.get(field, 0) + value
+
+    still_truncated = response_body.get("stop_reason") == "max_tokens"
+    truncation_tracker.record(truncated, continuations, still_truncated)
+    if not continuations:
+        return response_body
+    return dict(response_body, content=[{"type": "text", "text": text}], usage=usage, continuations=continuations)
+
+
+def estimate_request_tokens(request_body: Dict[str, Any]) -> int:
+    """
+    Estimate the tokens a request will consume against the per-minute budget.
+
+    Bedrock reserves max_tokens for the output up front, so it is counted in
+    full next to the (approximately 4 characters per token) input size.
+
+    Args:
+        request_body (dict): Request body passed to invoke_model
+
+    Returns:
+        int: Estimated token count
+    """
+    input_tokens = len(json.dumps(request_body)) // 4
+    return input_tokens + int(request_body.get("max_tokens", 0))
+
+
+def get_error_code(error: Exception) -> str:
+    """
+    Return the Bedrock error code of an exception, falling back to its class name.
+
+    Args:
+        error (Exception): Exception raised by the Bedrock client
+
+    Returns:
+        str: Error code such as "ThrottlingException"
+    """
+    response = getattr(error, "response", None)
+    if isinstance(response, dict):
+        error_code = response.get("Error", {}).get("Code")
+        if error_code:
+            return error_code
+
+    return type(error).__name__
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """
+    Check whether an invoke_model error is a throttling or transient error.
+
+    Args:
+        error (Exception): Exception raised by the Bedrock client
+
+    Returns:
+        bool: True if the call should be retried
+    """
+    return get_error_code(error) in RETRYABLE_ERROR_CODES
+
+
+def invoke_model_with_retry(
+    bedrock_client: Any,
+    model_id: str,
+    request_body: Dict[str, Any],
+    limiter: Optional[RateLimiter] = None,
+    cache: Optional[ResponseCache] = None,
+    max_retries: int = 6,
+    base_delay: float = 1.0,
+    max_delay: float = 60.0,
+    max_continuations: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Invoke a Bedrock model under the shared rate limiter, retrying throttled calls.
+
+    Responses already in the response cache are returned without calling the
+    model. Throttling and transient errors are retried with full-jitter
+    exponential backoff; any other error, or running out of retries, is raised
+    to the caller. A Messages API response cut off at max_tokens is continued
+    (see continue_truncated_response) and returned as one response.
+
+    Args:
+        bedrock_client: Initialized AWS Bedrock client
+        model_id (str): Model ID to use
+        request_body (dict): Request body for the model
+        limiter (RateLimiter): Limiter to use (defaults to the shared limiter)
+        cache (ResponseCache): Cache to use (defaults to the shared cache, if opened)
+        max_retries (int): Maximum number of retries for throttled calls
+        base_delay (float): Initial backoff delay in seconds
+        max_delay (float): Upper bound for a single backoff delay in seconds
+        max_continuations (int): Continuation calls for a truncated response
+            (default: set_max_continuations())
+
+    Returns:
+        dict: Parsed JSON response body
+    """
+    response_body = _invoke_model(bedrock_client, model_id, request_body, limiter, cache,
+                                  max_retries, base_delay, max_delay)
+    return continue_truncated_response(
+        request_body, response_body,
+        lambda body: _invoke_model(bedrock_client, model_id, body, limiter, cache, max_retries, base_delay, max_delay),
+        max_continuations
+    )
+
+
+def _invoke_model(
+    bedrock_client: Any,
+    model_id: str,
+    request_body: Dict[str, Any],
+    limiter: Optional[RateLimiter],
+    cache: Optional[ResponseCache],
+    max_retries: int,
+    base_delay: float,
+    max_delay: float
+) -> Dict[str, Any]:
+    """
+    One invoke_model call through the response cache, rate limiter and retries.
+    """
+    cache = cache or get_response_cache()
+    cache_key = None
+    if cache is not None:
+        cache_key = cache.make_key(model_id, request_body)
+        cached_body = cache.get(cache_key)
+        if cached_body is not None:
+            return cached_body
+
+    limiter = limiter or get_rate_limiter()
+    reserved_tokens = estimate_request_tokens(request_body)
+
+    response, call_start = _call_with_backoff(
+        bedrock_client.invoke_model, model_id, request_body, limiter, reserved_tokens,
+        max_retries, base_delay, max_delay
+    )
+    response_body = json.loads(response['body'].read().decode())
+
+    # Give back whatever part of the reservation the call did not use
+    usage = response_body.get("usage", {})
+    if usage:
+        limiter.settle(reserved_tokens, usage.get("input_tokens", 0) + usage.get("output_tokens", 0))
+        usage_tracker.record(usage)
+        record_call_latency(model_id, usage, time.monotonic() - call_start)
+
+    if cache is not None:
+        cache.put(cache_key, response_body)
+
+    return response_body
+
+
+def invoke_model_stream(
+    bedrock_client: Any,
+    model_id: str,
+    request_body: Dict[str, Any],
+    output_path: str,
+    header: str = "",
+    limiter: Optional[RateLimiter] = None,
+    cache: Optional[ResponseCache] = None,
+    max_retries: int = 6,
+    base_delay: float = 1.0,
+    max_delay: float = 60.0,
+    max_continuations: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Invoke a Claude model with invoke_model_with_response_stream, writing text as it arrives.
+
+    The output file is written and flushed after every delta, so a crash or
+    timeout late in generation keeps everything received so far (followed by
+    an "interrupted" marker). Rate limiting, retries before the stream starts,
+    the response cache and continuation of a response cut off at max_tokens
+    behave as in invoke_model_with_retry; continuations are streamed onto the
+    end of the same file.
+
+    Args:
+        bedrock_client: Initialized AWS Bedrock client
+        model_id (str): Model ID to use (Anthropic Messages API models only)
+        request_body (dict): Request body for the model
+        output_path (str): Markdown file the text is streamed into
+        header (str): Text written at the top of the file (e.g. the signature)
+        limiter (RateLimiter): Limiter to use (defaults to the shared limiter)
+        cache (ResponseCache): Cache to use (defaults to the shared cache, if opened)
+        max_retries (int): Maximum number of retries for throttled calls
+        base_delay (float): Initial backoff delay in seconds
+        max_delay (float): Upper bound for a single backoff delay in seconds
+        max_continuations (int): Continuation calls for a truncated response
+            (default: set_max_continuations())
+
+    Returns:
+        dict: Response body in the invoke_model format, with an extra "metrics"
+            entry holding time_to_first_token and total_time in seconds (of the last call)
+    """
+    response_body = _stream_model(bedrock_client, model_id, request_body, output_path, header, "w",
+                                  limiter, cache, max_retries, base_delay, max_delay)
+    return continue_truncated_response(
+        request_body, response_body,
+        lambda body: _stream_model(bedrock_client, model_id, body, output_path, "", "a",
+                                   limiter, cache, max_retries, base_delay, max_delay),
+        max_continuations
+    )
+
+
+def _stream_model(
+    bedrock_client: Any,
+    model_id: str,
+    request_body: Dict[str, Any],
+    output_path: str,
+    header: str,
+    file_mode: str,
+    limiter: Optional[RateLimiter],
+    cache: Optional[ResponseCache],
+    max_retries: int,
+    base_delay: float,
+    max_delay: float
+) -> Dict[str, Any]:
+    """
+    One streamed call through the response cache, rate limiter and retries, written
+    to output_path (file_mode "a" appends a continuation).
+    """
+    cache = cache or get_response_cache()
+    cache_key = None
+    if cache is not None:
+        cache_key = cache.make_key(model_id, request_body)
+        cached_body = cache.get(cache_key)
+        if cached_body is not None:
+            with open(output_path, file_mode, encoding="utf-8") as outfile:
+                outfile.write(header + cached_body.get("content", [{"text": ""}])[0]["text"])
+            return cached_body
+
+    limiter = limiter or get_rate_limiter()
+    reserved_tokens = estimate_request_tokens(request_body)
+
+    start_time = time.monotonic()
+    response, call_start = _call_with_backoff(
+        bedrock_client.invoke_model_with_response_stream, model_id, request_body, limiter,
+        reserved_tokens, max_retries, base_delay, max_delay
+    )
+
+    text_parts = []
+    usage = {}
+    stop_reason = None
+    first_token_time = None
+
+    with open(output_path, file_mode, encoding="utf-8") as outfile:
+        outfile.write(header)
+        outfile.flush()
+
+        try:
+            for event in response["body"]:
+                chunk = event.get("chunk")
+                if not chunk:
+                    continue
+
+                data = json.loads(chunk["bytes"])
+                event_type = data.get("type")
+
+                if event_type == "message_start":
+                    usage.update(data.get("message", {}).get("usage", {}))
+                elif event_type == "content_block_delta" and data["delta"].get("type") == "text_delta":
+                    if first_token_time is None:
+                        first_token_time = time.monotonic() - start_time
+                    text_parts.append(data["delta"]["text"])
+                    outfile.write(data["delta"]["text"])
+                    outfile.flush()
+                elif event_type == "message_delta":
+                    stop_reason = data.get("delta", {}).get("stop_reason", stop_reason)
+                    usage.update(data.get("usage", {}))
+        except Exception as e:
+            print(f"Streaming interrupted ({get_error_code(e)}); partial output kept in {output_path}")
+            outfile.write(f"\n\n<!-- Generation interrupted: {e} -->\n")
+            stop_reason = "error"
+
+    total_time = time.monotonic() - start_time
+    ttft_text = f"{first_token_time:.2f}s" if first_token_time is not None else "n/a"
+    print(f"Streamed {len(text_parts)} deltas to {output_path} (time to first token: {ttft_text}, total: {total_time:.2f}s)")
+
+    if usage:
+        limiter.settle(reserved_tokens, usage.get("input_tokens", 0) + usage.get("output_tokens", 0))
+        usage_tracker.record(usage)
+        if stop_reason != "error":
+            record_call_latency(model_id, usage, time.monotonic() - call_start)
+
+    response_body = {
+        "content": [{"type": "text", "text": "".join(text_parts)}],
+        "stop_reason": stop_reason,
+        "usage": usage,
+    }
+
+    if cache is not None and stop_reason != "error":
+        cache.put(cache_key, response_body)
+
+    response_body["metrics"] = {"time_to_first_token": first_token_time, "total_time": total_time}
+    return response_body
+
+
+def _call_with_backoff(
+    invoke: Any,
+    model_id: str,
+    request_body: Dict[str, Any],
+    limiter: RateLimiter,
+    reserved_tokens: int,
+    max_retries: int,
+    base_delay: float,
+    max_delay: float
+) -> Any:
+    """
+    Call a Bedrock invoke method under the limiter, retrying throttled calls with jittered backoff.
+
+    Returns the response and the time.monotonic() start of the successful attempt.
+    The token reservation of a failed attempt is given back before the next one
+    reserves again, so the caller settles exactly one reservation.
+    """
+    body = json.dumps(request_body)
+
+    for attempt in range(max_retries + 1):
+        limiter.acquire(reserved_tokens)
+
+        try:
+            call_start = time.monotonic()
+            return invoke(modelId=model_id, body=body), call_start
+        except Exception as e:
+            # A failed call consumed no tokens
+            limiter.settle(reserved_tokens, 0)
+            if attempt >= max_retries or not is_retryable_error(e):
+                raise
+
+            delay = random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+            print(f"Bedrock call throttled ({get_error_code(e)}), retrying in {delay:.1f}s "
+                  f"(attempt {attempt + 1}/{max_retries})...")
+            time.sleep(delay)
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Benchmark for chunk stores against the legacy JSON chunk files.
+
+Builds a "# File:" corpus from the source files under a directory, chunks it
+in each chunking mode (and in "lines" mode without overlap) and saves the
+chunks both ways. Reports the file sizes,
+the write time, the time to open the file and read one chunk, and the time
+to read every chunk, and checks that the store returns the chunks unchanged
+and keeps every "lines" chunk as a corpus range.
+
+Usage:
+    python benchmarks/chunk_store_benchmark.py /path/to/repository --chunk-size 1500 --overlap 50
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chunk_store_utils import CHUNK_STORE_COMPRESSIONS, ChunkStore, resolve_compression, write_chunk_store
+from chunking_utils import CHUNKING_MODES, split_content
+from token_utils import get_token_counter
+
+EXTENSIONS = (".py", ".js", ".ts", ".md", ".html", ".css")
+
+
+def load_corpus(root):
+    """
+    Concatenate the source files under a directory the way the extraction step does.
+
+    Args:
+        root (str): Directory to scan
+
+    Returns:
+        str: Corpus with a "# File:" header before each file
+    """
+    parts = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(name for name in dirnames if not name.startswith("."))
+        for filename in sorted(filenames):
+            if os.path.splitext(filename)[1].lower() not in EXTENSIONS:
+                continue
+            path = os.path.join(dirpath, filename)
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    parts.append(f"# File: {os.path.relpath(path, root)}\n{f.read()}\n\n")
+            except (UnicodeDecodeError, OSError):
+                continue
+    return "".join(parts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark chunk stores against JSON chunk files")
+    parser.add_argument("root", help="Directory with source files to chunk")
+    parser.add_argument("--chunk-size", type=int, default=1500, help="Target chunk size in tokens")
+    parser.add_argument("--overlap", type=int, default=50, help="Lines of overlap between chunks")
+    parser.add_argument("--compression", choices=CHUNK_STORE_COMPRESSIONS, default="zstd",
+                        help="Chunk store compression")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.root)
+    count_tokens = get_token_counter()
+    compression = resolve_compression(args.compression)
+    print(f"Corpus: {len(corpus.encode('utf-8')) / 1024:.0f} KB, compression: {compression}")
+    print(f"{'mode':<9} {'chunks':>6} {'format':<6} {'size KB':>8} {'write s':>8} {'open+1 ms':>10} {'read all s':>10}")
+
+    # Line windows without overlap start after the newline that ends the previous chunk
+    cases = [(mode, args.overlap) for mode in CHUNKING_MODES]
+    if args.overlap:
+        cases.append(("lines", 0))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode, overlap in cases:
+            chunks = split_content(corpus, args.chunk_size, overlap, mode=mode, count_tokens=count_tokens)
+            probe = random.Random(0).randrange(len(chunks))
+            label = f"{mode}/{overlap}" if mode == "lines" else mode
+
+            json_path = os.path.join(tmp, f"{mode}-{overlap}.json")
+            start_time = time.perf_counter()
+            with open(json_path, "w", encoding="utf-8") as f:
+                json.dump({"chunking": mode, "total_chunks": len(chunks), "chunks": chunks}, f, indent=2)
+            write_seconds = time.perf_counter() - start_time
+            start_time = time.perf_counter()
+            with open(json_path, "r", encoding="utf-8") as f:
+                json.load(f)["chunks"][probe]
+            open_seconds = time.perf_counter() - start_time
+            print(f"{label:<9} {len(chunks):>6} {'json':<6} {os.path.getsize(json_path) / 1024:>8.0f} "
+                  f"{write_seconds:>8.3f} {open_seconds * 1000:>10.2f} {open_seconds:>10.3f}")
+
+            store_path = os.path.join(tmp, f"{mode}-{overlap}.chunks")
+            start_time = time.perf_counter()
+            stats = write_chunk_store(store_path, chunks, corpus=corpus, compression=compression)
+            write_seconds = time.perf_counter() - start_time
+            start_time = time.perf_counter()
+            with ChunkStore(store_path) as store:
+                store[probe]
+                open_seconds = time.perf_counter() - start_time
+                start_time = time.perf_counter()
+                stored = list(store)
+                read_seconds = time.perf_counter() - start_time
+            if stored != chunks:
+                raise SystemExit(f"Chunk store returned different chunks in {label} mode")
+            if mode == "lines" and stats["references"] != stats["chunks"]:
+                raise SystemExit(f"Chunk store kept only {stats['references']} of {stats['chunks']} {label} chunks "
+                                 f"as corpus ranges")
+            print(f"{'':<9} {'':>6} {'store':<6} {stats['file_bytes'] / 1024:>8.0f} {write_seconds:>8.3f} "
+                  f"{open_seconds * 1000:>10.2f} {read_seconds:>10.3f}  "
+                  f"({stats['references']} of {stats['chunks']} chunks as corpus ranges)")
+
+
+if __name__ == "__main__":
+    main()
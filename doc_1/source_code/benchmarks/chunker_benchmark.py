@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Throughput benchmark for the repository chunker.
+
+Builds a synthetic code-like corpus (1 GB by default), streams chunk
+boundaries over it with iter_chunk_boundaries(), and reports MB/s. The
+previous list-slicing chunker is timed on a smaller sample for comparison,
+since on the full corpus it needs several times the corpus size in memory.
+
+Usage:
+    python benchmarks/chunker_benchmark.py --size-mb 1024 --compare-mb 64
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chunking_utils import iter_chunk_boundaries
+
+
+def legacy_chunk_repository_content(content, chunk_size=1500, overlap=50):
+    """
+    The chunker used before iter_chunk_boundaries(), kept for comparison.
+
+    Args:
+        content (str): The full repository content
+        chunk_size (int): Target chunk size in tokens (estimated)
+        overlap (int): Number of lines to overlap between chunks
+
+    Returns:
+        list: List of content chunks
+    """
+    chunks = []
+    lines = content.split('\n')
+    current_chunk = []
+    current_length = 0
+
+    for line in lines:
+        line_length = len(line) // 4
+        if current_length + line_length > chunk_size:
+            chunks.append('\n'.join(current_chunk))
+            current_chunk = current_chunk[-overlap:]
+            current_length = sum(len(l) // 4 for l in current_chunk)
+        current_chunk.append(line)
+        current_length += line_length
+
+    if current_chunk:
+        chunks.append('\n'.join(current_chunk))
+
+    return chunks
+
+
+def build_synthetic_corpus(size_mb, seed=0):
+    """
+    Build a code-like corpus of roughly size_mb megabytes.
+
+    A few megabytes of lines with realistic length variation are generated
+    once and repeated, which keeps generation time small next to chunking.
+
+    Args:
+        size_mb (int): Target corpus size in megabytes
+        seed (int): Random seed
+
+    Returns:
+        str: Synthetic corpus
+    """
+    rng = random.Random(seed)
+    templates = [
+        "",
+        "# File: src/module_{n}.py",
+        "import os",
+        "def function_{n}(argument, other=None):",
+        "    value = compute(argument) + {n}",
+        "    return {{'key': value, 'items': [item for item in range({n})]}}",
+        "class Component{n}(Base):",
+        "        self.attribute_{n} = self.helper.transform(value, option=True, retries={n})",
+        "    # " + "explanatory comment " * 6,
+    ]
+    block_lines = []
+    block_size = 0
+    while block_size < 4 * 1024 * 1024:
+        line = rng.choice(templates).format(n=rng.randint(0, 10000))
+        block_lines.append(line)
+        block_size += len(line) + 1
+    block = "\n".join(block_lines) + "\n"
+
+    repeats = max(1, (size_mb * 1024 * 1024) // len(block))
+    return block * repeats
+
+
+def time_boundaries(content, chunk_size, overlap):
+    """
+    Stream chunk boundaries over content and time it.
+
+    Args:
+        content (str): Corpus
+        chunk_size (int): Target chunk size in tokens
+        overlap (int): Overlap lines
+
+    Returns:
+        tuple: (number of chunks, elapsed seconds)
+    """
+    start_time = time.perf_counter()
+    chunk_count = 0
+    for _ in iter_chunk_boundaries(content, chunk_size, overlap):
+        chunk_count += 1
+    return chunk_count, time.perf_counter() - start_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the repository chunker")
+    parser.add_argument("--size-mb", type=int, default=1024, help="Size of the synthetic corpus in MB")
+    parser.add_argument("--compare-mb", type=int, default=64,
+                        help="Corpus size for the comparison with the previous chunker (0 to skip)")
+    parser.add_argument("--chunk-size", type=int, default=1500, help="Target chunk size in tokens")
+    parser.add_argument("--overlap", type=int, default=50, help="Overlap lines between chunks")
+    args = parser.parse_args()
+
+    print(f"Building {args.size_mb} MB synthetic corpus...")
+    corpus = build_synthetic_corpus(args.size_mb)
+    corpus_mb = len(corpus) / (1024 * 1024)
+
+    chunk_count, elapsed = time_boundaries(corpus, args.chunk_size, args.overlap)
+    print(f"Prefix-sum chunker: {chunk_count} chunks over {corpus_mb:.0f} MB in {elapsed:.2f}s "
+          f"({corpus_mb / elapsed:.1f} MB/s)")
+    del corpus
+
+    if args.compare_mb:
+        sample = build_synthetic_corpus(args.compare_mb)
+        sample_mb = len(sample) / (1024 * 1024)
+
+        chunk_count, elapsed = time_boundaries(sample, args.chunk_size, args.overlap)
+        print(f"Prefix-sum chunker on {sample_mb:.0f} MB sample: {chunk_count} chunks in {elapsed:.2f}s "
+              f"({sample_mb / elapsed:.1f} MB/s)")
+
+        start_time = time.perf_counter()
+        legacy_chunks = legacy_chunk_repository_content(sample, args.chunk_size, args.overlap)
+        elapsed = time.perf_counter() - start_time
+        print(f"Previous chunker on {sample_mb:.0f} MB sample: {len(legacy_chunks)} chunks in {elapsed:.2f}s "
+              f"({sample_mb / elapsed:.1f} MB/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Benchmark for the lightweight notebook reader.
+
+Builds synthetic notebooks whose code cells carry large embedded outputs
+(base64 PNG data, as saved by plotting cells), then times
+notebook_to_python() against the nbformat + nbconvert PythonExporter
+conversion it replaces, and against a plain json.loads() of the file. The
+nbconvert comparison also checks that both conversions produce the same
+script, and is skipped when nbconvert is not installed. Each notebook also
+holds a cell of IPython syntax (shell escapes, magics, help requests and
+their assignment forms), whose conversion is checked line by line against
+IPython's own transformer when IPython is installed.
+
+Usage:
+    python benchmarks/notebook_benchmark.py --notebooks 20 --image-kb 2048
+"""
+
+import os
+import sys
+import json
+import time
+import base64
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from notebook_utils import ipython_to_python, notebook_to_python
+
+# IPython syntax rewritten by nbconvert; one cell of it is added to every notebook
+IPYTHON_SYNTAX_LINES = [
+    "%matplotlib inline",
+    "!ls -la",
+    "files = !ls",
+    "listing = !!ls",
+    "d['k'] = !ls",
+    "config.paths[0] = !pwd",
+    "a, *rest = %sx ls",
+    "total = 5 % 3",
+    "%timeit?",
+    "foo?",
+    "obj.attr??",
+    "?foo",
+    "np.*load*?",
+    "note = 'is this a question?'",
+    "if verbose:",
+    "    plt.plot?",
+]
+
+
+def build_notebook(cells, image_kb, seed=0):
+    """
+    Build the JSON text of a notebook with an image output on every code cell.
+
+    Args:
+        cells (int): Number of code cells (each followed by a markdown cell)
+        image_kb (int): Size of the embedded image of each code cell in KB
+        seed (int): Random seed
+
+    Returns:
+        str: Notebook JSON
+    """
+    rng = random.Random(seed)
+    notebook_cells = [{
+        "cell_type": "code",
+        "execution_count": None,
+        "metadata": {},
+        "outputs": [],
+        "source": [line + "\n" for line in IPYTHON_SYNTAX_LINES]
+    }]
+    for index in range(cells):
+        notebook_cells.append({
+            "cell_type": "markdown",
+            "metadata": {},
+            "source": [f"## Step {index}\n", "\n", "Plot the intermediate results."]
+        })
+        image = base64.b64encode(rng.randbytes(image_kb * 1024 * 3 // 4)).decode("ascii")
+        notebook_cells.append({
+            "cell_type": "code",
+            "execution_count": index + 1,
+            "metadata": {},
+            "outputs": [
+                {"name": "stdout", "output_type": "stream", "text": [f"step {index} done\n"]},
+                {
+                    "data": {"image/png": image, "text/plain": ["<Figure size 640x480 with 1 Axes>"]},
+                    "metadata": {},
+                    "output_type": "display_data"
+                }
+            ],
+            "source": [
+                "import matplotlib.pyplot as plt\n",
+                f"values = [value * {index} for value in range(100)]\n",
+                "plt.plot(values)\n",
+                "plt.show()"
+            ]
+        })
+    notebook = {
+        "cells": notebook_cells,
+        "metadata": {"language_info": {"name": "python"}},
+        "nbformat": 4,
+        "nbformat_minor": 5
+    }
+    return json.dumps(notebook, indent=1)
+
+
+def check_ipython_syntax():
+    """
+    Compare ipython_to_python() with IPython's transformer on each IPython syntax line.
+
+    Returns:
+        bool: True if every line converts identically, None if IPython is not installed
+    """
+    try:
+        from IPython.core.inputtransformer2 import TransformerManager
+    except ImportError:
+        return None
+
+    transformer = TransformerManager()
+    identical = True
+    for line in IPYTHON_SYNTAX_LINES + ["\n".join(IPYTHON_SYNTAX_LINES[-2:])]:
+        expected = transformer.transform_cell(line + "\n")
+        converted = ipython_to_python(line + "\n")
+        if converted != expected:
+            print(f"  {line!r}: expected {expected!r}, got {converted!r}")
+            identical = False
+    return identical
+
+
+def time_conversion(convert, texts, repeat):
+    """
+    Time a conversion function over a set of notebooks.
+
+    Args:
+        convert (callable): Function taking notebook JSON text
+        texts (list): Notebook JSON texts
+        repeat (int): Number of passes over the notebooks
+
+    Returns:
+        tuple: (outputs of the last pass, best seconds per pass)
+    """
+    best = float("inf")
+    outputs = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        outputs = [convert(text) for text in texts]
+        best = min(best, time.perf_counter() - start_time)
+    return outputs, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the lightweight notebook reader")
+    parser.add_argument("--notebooks", type=int, default=20, help="Number of notebooks")
+    parser.add_argument("--cells", type=int, default=10, help="Code cells per notebook")
+    parser.add_argument("--image-kb", type=int, default=512, help="Size of the image output of each code cell in KB")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed passes; the best is reported")
+    args = parser.parse_args()
+
+    texts = [build_notebook(args.cells, args.image_kb, seed) for seed in range(args.notebooks)]
+    total_mb = sum(len(text) for text in texts) / (1024 * 1024)
+    print(f"{args.notebooks} notebooks, {total_mb:.0f} MB of JSON")
+
+    scripts, elapsed = time_conversion(notebook_to_python, texts, args.repeat)
+    print(f"notebook_to_python: {elapsed:.3f}s ({total_mb / elapsed:.0f} MB/s)")
+
+    _, elapsed = time_conversion(json.loads, texts, args.repeat)
+    print(f"json.loads (full parse, no conversion): {elapsed:.3f}s ({total_mb / elapsed:.0f} MB/s)")
+
+    identical = check_ipython_syntax()
+    if identical is None:
+        print("IPython not installed, skipping the IPython syntax check")
+    else:
+        print(f"IPython syntax identical to IPython's transformer: {identical}")
+
+    try:
+        start_time = time.perf_counter()
+        import nbformat
+        from nbconvert import PythonExporter
+        print(f"Importing nbformat + nbconvert: {time.perf_counter() - start_time:.3f}s")
+    except ImportError:
+        print("nbconvert not installed, skipping the comparison")
+        return
+
+    exporter = PythonExporter()
+    reference, elapsed = time_conversion(
+        lambda text: exporter.from_notebook_node(nbformat.reads(text, as_version=4))[0], texts, args.repeat
+    )
+    print(f"nbformat + PythonExporter: {elapsed:.3f}s ({total_mb / elapsed:.0f} MB/s)")
+    print(f"Outputs identical: {reference == scripts}")
+
+
+if __name__ == "__main__":
+    main()
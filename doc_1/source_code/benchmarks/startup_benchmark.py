@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Startup-time benchmark for the documentation entry points.
+
+Each entry point is run with --help in a fresh interpreter, so the timing
+covers interpreter start, module imports and argument parsing, but no
+extraction or model calls. The heavy optional dependencies (boto3, nbformat,
+nbconvert, python-docx, tqdm) should not appear among the loaded modules:
+they are imported only by the code that needs them. The import cost of each
+of those dependencies is reported separately, as the time an eager import
+would add to every run.
+
+The notebook-exported scripts execute their cells at module level, so some
+of them stop at a cell that needs configuration before reaching argument
+parsing; the outcome column shows where each run ended.
+
+Usage:
+    python benchmarks/startup_benchmark.py --repeat 5
+"""
+
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+SOURCE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPO_ROOT = os.path.dirname(os.path.dirname(SOURCE_DIR))
+
+ENTRY_POINTS = [
+    os.path.join(SOURCE_DIR, "apr20_claude-docs-generator_v3.py"),
+    os.path.join(SOURCE_DIR, "apr22_single_mult_v3.py"),
+    os.path.join(SOURCE_DIR, "apr22_multi_prompt_v2.py"),
+    os.path.join(SOURCE_DIR, "apr22_code_v2.py"),
+    os.path.join(REPO_ROOT, "improve_doc_2.py"),
+]
+
+HEAVY_MODULES = ["boto3", "botocore", "nbformat", "nbconvert", "docx", "tqdm"]
+
+# Runs one entry point with --help and reports its wall time, outcome and heavy imports
+DRIVER = """
+import io, json, os, runpy, sys, time, contextlib
+start_time = time.perf_counter()
+script = sys.argv[1]
+sys.argv = [script, "--help"]
+sys.path.insert(0, os.path.dirname(script))
+outcome = "ok"
+with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+    try:
+        runpy.run_path(script, run_name="__main__")
+    except SystemExit:
+        pass
+    except BaseException as e:
+        outcome = type(e).__name__
+elapsed = time.perf_counter() - start_time
+heavy = sorted(name for name in %r if name in sys.modules)
+print(json.dumps({"elapsed": elapsed, "outcome": outcome, "heavy": heavy}))
+""" % (HEAVY_MODULES,)
+
+
+def run_python(args):
+    """
+    Run a fresh interpreter and return its wall time and standard output.
+
+    Args:
+        args (list): Arguments after the interpreter path
+
+    Returns:
+        tuple: (elapsed seconds, stdout)
+    """
+    import time
+    start_time = time.perf_counter()
+    result = subprocess.run([sys.executable] + args, capture_output=True, text=True, stdin=subprocess.DEVNULL)
+    return time.perf_counter() - start_time, result.stdout
+
+
+def time_entry_point(script, repeat):
+    """
+    Time an entry point started with --help.
+
+    Args:
+        script (str): Path to the script
+        repeat (int): Number of runs; the median is reported
+
+    Returns:
+        dict: Median wall time, in-process time, outcome and heavy modules loaded
+    """
+    wall_times = []
+    reports = []
+    for _ in range(repeat):
+        elapsed, stdout = run_python(["-c", DRIVER, script])
+        wall_times.append(elapsed)
+        reports.append(json.loads(stdout.strip().splitlines()[-1]))
+    return {
+        "wall": statistics.median(wall_times),
+        "in_process": statistics.median(report["elapsed"] for report in reports),
+        "outcome": reports[-1]["outcome"],
+        "heavy": reports[-1]["heavy"],
+    }
+
+
+def time_import(module, repeat, baseline):
+    """
+    Time how much an import of module adds to interpreter startup.
+
+    Args:
+        module (str): Module name
+        repeat (int): Number of runs; the median is reported
+        baseline (float): Median wall time of an empty interpreter run
+
+    Returns:
+        float: Added seconds, or None if the module is not installed
+    """
+    wall_times = []
+    for _ in range(repeat):
+        elapsed, stdout = run_python(["-c", f"import {module}; print('ok')"])
+        if "ok" not in stdout:
+            return None
+        wall_times.append(elapsed)
+    return statistics.median(wall_times) - baseline
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark startup time of the documentation entry points")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per measurement; the median is reported")
+    args = parser.parse_args()
+
+    baseline = statistics.median(run_python(["-c", "pass"])[0] for _ in range(args.repeat))
+    print(f"Empty interpreter: {baseline * 1000:.0f} ms")
+    print()
+
+    print(f"{'Entry point':<40} {'wall':>8} {'in-proc':>8}  {'outcome':<14} heavy modules loaded")
+    for script in ENTRY_POINTS:
+        result = time_entry_point(script, args.repeat)
+        print(f"{os.path.basename(script):<40} {result['wall'] * 1000:>6.0f}ms {result['in_process'] * 1000:>6.0f}ms  "
+              f"{result['outcome']:<14} {', '.join(result['heavy']) or 'none'}")
+    print()
+
+    print("Import cost deferred until first use:")
+    for module in HEAVY_MODULES:
+        added = time_import(module, args.repeat, baseline)
+        print(f"  {module:<10} " + ("not installed" if added is None else f"+{added * 1000:.0f} ms"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Benchmark for the token counters.
+
+Counts every source file under a directory with the "estimate" and
+"heuristic" counters and reports their throughput. Given a tokenizer.json
+(for example the Claude tokenizer shipped with older anthropic SDK
+releases), the exact counts are used as reference: for each file extension
+the ratio of each counter's total to the exact total is reported, with the
+mean absolute error per file, and the time a second, cached pass takes.
+
+Usage:
+    python benchmarks/token_counter_benchmark.py /path/to/repository --tokenizer-file tokenizer.json
+"""
+
+import os
+import sys
+import time
+import argparse
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from token_utils import estimate_tokens, get_token_counter, heuristic_tokens
+
+EXTENSIONS = (".py", ".ipynb", ".js", ".jsx", ".ts", ".tsx", ".md", ".json", ".html", ".css")
+
+
+def load_files(root, limit):
+    """
+    Read the source files under a directory.
+
+    Args:
+        root (str): Directory to scan
+        limit (int): Maximum number of files
+
+    Returns:
+        list: (extension, text) pairs
+    """
+    files = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(name for name in dirnames if not name.startswith("."))
+        for filename in sorted(filenames):
+            extension = os.path.splitext(filename)[1].lower()
+            if extension not in EXTENSIONS:
+                continue
+            try:
+                with open(os.path.join(dirpath, filename), "r", encoding="utf-8") as f:
+                    files.append((extension, f.read()))
+            except (UnicodeDecodeError, OSError):
+                continue
+            if len(files) >= limit:
+                return files
+    return files
+
+
+def time_counter(count_tokens, texts):
+    """
+    Count every text and time the pass.
+
+    Args:
+        count_tokens (callable): Token counter
+        texts (list): Texts to count
+
+    Returns:
+        tuple: (counts, seconds)
+    """
+    start_time = time.perf_counter()
+    counts = [count_tokens(text) for text in texts]
+    return counts, time.perf_counter() - start_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the token counters")
+    parser.add_argument("root", help="Directory with source files to count")
+    parser.add_argument("--tokenizer-file", default=None, help="tokenizer.json giving the exact reference counts")
+    parser.add_argument("--limit", type=int, default=2000, help="Maximum number of files")
+    args = parser.parse_args()
+
+    files = load_files(args.root, args.limit)
+    texts = [text for _, text in files]
+    total_mb = sum(len(text) for text in texts) / (1024 * 1024)
+    print(f"{len(files)} files, {total_mb:.1f} MB")
+
+    counters = {"estimate": estimate_tokens, "heuristic": heuristic_tokens}
+    counts = {}
+    for name, count_tokens in counters.items():
+        counts[name], elapsed = time_counter(count_tokens, texts)
+        print(f"{name:<10} {elapsed:.3f}s ({total_mb / max(elapsed, 1e-9):.0f} MB/s)")
+
+    if not args.tokenizer_file:
+        print("No --tokenizer-file given, skipping the accuracy comparison")
+        return
+
+    exact_counter = get_token_counter("tokenizer", tokenizer_file=args.tokenizer_file)
+    exact, elapsed = time_counter(exact_counter, texts)
+    print(f"{'tokenizer':<10} {elapsed:.3f}s ({total_mb / max(elapsed, 1e-9):.1f} MB/s)")
+    _, elapsed = time_counter(exact_counter, texts)
+    print(f"{'cached':<10} {elapsed:.3f}s (second pass, {exact_counter.hits} hits)")
+    print()
+
+    by_extension = defaultdict(list)
+    for index, (extension, _) in enumerate(files):
+        if exact[index]:
+            by_extension[extension].append(index)
+
+    print(f"{'extension':<10} {'files':>6} " + " ".join(f"{name + ' ratio':>16} {'error':>6}" for name in counters))
+    for extension, indices in sorted(by_extension.items()):
+        exact_total = sum(exact[index] for index in indices)
+        columns = []
+        for name in counters:
+            ratio = sum(counts[name][index] for index in indices) / exact_total
+            error = sum(abs(counts[name][index] - exact[index]) / exact[index] for index in indices) / len(indices)
+            columns.append(f"{ratio:>16.2f} {error:>6.0%}")
+        print(f"{extension:<10} {len(indices):>6} " + " ".join(columns))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Checkpointing of per-chunk documentation results.
+
+Every chunk result is appended to a JSON-lines file as soon as the model
+returns it, keyed by the chunk id (its position in the chunks file) and a hash
+of the chunk content. A resumed run loads the file, skips every chunk whose id
+and hash still match, and only sends the remaining chunks to the model.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from typing import Dict, Optional
+
+
+def chunk_hash(chunk: str) -> str:
+    """
+    Return the content hash used to key a chunk in the checkpoint.
+
+    Args:
+        chunk (str): Chunk content
+
+    Returns:
+        str: Hex SHA-256 digest
+    """
+    return hashlib.sha256(chunk.encode("utf-8")).hexdigest()
+
+
+def checkpoint_path_for(chunks_file: str) -> str:
+    """
+    Return the checkpoint file that belongs to a chunks file.
+
+    Args:
+        chunks_file (str): Path to the chunks file
+
+    Returns:
+        str: Path to the checkpoint file
+    """
+    return os.path.splitext(chunks_file)[0] + ".progress.jsonl"
+
+
+class ChunkCheckpoint:
+    """
+    Append-only store of completed chunk results.
+
+    Records are written and flushed one line at a time, so a run that dies
+    part-way loses at most the chunk that was being written.
+    """
+
+    def __init__(self, path: str, resume: bool = False):
+        """
+        Open a checkpoint file.
+
+        Args:
+            path (str): Path to the checkpoint file
+            resume (bool): Load results of a previous run; otherwise the file is started afresh
+        """
+        self.path = path
+        self.completed: Dict[int, Dict[str, str]] = {}
+        self._lock = threading.Lock()
+
+        if resume and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A line cut off by the crash; that chunk is simply redone
+                        continue
+                    self.completed[record["chunk_id"]] = record
+            print(f"Loaded {len(self.completed)} completed chunks from {path}")
+        elif os.path.exists(path):
+            os.remove(path)
+
+    def get(self, chunk_id: int, chunk: str) -> Optional[str]:
+        """
+        Return the stored result for a chunk if its content is unchanged.
+
+        Args:
+            chunk_id (int): Position of the chunk in the chunks file
+            chunk (str): Chunk content
+
+        Returns:
+            str: Stored documentation, or None if the chunk still has to be processed
+        """
+        record = self.completed.get(chunk_id)
+        if record is None or record["hash"] != chunk_hash(chunk):
+            return None
+        return record["text"]
+
+    def record(self, chunk_id: int, chunk: str, text: str) -> None:
+        """
+        Persist the result of one chunk.
+
+        Args:
+            chunk_id (int): Position of the chunk in the chunks file
+            chunk (str): Chunk content
+            text (str): Documentation generated for the chunk
+        """
+        record = {"chunk_id": chunk_id, "hash": chunk_hash(chunk), "text": text}
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self.completed[chunk_id] = record
@@ -0,0 +1,303 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Compact, randomly accessible chunk files.
+
+Chunks used to be saved as one pretty-printed JSON document holding every
+chunk string, so a file was roughly the corpus size plus every overlap again,
+and reading any chunk meant parsing all of them. A chunk store instead holds:
+
+- one length-prefixed record per chunk: either a (start, end) byte range of
+  the corpus, for chunks that are verbatim slices of it (every "lines" chunk,
+  overlaps included), or the compressed chunk text (chunks rewritten by the
+  "ast" and "pack" modes);
+- the corpus once, in independently compressed blocks; blocks no record
+  refers to are left out;
+- an offset index and the metadata at the end of the file.
+
+ChunkStore maps the file and reads the footer only; chunk i is found through
+the index and decoded on access, touching at most the corpus blocks its range
+covers. Blocks are compressed with zlib, or with zstd when the `zstandard`
+package is installed. Legacy JSON chunk files are still read by load_chunks().
+
+Layout:
+    MAGIC | records | corpus blocks | index (uint64 record offsets) | metadata JSON | footer
+    record = kind (uint8) | payload length (uint32) | payload
+    footer = index offset, metadata offset, chunk count (uint64 each) | MAGIC
+"""
+
+import json
+import mmap
+import os
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+from collections.abc import Sequence
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+CHUNK_STORE_EXTENSION = ".chunks"
+CHUNK_STORE_COMPRESSIONS = ("none", "zlib", "zstd")
+DEFAULT_CHUNK_COMPRESSION = "zstd"
+
+# Uncompressed corpus bytes per block: a chunk read decompresses one or two blocks
+CORPUS_BLOCK_SIZE = 256 * 1024
+# Decompressed corpus blocks kept per open store
+BLOCK_CACHE_SIZE = 8
+
+MAGIC = b"CHUNKS1\n"
+_RECORD_HEADER = struct.Struct("<BI")
+_REFERENCE = struct.Struct("<QQ")
+_OFFSET = struct.Struct("<Q")
+_FOOTER = struct.Struct("<QQQ")
+
+_TEXT_RECORD = 0
+_REFERENCE_RECORD = 1
+
+
+def _zstandard():
+    """Import the optional zstandard package, None if it is not installed."""
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return zstandard
+
+
+def resolve_compression(compression: str) -> str:
+    """
+    Return the compression a store will be written with.
+
+    Args:
+        compression (str): One of CHUNK_STORE_COMPRESSIONS
+
+    Returns:
+        str: The requested compression, or "zlib" if "zstd" was requested
+            but the zstandard package is not installed
+    """
+    if compression not in CHUNK_STORE_COMPRESSIONS:
+        raise ValueError(f"Unknown compression '{compression}', expected one of {CHUNK_STORE_COMPRESSIONS}")
+    if compression == "zstd" and _zstandard() is None:
+        print("zstandard is not installed, compressing the chunk store with zlib")
+        return "zlib"
+    return compression
+
+
+def _compressor(compression: str):
+    """Return a function compressing bytes with the given compression."""
+    if compression == "zstd":
+        return _zstandard().ZstdCompressor(level=6).compress
+    if compression == "zlib":
+        return lambda data: zlib.compress(data, 6)
+    return bytes
+
+
+def _decompressor(compression: str):
+    """Return a function decompressing bytes written with the given compression."""
+    if compression == "zstd":
+        zstandard = _zstandard()
+        if zstandard is None:
+            raise ImportError("This chunk store is zstd-compressed; install the zstandard package to read it")
+        return zstandard.ZstdDecompressor().decompress
+    if compression == "zlib":
+        return zlib.decompress
+    return bytes
+
+
+def write_chunk_store(
+    path: str,
+    chunks: Iterable[str],
+    corpus: Optional[str] = None,
+    metadata: Optional[Dict[str, Any]] = None,
+    compression: str = DEFAULT_CHUNK_COMPRESSION
+) -> Dict[str, int]:
+    """
+    Write chunks to a chunk store file.
+
+    Each chunk is looked up in the corpus just after where the previous one
+    was found, so overlapping line windows become byte ranges and the search
+    stays bounded by the chunk sizes; chunks not found are stored as text.
+
+    Args:
+        path (str): File to write
+        chunks (iterable): Chunk texts, in order; consumed once
+        corpus (str): Text the chunks were cut from (optional; without it
+            every chunk is stored as text)
+        metadata (dict): JSON-serialisable metadata returned by ChunkStore.metadata
+        compression (str): One of CHUNK_STORE_COMPRESSIONS
+
+    Returns:
+        dict: "chunks", "references" (chunks stored as corpus ranges),
+            "chunk_bytes" (total UTF-8 size of the chunks) and "file_bytes"
+    """
+    compression = resolve_compression(compression)
+    compress = _compressor(compression)
+    corpus_bytes = corpus.encode("utf-8") if corpus else b""
+
+    stats = {"chunks": 0, "references": 0, "chunk_bytes": 0}
+    offsets = []
+    blocks = []
+    referenced = set()
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    with open(path, "wb") as f:
+        f.write(MAGIC)
+
+        # Start of the last chunk found in the corpus, and the end of the one before
+        position = previous_end = 0
+        for chunk in chunks:
+            data = chunk.encode("utf-8")
+            stats["chunks"] += 1
+            stats["chunk_bytes"] += len(data)
+            offsets.append(f.tell())
+
+            # The next chunk overlaps the previous one, or starts after the newline ending it
+            start = corpus_bytes.find(data, position, previous_end + 1 + len(data)) if data and corpus_bytes else -1
+            if start >= 0:
+                position, previous_end = start, start + len(data)
+                stats["references"] += 1
+                referenced.update(range(start // CORPUS_BLOCK_SIZE, (previous_end - 1) // CORPUS_BLOCK_SIZE + 1))
+                f.write(_RECORD_HEADER.pack(_REFERENCE_RECORD, _REFERENCE.size))
+                f.write(_REFERENCE.pack(start, previous_end))
+            else:
+                payload = compress(data)
+                f.write(_RECORD_HEADER.pack(_TEXT_RECORD, len(payload)))
+                f.write(payload)
+
+        # Corpus blocks are written after the records, and only if some chunk refers to them
+        for number in range(-(-len(corpus_bytes) // CORPUS_BLOCK_SIZE) if referenced else 0):
+            if number not in referenced:
+                blocks.append(None)
+                continue
+            block = compress(corpus_bytes[number * CORPUS_BLOCK_SIZE:(number + 1) * CORPUS_BLOCK_SIZE])
+            blocks.append((f.tell(), len(block)))
+            f.write(block)
+
+        index_offset = f.tell()
+        for offset in offsets:
+            f.write(_OFFSET.pack(offset))
+
+        metadata_offset = f.tell()
+        f.write(json.dumps({
+            "metadata": metadata or {},
+            "compression": compression,
+            "corpus_bytes": len(corpus_bytes),
+            "corpus_block_size": CORPUS_BLOCK_SIZE,
+            "corpus_blocks": blocks,
+        }).encode("utf-8"))
+        f.write(_FOOTER.pack(index_offset, metadata_offset, len(offsets)))
+        f.write(MAGIC)
+        stats["file_bytes"] = f.tell()
+
+    return stats
+
+
+class ChunkStore(Sequence):
+    """
+    Read-only, lazily decoded view of a chunk store file.
+
+    Supports len(), indexing (negative indices and slices included) and
+    iteration like a list of chunk strings; nothing is decoded until a chunk
+    is accessed. Safe to read from several threads.
+    """
+
+    def __init__(self, path: str):
+        """
+        Map the file and read its index position and metadata.
+
+        Args:
+            path (str): Chunk store file
+        """
+        self.path = path
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        footer_offset = len(self._map) - _FOOTER.size - len(MAGIC)
+        if self._map[:len(MAGIC)] != MAGIC or footer_offset < 0 or self._map[-len(MAGIC):] != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a chunk store")
+        self._index_offset, metadata_offset, self._count = _FOOTER.unpack_from(self._map, footer_offset)
+
+        header = json.loads(self._map[metadata_offset:footer_offset].decode("utf-8"))
+        self.metadata: Dict[str, Any] = header["metadata"]
+        self.compression: str = header["compression"]
+        self._decompress = _decompressor(self.compression)
+        self._block_size = header["corpus_block_size"]
+        self._blocks = header["corpus_blocks"]
+        self._block_cache: "OrderedDict[int, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._count))]
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError("chunk index out of range")
+
+        (offset,) = _OFFSET.unpack_from(self._map, self._index_offset + index * _OFFSET.size)
+        kind, length = _RECORD_HEADER.unpack_from(self._map, offset)
+        payload = self._map[offset + _RECORD_HEADER.size:offset + _RECORD_HEADER.size + length]
+        if kind == _REFERENCE_RECORD:
+            return self._corpus_range(*_REFERENCE.unpack(payload)).decode("utf-8")
+        return self._decompress(payload).decode("utf-8")
+
+    def _block(self, number: int) -> bytes:
+        """Return a decompressed corpus block, from the cache if it was read recently."""
+        with self._lock:
+            block = self._block_cache.get(number)
+            if block is not None:
+                self._block_cache.move_to_end(number)
+                return block
+        offset, length = self._blocks[number]
+        block = self._decompress(self._map[offset:offset + length])
+        with self._lock:
+            self._block_cache[number] = block
+            if len(self._block_cache) > BLOCK_CACHE_SIZE:
+                self._block_cache.popitem(last=False)
+        return block
+
+    def _corpus_range(self, start: int, end: int) -> bytes:
+        """Return bytes start:end of the corpus, decompressing only the blocks they span."""
+        first = start // self._block_size
+        last = (end - 1) // self._block_size
+        data = b"".join(self._block(number) for number in range(first, last + 1))
+        base = first * self._block_size
+        return data[start - base:end - base]
+
+    def close(self) -> None:
+        """Unmap and close the file."""
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self) -> "ChunkStore":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def load_chunks(chunks_file: str) -> Tuple[Sequence, Dict[str, Any]]:
+    """
+    Open a chunks file written by write_chunk_store(), or a legacy JSON chunks file.
+
+    Args:
+        chunks_file (str): Path to the chunks file
+
+    Returns:
+        tuple: Chunks (a lazy ChunkStore, or a list for JSON files) and the metadata dict
+    """
+    if not chunks_file.endswith(".json"):
+        store = ChunkStore(chunks_file)
+        return store, store.metadata
+
+    with open(chunks_file, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    chunks = data.pop("chunks")
+    return chunks, data
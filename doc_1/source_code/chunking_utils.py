@@ -0,0 +1,555 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Helpers for splitting repository content into model-sized chunks.
+
+The chunker makes a single pass over the content, keeping a running prefix
+sum of estimated line token counts, so the size of any window of lines is a
+subtraction rather than a re-summation of the overlap lines. Chunk boundaries
+are produced as (start, end) character offsets into the content; chunk text
+is only materialised when a caller slices it out.
+
+The semantic ("ast") mode cuts Python sources and notebook cells on module,
+class and function boundaries instead, packing whole definitions up to the
+token budget and repeating the "# File:" header at the start of every chunk.
+
+The packing ("pack") mode plans chunks for repositories made of many small
+files: whole files are bin-packed first-fit-decreasing into as few chunks as
+the budget allows, and only files larger than the budget are split.
+
+iter_record_chunks() runs the semantic mode over extracted file records as
+they are produced, so a pipeline fed by extraction holds one chunk at a time
+instead of the whole repository content.
+
+Every mode takes a count_tokens callable (see token_utils) and sizes chunks
+with it; the default is the old estimate of 4 characters per token.
+"""
+
+import ast
+import re
+import textwrap
+from array import array
+from bisect import bisect_right
+from itertools import accumulate, islice, repeat
+from operator import add, floordiv, mul
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from token_utils import estimate_tokens
+
+
+# Content is scanned in segments of about this many characters, so only the
+# line tables of the current window and segment are held in memory
+CHUNKER_SEGMENT_SIZE = 8 * 1024 * 1024
+
+# Chunking modes accepted by split_content()
+CHUNKING_MODES = ("lines", "ast", "pack")
+
+FILE_HEADER_PATTERN = re.compile(r"^# File: (.*)$", re.MULTILINE)
+NOTEBOOK_CELL_PATTERN = re.compile(r"^(?=## Cell \d+ \()", re.MULTILINE)
+CODE_CELL_PATTERN = re.compile(r"^(?=```python$)", re.MULTILINE)
+PYTHON_FENCE_PATTERN = re.compile(r"```python\n(.*?)\n```", re.DOTALL)
+
+
+def _line_tokens(segment: str, line_lengths: List[int], count_tokens: Callable[[str], int]) -> Iterator[int]:
+    """
+    Spread the token count of each file in a segment over its lines.
+
+    Each "# File:" section is counted once as a whole (so a caching counter
+    sees one text per file) and every line gets the file's tokens per
+    character times its length, rounded to the nearest token.
+
+    Args:
+        segment (str): Content segment starting at a line boundary
+        line_lengths (list): Length of each line of the segment
+        count_tokens (callable): Returns the token count of a text
+
+    Yields:
+        int: Token count of each line
+    """
+    starts = [0] + [header.start() for header in FILE_HEADER_PATTERN.finditer(segment) if header.start()]
+    ends = starts[1:] + [len(segment)]
+    line = 0
+    for index, (start, end) in enumerate(zip(starts, ends)):
+        # Every section but the last ends with the newline before the next header
+        line_count = segment.count("\n", start, end) if index + 1 < len(starts) else len(line_lengths) - line
+        lengths = line_lengths[line:line + line_count]
+        line += line_count
+        tokens = count_tokens(segment[start:end])
+        chars = max(1, end - start)
+        # round(length * tokens / chars) without per-line Python work
+        yield from map(floordiv, map(add, map(mul, lengths, repeat(2 * tokens)), repeat(chars)), repeat(2 * chars))
+
+
+def iter_chunk_boundaries(
+    content: str,
+    chunk_size: int = 1500,
+    overlap: int = 50,
+    count_tokens: Optional[Callable[[str], int]] = None
+) -> Iterator[Tuple[int, int]]:
+    """
+    Yield the character offsets of overlapping, line-aligned chunks.
+
+    Lines are added to the current chunk until the next line would take its
+    token count over chunk_size; the chunk is then closed and the next one
+    starts with its last `overlap` lines. content[start:end] is the chunk
+    text without the closing newline.
+
+    Without count_tokens a line counts approximately 4 characters per token.
+    With a counter, each file is counted once and its lines get its token
+    density, so a minified or non-ASCII file gets proportionally smaller chunks.
+
+    Line lengths and their prefix sums are computed per segment with C-level
+    iteration, and the end of each chunk is found by binary search on the
+    prefix sums, so there is no per-line Python work and no re-summing of the
+    overlap window.
+
+    Args:
+        content (str): The full repository content
+        chunk_size (int): Target chunk size in tokens
+        overlap (int): Number of lines to overlap between chunks
+        count_tokens (callable): Returns the token count of a text (optional)
+
+    Yields:
+        tuple: (start, end) character offsets of each chunk
+    """
+    overlap = max(0, overlap)
+    content_length = len(content)
+    if count_tokens is estimate_tokens:
+        count_tokens = None
+
+    # Tables for lines base, base+1, ...: token_prefix[k] is the estimated
+    # token count of the lines before base+k, line_starts[k] the offset of base+k
+    token_prefix = array("q", [0])
+    line_starts = array("q")
+    base = 0
+    window_start = 0
+    next_line = 0
+    position = 0
+
+    while True:
+        segment_end = content.find("\n", position + CHUNKER_SEGMENT_SIZE)
+        last_segment = segment_end == -1
+        if last_segment:
+            segment_end = content_length
+
+        segment = content[position:segment_end]
+        line_lengths = list(map(len, segment.split("\n")))
+        line_starts.extend(islice(accumulate(map(add, line_lengths, repeat(1)), initial=position), len(line_lengths)))
+        if count_tokens is None:
+            line_tokens = map(floordiv, line_lengths, repeat(4))
+        else:
+            line_tokens = _line_tokens(segment, line_lengths, count_tokens)
+        prefix = accumulate(line_tokens, initial=token_prefix[-1])
+        next(prefix)
+        token_prefix.extend(prefix)
+
+        while True:
+            first = window_start - base
+            # First line from next_line on that no longer fits; a chunk always holds at least one line
+            search_from = max(first + 2, next_line - base + 1)
+            closing = bisect_right(token_prefix, token_prefix[first] + chunk_size, search_from) - 1
+            if closing >= len(line_starts):
+                break
+            yield line_starts[first], line_starts[closing] - 1
+            # Keep overlap lines for the next chunk
+            window_start = base + max(first, closing - overlap)
+            next_line = base + closing + 1
+
+        if last_segment:
+            break
+
+        # Drop the tables of lines that can no longer be part of a chunk
+        first = window_start - base
+        del token_prefix[:first]
+        del line_starts[:first]
+        base = window_start
+        position = segment_end + 1
+
+    yield line_starts[window_start - base], content_length
+
+
+def split_into_chunks(
+    content: str,
+    chunk_size: int = 1500,
+    overlap: int = 50,
+    count_tokens: Optional[Callable[[str], int]] = None
+) -> List[str]:
+    """
+    Divide content into overlapping chunks to fit within the model context window.
+
+    Args:
+        content (str): The full repository content
+        chunk_size (int): Target chunk size in tokens
+        overlap (int): Number of lines to overlap between chunks
+        count_tokens (callable): Returns the token count of a text (optional)
+
+    Returns:
+        list: List of content chunks
+    """
+    return [content[start:end] for start, end in iter_chunk_boundaries(content, chunk_size, overlap, count_tokens)]
+
+
+def split_repository_files(content: str) -> List[Tuple[str, str]]:
+    """
+    Split extracted repository content into its files.
+
+    Args:
+        content (str): Repository content with a "# File: <path>" line before each file
+
+    Returns:
+        list: (path, body) pairs in content order; text before the first
+            header is returned with an empty path
+    """
+    files = []
+    headers = list(FILE_HEADER_PATTERN.finditer(content))
+
+    preamble = content[:headers[0].start()] if headers else content
+    if preamble.strip():
+        files.append(("", preamble.strip("\n")))
+
+    for index, header in enumerate(headers):
+        body_end = headers[index + 1].start() if index + 1 < len(headers) else len(content)
+        files.append((header.group(1).strip(), content[header.end():body_end].strip("\n")))
+
+    return files
+
+
+def _class_header(node: ast.ClassDef) -> str:
+    """
+    Return the decorator and "class ...:" lines of a class definition.
+
+    Args:
+        node (ast.ClassDef): Class definition
+
+    Returns:
+        str: Class header without the body
+    """
+    header_node = ast.ClassDef(
+        name=node.name,
+        bases=node.bases,
+        keywords=node.keywords,
+        body=[ast.Pass()],
+        decorator_list=node.decorator_list,
+        type_params=getattr(node, "type_params", []),
+    )
+    return ast.unparse(header_node).rsplit("\n", 1)[0]
+
+
+def definition_units(
+    tree: ast.Module,
+    chunk_size: int = 1500,
+    count_tokens: Callable[[str], int] = estimate_tokens
+) -> List[Tuple[str, str]]:
+    """
+    Break a parsed module into whole-definition units that fit the token budget.
+
+    Every top-level statement (import block entries, functions, classes, ...)
+    is one unit. A class too large for one chunk is split into its members,
+    each carrying the class header as context; a single function or member
+    still too large falls back to line-based chunks. These are cut without
+    overlap, since every chunk repeats the file and class headers anyway.
+
+    Args:
+        tree (ast.Module): Parsed (and possibly cleaned) module
+        chunk_size (int): Target chunk size in tokens
+        count_tokens (callable): Returns the token count of a text
+
+    Returns:
+        list: (context, text) pairs in source order; context is the enclosing
+            class header, or "" at module level
+    """
+    units = []
+    for node in tree.body:
+        text = ast.unparse(node)
+        if count_tokens(text) <= chunk_size:
+            units.append(("", text))
+        elif isinstance(node, ast.ClassDef) and node.body:
+            header = _class_header(node)
+            member_budget = max(1, chunk_size - count_tokens(header + "\n"))
+            for member in node.body:
+                member_text = textwrap.indent(ast.unparse(member), "    ")
+                if count_tokens(member_text) <= member_budget:
+                    units.append((header, member_text))
+                else:
+                    pieces = split_into_chunks(member_text, member_budget, 0, count_tokens)
+                    units.extend((header, piece) for piece in pieces)
+        else:
+            units.extend(("", piece) for piece in split_into_chunks(text, chunk_size, 0, count_tokens))
+    return units
+
+
+def _python_units(
+    source: str,
+    chunk_size: int,
+    tree: Optional[ast.Module] = None,
+    count_tokens: Callable[[str], int] = estimate_tokens
+) -> List[Tuple[str, str]]:
+    """
+    Return definition units for Python source, or line chunks if it does not parse.
+    """
+    if tree is None:
+        try:
+            tree = ast.parse(source)
+        except SyntaxError:
+            return [("", piece) for piece in split_into_chunks(source, chunk_size, 0, count_tokens)]
+    return definition_units(tree, chunk_size, count_tokens)
+
+
+def _notebook_units(
+    body: str,
+    chunk_size: int,
+    count_tokens: Callable[[str], int] = estimate_tokens
+) -> List[Tuple[str, str]]:
+    """
+    Return one unit per notebook cell, splitting oversized code cells on definitions.
+    """
+    # Cells are either "## Cell N (type)" sections or bare ```python blocks
+    cell_pattern = NOTEBOOK_CELL_PATTERN if NOTEBOOK_CELL_PATTERN.search(body) else CODE_CELL_PATTERN
+    units = []
+    for cell in cell_pattern.split(body):
+        cell = cell.strip("\n")
+        if not cell:
+            continue
+        if count_tokens(cell) <= chunk_size:
+            units.append(("", cell))
+            continue
+        code = PYTHON_FENCE_PATTERN.search(cell)
+        if code:
+            units.extend(_python_units(code.group(1), chunk_size, count_tokens=count_tokens))
+        else:
+            units.extend(("", piece) for piece in split_into_chunks(cell, chunk_size, 0, count_tokens))
+    return units
+
+
+def iter_semantic_chunks(
+    files: Iterable[Tuple[str, str]],
+    chunk_size: int = 1500,
+    trees: Optional[Dict[str, ast.Module]] = None,
+    count_tokens: Callable[[str], int] = estimate_tokens
+) -> Iterator[str]:
+    """
+    Yield chunks cut on file, class and function boundaries from a stream of files.
+
+    Only the chunk being filled is held, so files can come straight from
+    extraction without the whole repository content ever being built.
+    See semantic_chunks() for how chunks are cut.
+
+    Args:
+        files (iterable): (path, body) pairs in repository order
+        chunk_size (int): Target chunk size in tokens
+        trees (dict): ASTs already built during extraction, keyed by the header path;
+            files without an entry are parsed here
+        count_tokens (callable): Returns the token count of a text
+
+    Yields:
+        str: Content chunks
+    """
+    trees = trees or {}
+    parts = []
+    chunk_tokens = 0
+    current_path = None
+    current_context = None
+
+    def render(path: str, context: str, text: str, starts_chunk: bool) -> str:
+        lines = []
+        if path and (starts_chunk or path != current_path):
+            lines.append(f"# File: {path}")
+        if context and (starts_chunk or path != current_path or context != current_context):
+            lines.append(context)
+        lines.append(text)
+        return "\n".join(lines)
+
+    for path, body in files:
+        # Leave room for the "# File:" header repeated at the top of each chunk
+        unit_budget = max(1, chunk_size - count_tokens(f"# File: {path}\n"))
+        if path.endswith(".py"):
+            units = _python_units(body, unit_budget, trees.get(path), count_tokens)
+        elif path.endswith(".ipynb"):
+            units = _notebook_units(body, unit_budget, count_tokens)
+        elif count_tokens(body) <= unit_budget:
+            units = [("", body)]
+        else:
+            units = [("", piece) for piece in split_into_chunks(body, unit_budget, 0, count_tokens)]
+
+        for context, text in units:
+            piece = render(path, context, text, not parts)
+            piece_tokens = count_tokens(piece)
+            if parts and chunk_tokens + piece_tokens > chunk_size:
+                yield "\n\n".join(parts)
+                parts = []
+                piece = render(path, context, text, True)
+                piece_tokens = count_tokens(piece)
+                chunk_tokens = 0
+
+            parts.append(piece)
+            chunk_tokens += piece_tokens
+            current_path = path
+            current_context = context
+
+    if parts:
+        yield "\n\n".join(parts)
+
+
+def iter_record_chunks(
+    records: Iterable[Tuple[str, str]],
+    chunk_size: int = 1500,
+    trees: Optional[Dict[str, ast.Module]] = None,
+    count_tokens: Callable[[str], int] = estimate_tokens
+) -> Iterator[str]:
+    """
+    Yield semantic chunks from extracted file records as they arrive.
+
+    Args:
+        records (iterable): (file path, corpus entry) pairs, as yielded by
+            extraction_utils.iter_extracted_files()
+        chunk_size (int): Target chunk size in tokens
+        trees (dict): ASTs keyed by file header path; files without one are parsed here
+        count_tokens (callable): Returns the token count of a text
+
+    Yields:
+        str: Content chunks
+    """
+    files = (pair for _, entry in records for pair in split_repository_files(entry))
+    return iter_semantic_chunks(files, chunk_size, trees, count_tokens)
+
+
+def semantic_chunks(
+    content: str,
+    chunk_size: int = 1500,
+    trees: Optional[Dict[str, ast.Module]] = None,
+    count_tokens: Callable[[str], int] = estimate_tokens
+) -> List[str]:
+    """
+    Divide repository content into chunks cut on file, class and function boundaries.
+
+    Whole definitions (and whole small files) are packed into a chunk until
+    the next one would exceed chunk_size. Each chunk starts with the
+    "# File:" header of the file it continues, and with the class header when
+    it continues the members of a split class, so every chunk is readable on
+    its own. Python files and notebook code are cut on definitions; other
+    files fall back to line-based chunks without overlap.
+
+    Args:
+        content (str): Repository content with a "# File: <path>" line before each file
+        chunk_size (int): Target chunk size in tokens
+        trees (dict): ASTs already built during extraction, keyed by the header path;
+            files without an entry are parsed here
+        count_tokens (callable): Returns the token count of a text
+
+    Returns:
+        list: List of content chunks
+    """
+    return list(iter_semantic_chunks(split_repository_files(content), chunk_size, trees, count_tokens))
+
+
+def pack_files(
+    content: str,
+    chunk_size: int = 1500,
+    trees: Optional[Dict[str, ast.Module]] = None,
+    count_tokens: Callable[[str], int] = estimate_tokens
+) -> List[str]:
+    """
+    Bin-pack whole files into as few chunks as the token budget allows.
+
+    Each file (with its "# File:" header) is one item; a file larger than the
+    budget is first split on definition boundaries with semantic_chunks().
+    Items are placed first-fit-decreasing by token count, and the files in
+    each chunk are then put back in repository order so related files stay
+    together in the text the model reads.
+
+    Args:
+        content (str): Repository content with a "# File: <path>" line before each file
+        chunk_size (int): Target chunk size in tokens
+        trees (dict): ASTs built during extraction, keyed by file header path
+        count_tokens (callable): Returns the token count of a text
+
+    Returns:
+        list: List of content chunks
+    """
+    items = []
+    for path, body in split_repository_files(content):
+        text = f"# File: {path}\n{body}" if path else body
+        if count_tokens(text) <= chunk_size:
+            items.append(text)
+        else:
+            single_file = {path: trees[path]} if trees and path in trees else None
+            items.extend(semantic_chunks(text, chunk_size, single_file, count_tokens))
+
+    # First-fit-decreasing: largest items first, each into the first chunk with room
+    sizes = [count_tokens(item) + 1 for item in items]
+    bins = []
+    bin_space = []
+    for index in sorted(range(len(items)), key=lambda i: sizes[i], reverse=True):
+        for bin_index, space in enumerate(bin_space):
+            if sizes[index] <= space:
+                bins[bin_index].append(index)
+                bin_space[bin_index] -= sizes[index]
+                break
+        else:
+            bins.append([index])
+            bin_space.append(chunk_size - sizes[index])
+
+    # Emit chunks in the order of their first file, files in repository order
+    bins = sorted((sorted(indices) for indices in bins), key=lambda indices: indices[0])
+    return ["\n\n".join(items[index] for index in indices) for indices in bins]
+
+
+def report_packing_savings(
+    content: str,
+    packed_chunks: List[str],
+    chunk_size: int = 1500,
+    overlap: int = 50,
+    count_tokens: Optional[Callable[[str], int]] = None
+) -> int:
+    """
+    Print how many model calls bin-packing saves over line-based chunking.
+
+    Args:
+        content (str): The full repository content
+        packed_chunks (list): Chunks planned by pack_files()
+        chunk_size (int): Target chunk size in tokens
+        overlap (int): Overlap lines of the line-based chunker
+        count_tokens (callable): Token counter the chunks were planned with (optional)
+
+    Returns:
+        int: Number of calls saved (negative if packing needs more)
+    """
+    line_chunks = sum(1 for _ in iter_chunk_boundaries(content, chunk_size, overlap, count_tokens))
+    saved = line_chunks - len(packed_chunks)
+    percentage = saved / line_chunks * 100 if line_chunks else 0.0
+    print(f"Bin-packing planner: {len(packed_chunks)} chunks vs {line_chunks} with line-based chunking "
+          f"({saved} calls saved, {percentage:.1f}%)")
+    return saved
+
+
+def split_content(
+    content: str,
+    chunk_size: int = 1500,
+    overlap: int = 50,
+    mode: str = "lines",
+    trees: Optional[Dict[str, ast.Module]] = None,
+    count_tokens: Callable[[str], int] = estimate_tokens
+) -> List[str]:
+    """
+    Divide repository content into chunks with the selected chunking mode.
+
+    Args:
+        content (str): The full repository content
+        chunk_size (int): Target chunk size in tokens
+        overlap (int): Number of lines to overlap between chunks ("lines" mode only)
+        mode (str): "lines" for overlapping line windows, "ast" for definition boundaries,
+            "pack" to bin-pack whole files
+        trees (dict): ASTs built during extraction, keyed by file header path ("ast" and "pack" modes)
+        count_tokens (callable): Returns the token count of a text (see token_utils)
+
+    Returns:
+        list: List of content chunks
+    """
+    if mode not in CHUNKING_MODES:
+        raise ValueError(f"Unknown chunking mode '{mode}', expected one of {CHUNKING_MODES}")
+    if mode == "ast":
+        return semantic_chunks(content, chunk_size, trees, count_tokens)
+    if mode == "pack":
+        return pack_files(content, chunk_size, trees, count_tokens)
+    return split_into_chunks(content, chunk_size, overlap, count_tokens)
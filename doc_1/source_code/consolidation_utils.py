@@ -0,0 +1,333 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Helpers for consolidating per-chunk documentation fragments.
+
+Instead of sending every fragment to the model in one consolidation prompt,
+fragments can be merged hierarchically: neighbouring fragments are grouped up
+to a token budget, each group is merged by its own (parallel) model call, and
+the merged results are grouped again level by level until one document remains.
+
+The incremental variant stores every merged node under a Merkle hash of its
+inputs, so a re-run only re-merges the nodes whose inputs actually changed.
+"""
+
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Tuple
+
+from bedrock_utils import ResponseCache
+
+
+# Default input budget for a single merge call, in estimated tokens
+DEFAULT_CONSOLIDATION_BUDGET = 16000
+
+# Average number of nodes merged together by the incremental (Merkle) reduction
+DEFAULT_MERKLE_FANOUT = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the token size of a text (approximately 4 characters per token).
+
+    Args:
+        text (str): Text to measure
+
+    Returns:
+        int: Estimated token count
+    """
+    return len(text) // 4
+
+
+def group_fragments(fragments: List[str], token_budget: int = DEFAULT_CONSOLIDATION_BUDGET) -> List[List[str]]:
+    """
+    Split fragments into contiguous groups whose combined size fits the budget.
+
+    Order is preserved so that merged documentation still follows the
+    repository layout. A fragment larger than the budget forms its own group.
+
+    Args:
+        fragments (list): Documentation fragments in chunk order
+        token_budget (int): Maximum estimated tokens per group
+
+    Returns:
+        list: List of fragment groups
+    """
+    groups = []
+    current_group = []
+    current_tokens = 0
+
+    for fragment in fragments:
+        fragment_tokens = estimate_tokens(fragment)
+        if current_group and current_tokens + fragment_tokens > token_budget:
+            groups.append(current_group)
+            current_group = []
+            current_tokens = 0
+
+        current_group.append(fragment)
+        current_tokens += fragment_tokens
+
+    if current_group:
+        groups.append(current_group)
+
+    return groups
+
+
+def tree_reduce_fragments(
+    fragments: List[str],
+    merge_fn: Callable[[List[str]], str],
+    token_budget: int = DEFAULT_CONSOLIDATION_BUDGET,
+    max_workers: int = 1
+) -> str:
+    """
+    Merge documentation fragments level by level until one document remains.
+
+    Each level groups the current fragments with group_fragments() and merges
+    the groups concurrently. Groups holding a single fragment are carried to
+    the next level unchanged; if no two fragments fit a budget together they
+    are merged pairwise so that every level shrinks.
+
+    Args:
+        fragments (list): Documentation fragments in chunk order
+        merge_fn (callable): Merges a list of fragments into one document
+        token_budget (int): Maximum estimated input tokens per merge call
+        max_workers (int): Number of merge calls run concurrently
+
+    Returns:
+        str: Consolidated documentation
+    """
+    if not fragments:
+        return ""
+
+    # A single fragment still goes through one consolidation pass
+    if len(fragments) == 1:
+        return merge_fn(fragments)
+
+    level = 0
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        while len(fragments) > 1:
+            level += 1
+            groups = group_fragments(fragments, token_budget)
+            if len(groups) == len(fragments):
+                groups = [fragments[i:i + 2] for i in range(0, len(fragments), 2)]
+
+            merge_count = sum(1 for group in groups if len(group) > 1)
+            print(f"Consolidation level {level}: merging {len(fragments)} fragments "
+                  f"into {len(groups)} ({merge_count} merge calls)...")
+
+            fragments = list(executor.map(
+                lambda group: merge_fn(group) if len(group) > 1 else group[0],
+                groups
+            ))
+
+    return fragments[0]
+
+
+def project_consolidation(
+    fragment_count: int,
+    fragment_tokens: int,
+    merged_tokens: int,
+    mode: str = "single",
+    token_budget: int = DEFAULT_CONSOLIDATION_BUDGET,
+    fanout: int = DEFAULT_MERKLE_FANOUT
+) -> List[Tuple[int, int]]:
+    """
+    Project the merge calls of a consolidation before any fragment exists.
+
+    Fragments are assumed to be of equal size. "single" sends every fragment
+    in one call; "tree" groups as many fragments as fit the budget, like
+    tree_reduce_fragments(); "merkle" (tree mode with a consolidation cache)
+    merges about `fanout` nodes per call, bounded by the budget, like
+    merkle_reduce_fragments() on a first run with nothing to reuse.
+
+    Args:
+        fragment_count (int): Number of chunk fragments
+        fragment_tokens (int): Estimated tokens of each fragment
+        merged_tokens (int): Estimated tokens of each merged result
+        mode (str): "single", "tree" or "merkle"
+        token_budget (int): Maximum input tokens per merge call
+        fanout (int): Average group size of the incremental reduction
+
+    Returns:
+        list: (merge calls, input tokens per call) for each level, bottom up
+    """
+    if fragment_count <= 0:
+        return []
+    if mode == "single" or fragment_count == 1:
+        return [(1, fragment_count * fragment_tokens)]
+
+    levels = []
+    nodes = fragment_count
+    node_tokens = fragment_tokens
+    while nodes > 1:
+        per_group = max(2, token_budget // max(1, node_tokens))
+        if mode == "merkle":
+            per_group = min(per_group, fanout)
+        groups = -(-nodes // per_group)
+        # A trailing group of one node is carried over rather than merged
+        merges = groups - (1 if nodes % per_group == 1 else 0)
+        levels.append((merges, min(per_group, nodes) * node_tokens))
+        nodes = groups
+        node_tokens = merged_tokens
+    return levels
+
+
+def fragment_hash(text: str) -> str:
+    """
+    Return the Merkle leaf hash of a documentation fragment.
+
+    Args:
+        text (str): Fragment text
+
+    Returns:
+        str: Hex SHA-256 digest
+    """
+    return hashlib.sha256(("leaf:" + text).encode("utf-8")).hexdigest()
+
+
+def merkle_node_hash(child_hashes: List[str], namespace: str = "") -> str:
+    """
+    Return the Merkle hash of a merged node from the hashes of its inputs.
+
+    Args:
+        child_hashes (list): Hashes of the merged nodes, in order
+        namespace (str): Identifies the merge setup (model, prompts) so that
+            different configurations never share results
+
+    Returns:
+        str: Hex SHA-256 digest
+    """
+    payload = "node:" + namespace + ":" + ",".join(child_hashes)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def group_nodes_by_content(
+    nodes: List[Tuple[str, str]],
+    token_budget: int = DEFAULT_CONSOLIDATION_BUDGET,
+    fanout: int = DEFAULT_MERKLE_FANOUT,
+    level: int = 0
+) -> List[List[Tuple[str, str]]]:
+    """
+    Split (hash, text) nodes into contiguous groups with content-defined boundaries.
+
+    A group ends after any node whose hash falls on a boundary (about one node
+    in `fanout`), or before a node that would exceed the token budget. Because
+    boundaries depend on node content rather than position, changing,
+    inserting or removing one fragment only regroups its neighbourhood; every
+    other group keeps exactly the same inputs and therefore the same hash.
+    The boundary test is salted with the level, so a node carried up unmerged
+    does not end up on a boundary at every level.
+
+    Args:
+        nodes (list): (hash, text) pairs in chunk order
+        token_budget (int): Maximum estimated tokens per group
+        fanout (int): Average group size
+        level (int): Reduction level the grouping is for
+
+    Returns:
+        list: List of node groups
+    """
+    groups = []
+    current_group = []
+    current_tokens = 0
+
+    for node_hash, text in nodes:
+        node_tokens = estimate_tokens(text)
+        if current_group and current_tokens + node_tokens > token_budget:
+            groups.append(current_group)
+            current_group = []
+            current_tokens = 0
+
+        current_group.append((node_hash, text))
+        current_tokens += node_tokens
+
+        boundary_hash = hashlib.sha256(f"{level}:{node_hash}".encode("utf-8")).hexdigest()
+        if int(boundary_hash[:8], 16) % fanout == 0:
+            groups.append(current_group)
+            current_group = []
+            current_tokens = 0
+
+    if current_group:
+        groups.append(current_group)
+
+    return groups
+
+
+def merkle_reduce_fragments(
+    fragments: List[str],
+    merge_fn: Callable[[List[str]], str],
+    store: ResponseCache,
+    namespace: str = "",
+    token_budget: int = DEFAULT_CONSOLIDATION_BUDGET,
+    max_workers: int = 1,
+    fanout: int = DEFAULT_MERKLE_FANOUT
+) -> str:
+    """
+    Tree-reduce fragments, reusing merged subtrees stored under their Merkle hash.
+
+    Every merged node is stored against the hash of its inputs. On a re-run
+    where one fragment changed, only the nodes on the path from that fragment
+    to the root get new hashes, so only those are sent to the model; every
+    untouched subtree summary is read back from the store.
+
+    Args:
+        fragments (list): Documentation fragments in chunk order
+        merge_fn (callable): Merges a list of fragments into one document
+        store (ResponseCache): Persistent store for merged nodes
+        namespace (str): Identifies the merge setup (model, prompts)
+        token_budget (int): Maximum estimated input tokens per merge call
+        max_workers (int): Number of merge calls run concurrently
+        fanout (int): Average number of nodes merged per call
+
+    Returns:
+        str: Consolidated documentation
+    """
+    if not fragments:
+        return ""
+
+    nodes = [(fragment_hash(fragment), fragment) for fragment in fragments]
+    reused = 0
+    merged = 0
+
+    def merge_group(group: List[Tuple[str, str]]) -> Tuple[str, str]:
+        node_hash = merkle_node_hash([child_hash for child_hash, _ in group], namespace)
+        text = merge_fn([child_text for _, child_text in group])
+        store.put(node_hash, {"text": text})
+        return node_hash, text
+
+    level = 0
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        # A single fragment still goes through one consolidation pass
+        while len(nodes) > 1 or level == 0:
+            level += 1
+            groups = group_nodes_by_content(nodes, token_budget, fanout, level)
+            if len(nodes) > 1 and len(groups) == len(nodes):
+                groups = [nodes[i:i + 2] for i in range(0, len(nodes), 2)]
+
+            next_nodes = [None] * len(groups)
+            pending = []
+            for index, group in enumerate(groups):
+                if len(group) == 1 and len(nodes) > 1:
+                    next_nodes[index] = group[0]
+                    continue
+
+                node_hash = merkle_node_hash([child_hash for child_hash, _ in group], namespace)
+                stored = store.get(node_hash)
+                if stored is not None:
+                    next_nodes[index] = (node_hash, stored["text"])
+                    reused += 1
+                else:
+                    pending.append((index, group))
+
+            print(f"Consolidation level {level}: {len(nodes)} nodes into {len(groups)} "
+                  f"({len(pending)} merge calls, {len(groups) - len(pending)} reused or carried over)...")
+
+            for (index, _), result in zip(pending, executor.map(lambda item: merge_group(item[1]), pending)):
+                next_nodes[index] = result
+                merged += 1
+
+            nodes = next_nodes
+
+    print(f"Incremental consolidation: {merged} merges, {reused} subtree summaries reused")
+    return nodes[0][1]
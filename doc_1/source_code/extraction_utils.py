@@ -0,0 +1,691 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Helpers for extracting repository source code into a single corpus file.
+
+Candidate files are selected with the same extension and path filters the
+generator scripts have always used, compiled into one regular expression.
+The walker prunes excluded, hidden and test directories (and anything matched
+by .gitignore) before descending into them. Reading and cleaning each file (parsing
+Python with ast and unparsing it without docstrings) is independent per file
+and CPU-bound, so it is fanned out across a process pool; results are written
+to the corpus in sorted path order, so the output is the same for any number
+of workers.
+
+An optional SQLite manifest records each file's mtime, size, content hash and
+cleaned output, so repeated runs only re-process new or modified files.
+"""
+
+import os
+import re
+import ast
+import json
+import sqlite3
+import hashlib
+from functools import partial
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from notebook_utils import read_notebook_cells
+
+
+# List of file extensions to include
+CODE_EXTENSIONS = [
+    ".py", ".ipynb", ".js", ".jsx", ".ts", ".tsx", ".java", ".c", ".cpp", ".h",
+    ".go", ".rs", ".php", ".rb", ".cs", ".sh", ".html", ".css", ".scss"
+]
+
+# List of directories and file patterns to exclude
+EXCLUDED_DIRS = [
+    "docs",
+    "examples",
+    "tests",
+    "test",
+    "__pycache__",
+    "scripts",
+    "benchmarks",
+    "node_modules",
+    ".venv",
+]
+UTILITY_OR_CONFIG_FILES = ["hubconf.py", "setup.py", "package-lock.json"]
+GITHUB_WORKFLOW_OR_DOCS = ["stale.py", "gen-card-", "write_model_card"]
+
+# Files handed to each worker at a time; keeps inter-process overhead low on large repositories
+EXTRACTION_BATCH_SIZE = 16
+
+
+class PathFilter:
+    """
+    Precompiled form of the extension and path filters.
+
+    All checks (extension, hidden component, "test" anywhere in the path,
+    excluded directory, excluded file name fragments) are evaluated by a single
+    regular expression instead of a chain of substring scans per file. The
+    directory part of the checks is also available on its own, so a walker can
+    skip whole directories whose files would all be rejected.
+    """
+
+    def __init__(
+        self,
+        code_extensions: List[str] = CODE_EXTENSIONS,
+        excluded_dirs: List[str] = EXCLUDED_DIRS,
+        utility_or_config_files: List[str] = UTILITY_OR_CONFIG_FILES,
+        github_workflow_or_docs: List[str] = GITHUB_WORKFLOW_OR_DOCS
+    ):
+        """
+        Compile the filters.
+
+        Args:
+            code_extensions (list): File extensions to include
+            excluded_dirs (list): Directory names to exclude
+            utility_or_config_files (list): File name fragments to exclude
+            github_workflow_or_docs (list): Workflow/doc file name fragments to exclude
+        """
+        directory_rejects = [r"/\.", r"(?i:test)"]
+        if excluded_dirs:
+            directory_rejects.append("(?:^|/)(?:" + "|".join(map(re.escape, excluded_dirs)) + ")/")
+        file_rejects = directory_rejects + [re.escape(fragment) for fragment in
+                                            list(utility_or_config_files) + list(github_workflow_or_docs)]
+        extensions = "|".join(map(re.escape, code_extensions)) or "(?!)"
+
+        self._directory_pattern = re.compile("|".join(directory_rejects))
+        self._file_pattern = re.compile(
+            r"(?s)(?!.*(?:" + "|".join(file_rejects) + r")).*(?:" + extensions + r")\Z"
+        )
+
+    def matches(self, path: str) -> bool:
+        """
+        Check whether a file should be included in the extracted corpus.
+
+        Args:
+            path (str): File path
+
+        Returns:
+            bool: True if the file passes every filter
+        """
+        return self._file_pattern.match(path.replace("\\", "/")) is not None
+
+    def excludes_directory(self, path: str) -> bool:
+        """
+        Check whether every file below a directory would be rejected.
+
+        Args:
+            path (str): Directory path
+
+        Returns:
+            bool: True if the directory can be skipped without walking it
+        """
+        return self._directory_pattern.search(path.replace("\\", "/").rstrip("/") + "/") is not None
+
+
+def _gitignore_regex(pattern: str) -> "re.Pattern":
+    """
+    Translate one .gitignore pattern (without negation or trailing slash) to a regex.
+    """
+    # A slash anywhere but at the end anchors the pattern to the .gitignore directory
+    anchored = "/" in pattern
+    pattern = pattern.lstrip("/")
+    parts = []
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            parts.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("/**", i) and i + 3 == len(pattern):
+            parts.append("/.*")
+            i += 3
+        elif pattern.startswith("**", i):
+            parts.append(".*")
+            i += 2
+        elif pattern[i] == "*":
+            parts.append("[^/]*")
+            i += 1
+        elif pattern[i] == "?":
+            parts.append("[^/]")
+            i += 1
+        elif pattern[i] == "[" and "]" in pattern[i + 2:]:
+            close = pattern.index("]", i + 2)
+            char_class = pattern[i + 1:close]
+            if char_class.startswith("!"):
+                char_class = "^" + char_class[1:]
+            parts.append("[" + char_class.replace("\\", "\\\\") + "]")
+            i = close + 1
+        elif pattern[i] == "\\" and i + 1 < len(pattern):
+            parts.append(re.escape(pattern[i + 1]))
+            i += 2
+        else:
+            parts.append(re.escape(pattern[i]))
+            i += 1
+    return re.compile(("" if anchored else "(?:.*/)?") + "".join(parts) + r"\Z", re.DOTALL)
+
+
+class GitignoreRules:
+    """
+    Patterns of one .gitignore file, applied to paths below its directory.
+    """
+
+    def __init__(self, base: str, lines: List[str]):
+        """
+        Compile the patterns of a .gitignore file.
+
+        Args:
+            base (str): Directory of the .gitignore relative to the repository root ("" for the root)
+            lines (list): Lines of the .gitignore file
+        """
+        self.base = base + "/" if base else ""
+        self.rules = []
+        for line in lines:
+            line = line.rstrip("\n").rstrip()
+            if not line or line.startswith("#"):
+                continue
+            negate = line.startswith("!")
+            if negate:
+                line = line[1:]
+            elif line.startswith("\\"):
+                line = line[1:]
+            directory_only = line.endswith("/")
+            line = line.rstrip("/")
+            if line:
+                self.rules.append((_gitignore_regex(line), negate, directory_only))
+
+    @classmethod
+    def from_file(cls, path: str, base: str) -> Optional["GitignoreRules"]:
+        """
+        Load a .gitignore file, returning None if it cannot be read.
+
+        Args:
+            path (str): Path to the .gitignore file
+            base (str): Its directory relative to the repository root
+        """
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return cls(base, f.readlines())
+        except (OSError, UnicodeDecodeError):
+            return None
+
+    def match(self, relative_path: str, is_dir: bool) -> Optional[bool]:
+        """
+        Apply the patterns to a path.
+
+        Args:
+            relative_path (str): Path relative to the repository root, with "/" separators
+            is_dir (bool): Whether the path is a directory
+
+        Returns:
+            bool: True if ignored, False if re-included by a "!" pattern, None if no pattern matches
+        """
+        if not relative_path.startswith(self.base):
+            return None
+        path = relative_path[len(self.base):]
+        ignored = None
+        for regex, negate, directory_only in self.rules:
+            if directory_only and not is_dir:
+                continue
+            if regex.match(path):
+                ignored = not negate
+        return ignored
+
+
+def list_candidate_files(repo_dir: str, use_gitignore: bool = True, **filters) -> List[str]:
+    """
+    List the files of a repository that pass the extraction filters, in sorted path order.
+
+    Directories that are excluded, hidden, test directories or ignored by a
+    .gitignore are pruned before the walk descends into them. Filters are
+    applied to paths relative to repo_dir, so the location of the repository
+    itself never excludes its files.
+
+    Args:
+        repo_dir (str): Repository root
+        use_gitignore (bool): Honour .gitignore files in the repository
+        **filters: Filter lists passed on to PathFilter
+
+    Returns:
+        list: Sorted file paths
+    """
+    path_filter = PathFilter(**filters)
+    gitignores = {}
+
+    def ignored(relative_path: str, is_dir: bool) -> bool:
+        # Rules of outer directories first; a deeper .gitignore overrides them
+        result = False
+        for rules in gitignores.values():
+            decision = rules.match(relative_path, is_dir)
+            if decision is not None:
+                result = decision
+        return result
+
+    file_paths = []
+    for root, dirs, files in os.walk(repo_dir):
+        relative_root = os.path.relpath(root, repo_dir).replace(os.sep, "/")
+        relative_root = "" if relative_root == "." else relative_root
+
+        if use_gitignore and ".gitignore" in files:
+            rules = GitignoreRules.from_file(os.path.join(root, ".gitignore"), relative_root)
+            if rules is not None:
+                gitignores[relative_root] = rules
+
+        prefix = relative_root + "/" if relative_root else ""
+        dirs[:] = sorted(
+            name for name in dirs
+            if not path_filter.excludes_directory("/" + prefix + name)
+            and not (gitignores and ignored(prefix + name, True))
+        )
+
+        for file in files:
+            relative_path = prefix + file
+            if path_filter.matches("/" + relative_path) and not (gitignores and ignored(relative_path, False)):
+                file_paths.append(os.path.join(root, file))
+
+    return sorted(file_paths)
+
+
+def clean_python_source(source: str) -> str:
+    """
+    Remove docstrings and string-expression comments from Python source.
+
+    Args:
+        source (str): Python source code
+
+    Returns:
+        str: Cleaned source code
+
+    Raises:
+        SyntaxError: If the source cannot be parsed
+    """
+    tree = ast.parse(source)
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.FunctionDef, ast.ClassDef, ast.AsyncFunctionDef)) and ast.get_docstring(node):
+            node.body = node.body[1:]  # Remove docstring
+        elif isinstance(node, ast.Expr) and isinstance(node.value, ast.Constant) and isinstance(node.value.value, str):
+            node.value.value = ""  # Remove comments
+    return ast.unparse(tree)
+
+
+def extract_file(file_path: str, repo_dir: Optional[str] = None, notebook_cells: bool = False) -> Optional[str]:
+    """
+    Read and clean one file, returning its corpus entry.
+
+    Args:
+        file_path (str): Path to the file
+        repo_dir (str): If set, the "# File:" header uses the path relative to this directory
+        notebook_cells (bool): Write only the code cells of notebooks instead of the raw JSON
+
+    Returns:
+        str: "# File: <path>" header followed by the cleaned content, or None
+            if the file was skipped or could not be read
+    """
+    try:
+        with open(file_path, "r", encoding="utf-8") as file_content:
+            file_lines = file_content.readlines()
+    except Exception as e:
+        print(f"Error reading file {file_path}: {e}")
+        return None
+
+    # Skip files with insufficient substantive content
+    lines = [
+        line
+        for line in file_lines
+        if line.strip() and not line.strip().startswith("//")
+    ]
+    if len(lines) < 5:  # Skip files with less than 5 substantive lines
+        return None
+
+    header_path = os.path.relpath(file_path, repo_dir) if repo_dir else file_path
+    parts = [f"# File: {header_path}\n"]
+
+    # For Python files, try to clean comments and docstrings
+    if file_path.endswith(".py"):
+        try:
+            parts.append(clean_python_source("".join(file_lines)))
+        except Exception:
+            # If ast parsing fails, write the original source
+            parts.extend(file_lines)
+    # Handle Jupyter notebooks
+    elif notebook_cells and file_path.endswith(".ipynb"):
+        try:
+            # Cell outputs are skipped without being parsed
+            for cell in read_notebook_cells("".join(file_lines)):
+                if cell.get("cell_type") == "code":
+                    parts.append("```python\n")
+                    parts.append(cell.get("source", ""))
+                    parts.append("\n```\n\n")
+        except Exception:
+            parts.append("# Failed to parse notebook\n")
+            parts.extend(file_lines)
+    else:
+        # For non-Python files, write original content
+        parts.extend(file_lines)
+
+    parts.append("\n\n")
+    return "".join(parts)
+
+
+def _hash_and_extract(
+    item: Tuple[str, Optional[str]],
+    repo_dir: Optional[str] = None,
+    notebook_cells: bool = False
+) -> Tuple[str, Optional[str], bool]:
+    """
+    Hash a file and extract it unless its content matches the known hash.
+
+    Args:
+        item (tuple): (file path, content hash recorded in the manifest or None)
+        repo_dir (str): Passed on to extract_file()
+        notebook_cells (bool): Passed on to extract_file()
+
+    Returns:
+        tuple: (content hash, corpus entry, True if the content was unchanged
+            and the recorded entry can be reused)
+    """
+    file_path, known_hash = item
+    try:
+        with open(file_path, "rb") as f:
+            content_hash = hashlib.sha256(f.read()).hexdigest()
+    except Exception as e:
+        print(f"Error reading file {file_path}: {e}")
+        return "", None, False
+
+    if content_hash == known_hash:
+        return content_hash, None, True
+    return content_hash, extract_file(file_path, repo_dir, notebook_cells), False
+
+
+class ExtractionManifest:
+    """
+    Persistent record of extracted files stored in SQLite.
+
+    Each row holds a file's path, mtime, size, content hash and its cleaned
+    corpus entry (NULL for files that were skipped, e.g. too short). A file
+    whose mtime and size are unchanged is reused without being read; one whose
+    mtime changed but whose content hash is the same is reused after hashing.
+    The extraction options are part of the record, so changing them
+    (relative paths, notebook handling) re-processes every file.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+
+        self._conn = sqlite3.connect(db_path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            "path TEXT PRIMARY KEY, mtime_ns INTEGER NOT NULL, size INTEGER NOT NULL, "
+            "hash TEXT NOT NULL, options TEXT NOT NULL, entry TEXT)"
+        )
+        self._conn.commit()
+
+    def load(self, options: str) -> Dict[str, Tuple[int, int, str]]:
+        """
+        Return the metadata of recorded files extracted with the given options.
+
+        Args:
+            options (str): Extraction options the entries must have been made with
+
+        Returns:
+            dict: path -> (mtime_ns, size, hash)
+        """
+        rows = self._conn.execute(
+            "SELECT path, mtime_ns, size, hash FROM files WHERE options = ?", (options,)
+        )
+        return {row[0]: row[1:] for row in rows}
+
+    def entries(self, paths: List[str]) -> Dict[str, Optional[str]]:
+        """
+        Return the recorded corpus entries of some files.
+
+        Entries are fetched per batch of files rather than all at once, so
+        memory use does not grow with the size of the repository.
+
+        Args:
+            paths (list): File paths
+
+        Returns:
+            dict: path -> corpus entry (None for skipped files)
+        """
+        found = {}
+        for start in range(0, len(paths), 500):
+            batch = paths[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            rows = self._conn.execute(f"SELECT path, entry FROM files WHERE path IN ({placeholders})", batch)
+            found.update(rows)
+        return found
+
+    def store(self, records: List[Tuple[str, int, int, str, Optional[str]]], options: str) -> None:
+        """
+        Insert or update file records.
+
+        Args:
+            records (list): (path, mtime_ns, size, hash, entry) tuples
+            options (str): Extraction options the entries were made with
+        """
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO files (path, mtime_ns, size, hash, options, entry) VALUES (?, ?, ?, ?, ?, ?)",
+            [(path, mtime_ns, size, content_hash, options, entry)
+             for path, mtime_ns, size, content_hash, entry in records]
+        )
+        self._conn.commit()
+
+    def prune(self, current_paths: List[str]) -> int:
+        """
+        Remove records of files that no longer exist or are no longer extracted.
+
+        Args:
+            current_paths (list): Paths of the current candidate files
+
+        Returns:
+            int: Number of records removed
+        """
+        current = set(current_paths)
+        stale = [(path,) for (path,) in self._conn.execute("SELECT path FROM files") if path not in current]
+        self._conn.executemany("DELETE FROM files WHERE path = ?", stale)
+        self._conn.commit()
+        return len(stale)
+
+    def close(self) -> None:
+        """Close the database connection."""
+        self._conn.close()
+
+
+# Files extracted per pool round; only this many entries are held at once
+EXTRACTION_WINDOW_SIZE = 256
+
+
+def _process_pool(workers: int) -> Optional["ProcessPoolExecutor"]:
+    """
+    Create the extraction process pool with its workers running, or return None to extract serially.
+
+    The generator scripts run their pipeline at module level, so worker
+    processes must be forked rather than spawned (spawning re-runs the script).
+    Forking while other threads run can leave a child blocked on a lock one
+    of them held (stdout, logging), so the workers are forked here, before
+    the caller starts any, and extraction runs serially if threads already exist.
+    """
+    # Imported here: multiprocessing adds noticeably to the startup of every script
+    import multiprocessing
+    import threading
+    from concurrent.futures import ProcessPoolExecutor
+
+    if workers <= 1 or "fork" not in multiprocessing.get_all_start_methods():
+        return None
+    if threading.active_count() > 1:
+        print("Other threads are running; extracting files serially instead of forking a process pool")
+        return None
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("fork"))
+    # The first task forks every worker, before the pool's own management thread starts
+    pool.submit(int).result()
+    return pool
+
+
+def iter_extracted_files(
+    repo_dir: str,
+    workers: Optional[int] = None,
+    relative_paths: bool = False,
+    notebook_cells: bool = False,
+    manifest_path: Optional[str] = None,
+    use_gitignore: bool = True,
+    file_paths: Optional[List[str]] = None,
+    **filters
+) -> Iterator[Tuple[str, str]]:
+    """
+    Yield the corpus entry of every extracted file, in sorted path order.
+
+    Files are read and cleaned by the process pool one window at a time, so
+    memory use is bounded by the window and the consumer (writing the corpus
+    file, chunking, building requests) never needs the whole corpus at once.
+    The files are listed and checked against the manifest, and the pool is
+    started, when this function is called rather than when the first record
+    is taken, so call it before starting threads that consume the records.
+
+    Args:
+        repo_dir (str): Repository root
+        workers (int): Number of worker processes (default: one per CPU; 1 extracts serially)
+        relative_paths (bool): Use paths relative to repo_dir in the "# File:" headers
+        notebook_cells (bool): Write only the code cells of notebooks
+        manifest_path (str): SQLite manifest of earlier extractions; unchanged files
+            are taken from it instead of being read and cleaned again
+        use_gitignore (bool): Skip files ignored by the repository's .gitignore files
+        file_paths (list): Candidate files, if already listed by list_candidate_files()
+        **filters: Filter lists passed on to PathFilter
+
+    Returns:
+        iterator: (file path, corpus entry starting with its "# File:" header) pairs
+    """
+    if file_paths is None:
+        file_paths = list_candidate_files(repo_dir, use_gitignore, **filters)
+    header_dir = repo_dir if relative_paths else None
+    options = json.dumps({"relative_to": header_dir, "notebook_cells": notebook_cells})
+
+    manifest = ExtractionManifest(manifest_path) if manifest_path else None
+    recorded = manifest.load(options) if manifest else {}
+
+    # Files whose mtime and size match the manifest are reused without being read
+    stats = {}
+    for file_path in file_paths:
+        try:
+            stat = os.stat(file_path)
+        except OSError as e:
+            print(f"Error reading file {file_path}: {e}")
+            continue
+        stats[file_path] = (stat.st_mtime_ns, stat.st_size)
+    changed = {file_path for file_path, stat in stats.items()
+               if file_path not in recorded or recorded[file_path][:2] != stat}
+
+    try:
+        pool = _process_pool(workers or os.cpu_count() or 1) if changed else None
+    except Exception:
+        if manifest:
+            manifest.close()
+        raise
+    return _iter_extraction_windows(file_paths, stats, changed, recorded, manifest, pool, options,
+                                    header_dir, notebook_cells)
+
+
+def _iter_extraction_windows(
+    file_paths: List[str],
+    stats: Dict[str, Tuple[int, int]],
+    changed_paths: Set[str],
+    recorded: Dict[str, Tuple[int, int, str]],
+    manifest: Optional["ExtractionManifest"],
+    pool: Optional["ProcessPoolExecutor"],
+    options: str,
+    header_dir: Optional[str],
+    notebook_cells: bool
+) -> Iterator[Tuple[str, str]]:
+    """
+    Extract the files of iter_extracted_files() window by window; shuts down its pool and manifest.
+    """
+    if manifest:
+        extract = partial(_hash_and_extract, repo_dir=header_dir, notebook_cells=notebook_cells)
+    else:
+        extract = partial(extract_file, repo_dir=header_dir, notebook_cells=notebook_cells)
+
+    unchanged_count = 0
+    rechecked_count = 0
+    updated_count = 0
+    try:
+        for window_start in range(0, len(file_paths), EXTRACTION_WINDOW_SIZE):
+            window = [file_path for file_path in file_paths[window_start:window_start + EXTRACTION_WINDOW_SIZE]
+                      if file_path in stats]
+            reused = [file_path for file_path in window if file_path not in changed_paths]
+            changed = [file_path for file_path in window if file_path in changed_paths]
+
+            # map() yields in input order, so results line up with the file list
+            if manifest:
+                items = [(file_path, recorded[file_path][2] if file_path in recorded else None)
+                         for file_path in changed]
+                results = list(pool.map(extract, items, chunksize=EXTRACTION_BATCH_SIZE) if pool else map(extract, items))
+                entries = manifest.entries(reused + [file_path for file_path, (_, _, unchanged) in zip(changed, results) if unchanged])
+                updates = []
+                for file_path, (content_hash, entry, unchanged) in zip(changed, results):
+                    if not unchanged:
+                        entries[file_path] = entry
+                    if content_hash:
+                        updates.append((file_path, *stats[file_path], content_hash, entries.get(file_path)))
+                manifest.store(updates, options)
+                unchanged_count += len(reused)
+                rechecked_count += len(changed)
+                updated_count += len(updates)
+            else:
+                results = pool.map(extract, changed, chunksize=EXTRACTION_BATCH_SIZE) if pool else map(extract, changed)
+                entries = dict(zip(changed, results))
+
+            for file_path in window:
+                entry = entries.get(file_path)
+                if entry is not None:
+                    yield file_path, entry
+
+        if manifest:
+            manifest.prune(file_paths)
+            print(f"Extraction manifest: {unchanged_count} files unchanged, "
+                  f"{rechecked_count} re-checked, {updated_count} updated")
+    finally:
+        if pool:
+            pool.shutdown()
+        if manifest:
+            manifest.close()
+
+
+def extract_repository(
+    repo_dir: str,
+    output_file: str,
+    workers: Optional[int] = None,
+    relative_paths: bool = False,
+    notebook_cells: bool = False,
+    verbose: bool = False,
+    manifest_path: Optional[str] = None,
+    use_gitignore: bool = True,
+    **filters
+) -> Tuple[int, int]:
+    """
+    Extract all candidate files of a repository into one corpus file.
+
+    Args:
+        repo_dir (str): Repository root
+        output_file (str): Path of the corpus file to write
+        workers (int): Number of worker processes (default: one per CPU; 1 extracts serially)
+        relative_paths (bool): Use paths relative to repo_dir in the "# File:" headers
+        notebook_cells (bool): Write only the code cells of notebooks
+        verbose (bool): Print each processed file
+        manifest_path (str): SQLite manifest of earlier extractions; unchanged files
+            are taken from it instead of being read and cleaned again
+        use_gitignore (bool): Skip files ignored by the repository's .gitignore files
+        **filters: Filter lists passed on to PathFilter
+
+    Returns:
+        tuple: (number of files written, number of candidate files)
+    """
+    file_paths = list_candidate_files(repo_dir, use_gitignore, **filters)
+    written = 0
+    with open(output_file, "w", encoding="utf-8") as outfile:
+        for file_path, entry in iter_extracted_files(repo_dir, workers, relative_paths, notebook_cells,
+                                                     manifest_path, file_paths=file_paths):
+            outfile.write(entry)
+            written += 1
+            if verbose:
+                print(f"  Processed: {os.path.relpath(file_path, repo_dir) if relative_paths else file_path}")
+
+    return written, len(file_paths)
@@ -1,10 +1,8 @@
 # %%
 import os
-import sys
-import ast
 #import boto3
-import json
-import re
+
+from extraction_utils import extract_repository
 
 # %%
 # Constants
@@ -39,6 +37,12 @@ OUTPUT_DIR = "doc_1/code_2_doc_folder/output_path"
 # Create output directory if it doesn't exist
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
+# Processes used for file extraction (None: one per CPU)
+EXTRACTION_WORKERS = None
+
+# Cleaned output of unchanged files is reused from this manifest (None: re-read every file)
+EXTRACTION_MANIFEST = os.path.join(OUTPUT_DIR, "extraction_manifest.sqlite")
+
 # List of file extensions to include
 code_extensions = [
     ".py", ".ipynb", ".js", ".jsx", ".ts", ".tsx", ".java", ".c", ".cpp", ".h", 
@@ -201,90 +205,18 @@ print(f"Extracting code from {REPO_DIR}...")
 repo_name = os.path.basename(REPO_DIR)
 output_file = os.path.join(OUTPUT_DIR, f"{repo_name}_code.txt")
 
-# Open the output file for writing
-with open(output_file, "w", encoding="utf-8") as outfile:
-    # Walk through the repository directory
-    for root, _, files in os.walk(REPO_DIR):
-        for file in files:
-            file_path = os.path.join(root, file)
-            
-            # Skip if file path ends with "/"
-            if file_path.endswith("/"):
-                continue
-            
-            # Check if file has a desired extension
-            if not any(file_path.endswith(ext) for ext in code_extensions):
-                continue
-            
-            # Check if file is in excluded directory
-            check_path = file_path.replace("\\", "/")
-            parts = check_path.split(os.sep)[1:]
-            if any(part.startswith(".") for part in parts):
-                continue
-            
-            if "test" in check_path.lower():
-                continue
-                
-            skip_file = False
-            for excluded_dir in excluded_dirs:
-                if f"/{excluded_dir}/" in check_path or check_path.startswith(f"{excluded_dir}/"):
-                    skip_file = True
-                    break
-                    
-            if skip_file:
-                continue
-                
-            for file_name in utility_or_config_files:
-                if file_name in check_path:
-                    skip_file = True
-                    break
-                    
-            if skip_file:
-                continue
-                
-            if not all(doc_file not in check_path for doc_file in github_workflow_or_docs):
-                continue
-            
-            # Try to read the file
-            try:
-                with open(file_path, "r", encoding="utf-8") as file_content:
-                    # Skip files with insufficient substantive content
-                    file_lines = file_content.readlines()
-                    lines = [
-                        line
-                        for line in file_lines
-                        if line.strip() and not line.strip().startswith("//")
-                    ]
-                    
-                    if len(lines) < 5:  # Skip files with less than 5 substantive lines
-                        continue
-                        
-                    # Write file path and content to output file
-                    outfile.write(f"# File: {file_path}\n")
-                    
-                    # For Python files, try to clean comments and docstrings
-                    if file_path.endswith(".py"):
-                        try:
-                            source = "".join(file_lines)
-                            tree = ast.parse(source)
-                            for node in ast.walk(tree):
-                                if isinstance(node, (ast.FunctionDef, ast.ClassDef, ast.AsyncFunctionDef)) and ast.get_docstring(node):
-                                    node.body = node.body[1:]  # Remove docstring
-                                elif isinstance(node, ast.Expr) and isinstance(node.value, ast.Str):
-                                    node.value.s = ""  # Remove comments
-                            cleaned_source = ast.unparse(tree)
-                            outfile.write(cleaned_source)
-                        except:
-                            # If ast parsing fails, write the original source
-                            outfile.writelines(file_lines)
-                    else:
-                        # For non-Python files, write original content
-                        outfile.writelines(file_lines)
-                        
-                    outfile.write("\n\n")
-            except Exception as e:
-                print(f"Error reading file {file_path}: {e}")
-
+# Read and clean files across a process pool; the corpus is written in sorted path order
+files_written, files_found = extract_repository(
+    REPO_DIR,
+    output_file,
+    workers=EXTRACTION_WORKERS,
+    manifest_path=EXTRACTION_MANIFEST,
+    code_extensions=code_extensions,
+    excluded_dirs=excluded_dirs,
+    utility_or_config_files=utility_or_config_files,
+    github_workflow_or_docs=github_workflow_or_docs,
+)
+print(f"Extracted {files_written} of {files_found} candidate files")
 print(f"Code extracted to {output_file}")
 
 # %%
@@ -298,89 +230,17 @@ with open(output_file, "w", encoding="utf-8") as outfile:
             file_path = os.path.join(root, file)
 
 # %%
-with open(output_file, "w", encoding="utf-8") as outfile:
-    # Walk through the repository directory
-    for root, _, files in os.walk(REPO_DIR):
-        for file in files:
-            file_path = os.path.join(root, file)
-            
-            # Skip if file path ends with "/"
-            if file_path.endswith("/"):
-                continue
-            
-            # Check if file has a desired extension
-            if not any(file_path.endswith(ext) for ext in code_extensions):
-                continue
-            
-            # Check if file is in excluded directory
-            check_path = file_path.replace("\\", "/")
-            parts = check_path.split(os.sep)[1:]
-            if any(part.startswith(".") for part in parts):
-                continue
-            
-            if "test" in check_path.lower():
-                continue
-                
-            skip_file = False
-            for excluded_dir in excluded_dirs:
-                if f"/{excluded_dir}/" in check_path or check_path.startswith(f"{excluded_dir}/"):
-                    skip_file = True
-                    break
-                    
-            if skip_file:
-                continue
-                
-            for file_name in utility_or_config_files:
-                if file_name in check_path:
-                    skip_file = True
-                    break
-                    
-            if skip_file:
-                continue
-                
-            if not all(doc_file not in check_path for doc_file in github_workflow_or_docs):
-                continue
-            
-            # Try to read the file
-            try:
-                with open(file_path, "r", encoding="utf-8") as file_content:
-                    # Skip files with insufficient substantive content
-                    file_lines = file_content.readlines()
-                    lines = [
-                        line
-                        for line in file_lines
-                        if line.strip() and not line.strip().startswith("//")
-                    ]
-                    
-                    if len(lines) < 5:  # Skip files with less than 5 substantive lines
-                        continue
-                        
-                    # Write file path and content to output file
-                    outfile.write(f"# File: {file_path}\n")
-                    
-                    # For Python files, try to clean comments and docstrings
-                    if file_path.endswith(".py"):
-                        try:
-                            source = "".join(file_lines)
-                            tree = ast.parse(source)
-                            for node in ast.walk(tree):
-                                if isinstance(node, (ast.FunctionDef, ast.ClassDef, ast.AsyncFunctionDef)) and ast.get_docstring(node):
-                                    node.body = node.body[1:]  # Remove docstring
-                                elif isinstance(node, ast.Expr) and isinstance(node.value, ast.Str):
-                                    node.value.s = ""  # Remove comments
-                            cleaned_source = ast.unparse(tree)
-                            outfile.write(cleaned_source)
-                        except:
-                            # If ast parsing fails, write the original source
-                            outfile.writelines(file_lines)
-                    else:
-                        # For non-Python files, write original content
-                        outfile.writelines(file_lines)
-                        
-                    outfile.write("\n\n")
-            except Exception as e:
-                print(f"Error reading file {file_path}: {e}")
-
+files_written, files_found = extract_repository(
+    REPO_DIR,
+    output_file,
+    workers=EXTRACTION_WORKERS,
+    manifest_path=EXTRACTION_MANIFEST,
+    code_extensions=code_extensions,
+    excluded_dirs=excluded_dirs,
+    utility_or_config_files=utility_or_config_files,
+    github_workflow_or_docs=github_workflow_or_docs,
+)
+print(f"Extracted {files_written} of {files_found} candidate files")
 print(f"Code extracted to {output_file}")
 
 # %%
@@ -6,10 +6,9 @@
 # %%
 import os
 import sys
-import ast
-#import boto3
-import json
-import re
+
+from bedrock_utils import build_claude_request, get_bedrock_client, get_response_cache, invoke_model_with_retry
+from extraction_utils import extract_repository
 
 # %%
 # Constants
@@ -93,6 +92,12 @@ Developer Onboarding:
 # Create output directory if it doesn't exist
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
+# Processes used for file extraction (None: one per CPU)
+EXTRACTION_WORKERS = None
+
+# Cleaned output of unchanged files is reused from this manifest (None: re-read every file)
+EXTRACTION_MANIFEST = os.path.join(OUTPUT_DIR, "extraction_manifest.sqlite")
+
 # List of file extensions to include
 code_extensions = [
     ".py", ".ipynb", ".js", ".jsx", ".ts", ".tsx", ".java", ".c", ".cpp", ".h", 
@@ -133,90 +138,18 @@ print(f"Extracting code from {REPO_DIR}...")
 repo_name = os.path.basename(REPO_DIR)
 output_file = os.path.join(OUTPUT_DIR, f"{repo_name}_code.txt")
 
-# Open the output file for writing
-with open(output_file, "w", encoding="utf-8") as outfile:
-    # Walk through the repository directory
-    for root, _, files in os.walk(REPO_DIR):
-        for file in files:
-            file_path = os.path.join(root, file)
-            
-            # Skip if file path ends with "/"
-            if file_path.endswith("/"):
-                continue
-            
-            # Check if file has a desired extension
-            if not any(file_path.endswith(ext) for ext in code_extensions):
-                continue
-            
-            # Check if file is in excluded directory
-            check_path = file_path.replace("\\", "/")
-            parts = check_path.split(os.sep)[1:]
-            if any(part.startswith(".") for part in parts):
-                continue
-            
-            if "test" in check_path.lower():
-                continue
-                
-            skip_file = False
-            for excluded_dir in excluded_dirs:
-                if f"/{excluded_dir}/" in check_path or check_path.startswith(f"{excluded_dir}/"):
-                    skip_file = True
-                    break
-                    
-            if skip_file:
-                continue
-                
-            for file_name in utility_or_config_files:
-                if file_name in check_path:
-                    skip_file = True
-                    break
-                    
-            if skip_file:
-                continue
-                
-            if not all(doc_file not in check_path for doc_file in github_workflow_or_docs):
-                continue
-            
-            # Try to read the file
-            try:
-                with open(file_path, "r", encoding="utf-8") as file_content:
-                    # Skip files with insufficient substantive content
-                    file_lines = file_content.readlines()
-                    lines = [
-                        line
-                        for line in file_lines
-                        if line.strip() and not line.strip().startswith("//")
-                    ]
-                    
-                    if len(lines) < 5:  # Skip files with less than 5 substantive lines
-                        continue
-                        
-                    # Write file path and content to output file
-                    outfile.write(f"# File: {file_path}\n")
-                    
-                    # For Python files, try to clean comments and docstrings
-                    if file_path.endswith(".py"):
-                        try:
-                            source = "".join(file_lines)
-                            tree = ast.parse(source)
-                            for node in ast.walk(tree):
-                                if isinstance(node, (ast.FunctionDef, ast.ClassDef, ast.AsyncFunctionDef)) and ast.get_docstring(node):
-                                    node.body = node.body[1:]  # Remove docstring
-                                elif isinstance(node, ast.Expr) and isinstance(node.value, ast.Str):
-                                    node.value.s = ""  # Remove comments
-                            cleaned_source = ast.unparse(tree)
-                            outfile.write(cleaned_source)
-                        except:
-                            # If ast parsing fails, write the original source
-                            outfile.writelines(file_lines)
-                    else:
-                        # For non-Python files, write original content
-                        outfile.writelines(file_lines)
-                        
-                    outfile.write("\n\n")
-            except Exception as e:
-                print(f"Error reading file {file_path}: {e}")
-
+# Read and clean files across a process pool; the corpus is written in sorted path order
+files_written, files_found = extract_repository(
+    REPO_DIR,
+    output_file,
+    workers=EXTRACTION_WORKERS,
+    manifest_path=EXTRACTION_MANIFEST,
+    code_extensions=code_extensions,
+    excluded_dirs=excluded_dirs,
+    utility_or_config_files=utility_or_config_files,
+    github_workflow_or_docs=github_workflow_or_docs,
+)
+print(f"Extracted {files_written} of {files_found} candidate files")
 print(f"Code extracted to {output_file}")
 
 # %%
@@ -242,35 +175,29 @@ if proceed.upper() != "Y":
     sys.exit()
 
 # Initialize Bedrock client
-bedrock_runtime = boto3.client(
-    service_name="bedrock-runtime",
-    region_name="us-east-1",  # Change to your region
-)
+bedrock_runtime = get_bedrock_client("us-east-1")  # Change to your region
+model_id = "anthropic.claude-3-sonnet-20240229-v1:0"  # Replace with your desired model
+
+# Reuse responses from earlier runs on an unchanged repository
+get_response_cache(os.path.join(OUTPUT_DIR, "llm_response_cache.sqlite"))
 
 # Prepare input prompt
 input_prompt = f"Given this repo. \n{repo_content}\ncomplete your instruction"
 
 # Generate basic documentation
 print("Generating basic documentation...")
-request_body = {
-    "anthropic_version": "bedrock-2023-05-31",
-    "max_tokens": 4096,
-    "system": BASIC_DOCS_SYSTEM_PROMPT,
-    "messages": [
-        {"role": "user", "content": input_prompt},
-    ],
-    "temperature": 0.5,
-}
+request_body = build_claude_request(
+    model_id,
+    [{"role": "user", "content": input_prompt}],
+    system_prompt=BASIC_DOCS_SYSTEM_PROMPT,
+    max_tokens=4096,
+    temperature=0.5,
+    cache_prefix_messages=1,
+)
 
 try:
     # You can replace this with any LLM API call (DeepSeek Code, CodeLlama, Llama 3.2)
-    response = bedrock_runtime.invoke_model(
-        modelId="anthropic.claude-3-sonnet-20240229-v1:0",  # Replace with your desired model
-        body=json.dumps(request_body)
-    )
-    
-    # Parse response
-    response_body = json.loads(response['body'].read().decode())
+    response_body = invoke_model_with_retry(bedrock_runtime, model_id, request_body)
     basic_docs = response_body.get("content", [{"text": "No content received"}])[0]["text"]
     
     # Save basic documentation
@@ -285,26 +212,21 @@ try:
         print("Generating extended documentation...")
         
         # Prepare extended documentation request
-        extended_request_body = {
-            "anthropic_version": "bedrock-2023-05-31",
-            "max_tokens": 4096,
-            "system": BASIC_DOCS_SYSTEM_PROMPT,
-            "messages": [
+        extended_request_body = build_claude_request(
+            model_id,
+            [
                 {"role": "user", "content": input_prompt},
                 {"role": "assistant", "content": basic_docs},
                 {"role": "user", "content": REFINED_DOCS_FOLLOW_UP_PROMPT},
             ],
-            "temperature": 0.5,
-        }
-        
-        # Call the LLM again for extended documentation
-        extended_response = bedrock_runtime.invoke_model(
-            modelId="anthropic.claude-3-sonnet-20240229-v1:0",  # Replace with your desired model
-            body=json.dumps(extended_request_body)
+            system_prompt=BASIC_DOCS_SYSTEM_PROMPT,
+            max_tokens=4096,
+            temperature=0.5,
+            cache_prefix_messages=1,
         )
         
-        # Parse extended response
-        extended_response_body = json.loads(extended_response['body'].read().decode())
+        # Call the LLM again for extended documentation
+        extended_response_body = invoke_model_with_retry(bedrock_runtime, model_id, extended_request_body)
         extended_docs = extended_response_body.get("content", [{"text": "No content received"}])[0]["text"]
         
         # Save extended documentation
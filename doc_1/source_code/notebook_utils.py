@@ -0,0 +1,311 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Lightweight Jupyter notebook reader.
+
+Notebooks are read by scanning the .ipynb JSON directly instead of loading
+them with nbformat. Only the fields the generators use (cell type, source,
+execution count and metadata) are decoded; cell outputs and attachments,
+which can be megabytes of base64 images, are skipped by searching for the
+closing quote of each string and never parsed into Python objects.
+
+notebook_to_python() renders the cells the way nbconvert's PythonExporter
+does, including its rewriting of IPython magics and shell escapes, so the
+output matches the previous conversion without importing nbconvert.
+"""
+
+import re
+import json
+from json.decoder import scanstring
+from textwrap import dedent
+from typing import Any, Callable, Dict, List, Tuple
+
+# Fields of a cell that are decoded; everything else is skipped unparsed
+CELL_FIELDS = ("cell_type", "source", "execution_count", "metadata")
+
+# PythonExporter includes raw cells without a mimetype or with its own
+PYTHON_RAW_MIMETYPES = ("", "text/x-python")
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_NON_STRUCTURAL = re.compile(r'[^"\[\]{}]*')
+_DECODER = json.JSONDecoder()
+
+# Lines IPython rewrites: "!cmd", "!!cmd", "%magic", "?obj", "obj?" and the assignment forms
+_ESCAPED_LINE = re.compile(r"^([ \t]*)(!!|!|%|\?\?|\?)(.*)$", re.DOTALL)
+# Assignment targets: names, attributes, starred and tuple targets, subscripts and calls
+# (brackets may hold quoted strings); an "=" inside unclosed brackets is not an assignment
+_QUOTED = r"'[^'\n]*'|\"[^\"\n]*\""
+_TARGET_PART = r"(?:[\w.,* \t]|\[(?:[^\[\]'\"\n]|" + _QUOTED + r")*\]|\((?:[^()'\"\n]|" + _QUOTED + r")*\))"
+_ASSIGNED_ESCAPE = re.compile(r"^([ \t]*" + _TARGET_PART + r"+?(?<=[\w\])])[ \t]*=[ \t]*)(!|%)(.*)$", re.DOTALL)
+# Help requested with a trailing "?" or "??" (IPython's help-end syntax)
+_HELP_END = re.compile(r"(%{0,2}(?!\d)[\w*]+(?:\.[\w*]+)*)(\?\??)\n?\Z")
+
+
+def _skip_whitespace(text: str, pos: int) -> int:
+    return _WHITESPACE.match(text, pos).end()
+
+
+def _skip_string(text: str, pos: int) -> int:
+    """
+    Return the position after the JSON string starting at pos, without decoding it.
+
+    The closing quote is found with str.find, so a multi-megabyte base64
+    string costs one memchr-speed scan.
+    """
+    end = pos
+    while True:
+        end = text.find('"', end + 1)
+        if end < 0:
+            raise ValueError("Unterminated JSON string in notebook")
+        # The quote is escaped if preceded by an odd number of backslashes
+        backslash = end - 1
+        while text[backslash] == "\\":
+            backslash -= 1
+        if (end - backslash) % 2:
+            return end + 1
+
+
+def _skip_value(text: str, pos: int) -> int:
+    """Return the position after the JSON value starting at pos, without decoding it."""
+    first = text[pos]
+    if first == '"':
+        return _skip_string(text, pos)
+    if first not in "[{":
+        return _DECODER.raw_decode(text, pos)[1]
+
+    depth = 0
+    while True:
+        pos = _NON_STRUCTURAL.match(text, pos).end()
+        if pos >= len(text):
+            raise ValueError("Unterminated JSON value in notebook")
+        if text[pos] == '"':
+            pos = _skip_string(text, pos)
+            continue
+        depth += 1 if text[pos] in "[{" else -1
+        pos += 1
+        if depth == 0:
+            return pos
+
+
+def _decode_value(text: str, pos: int) -> Tuple[Any, int]:
+    return _DECODER.raw_decode(text, pos)
+
+
+def _read_object(text: str, pos: int, fields: Dict[str, Callable[[str, int], Tuple[Any, int]]]) -> Tuple[Dict[str, Any], int]:
+    """
+    Read a JSON object, decoding only the given fields.
+
+    Args:
+        text (str): Notebook JSON
+        pos (int): Position of the opening brace
+        fields (dict): Field name -> reader returning (value, end position)
+
+    Returns:
+        tuple: (dict of the fields found, position after the object)
+    """
+    if text[pos] != "{":
+        raise ValueError(f"Expected a JSON object at position {pos}")
+    found = {}
+    pos = _skip_whitespace(text, pos + 1)
+    if text[pos] == "}":
+        return found, pos + 1
+
+    while True:
+        if text[pos] != '"':
+            raise ValueError(f"Expected a field name at position {pos}")
+        key, pos = scanstring(text, pos + 1)
+        pos = _skip_whitespace(text, pos)
+        if text[pos] != ":":
+            raise ValueError(f"Expected ':' at position {pos}")
+        pos = _skip_whitespace(text, pos + 1)
+
+        if key in fields:
+            found[key], pos = fields[key](text, pos)
+        else:
+            pos = _skip_value(text, pos)
+
+        pos = _skip_whitespace(text, pos)
+        if text[pos] == "}":
+            return found, pos + 1
+        if text[pos] != ",":
+            raise ValueError(f"Expected ',' or '}}' at position {pos}")
+        pos = _skip_whitespace(text, pos + 1)
+
+
+def _read_cell(text: str, pos: int) -> Tuple[Dict[str, Any], int]:
+    return _read_object(text, pos, dict.fromkeys(CELL_FIELDS, _decode_value))
+
+
+def _read_cells(text: str, pos: int) -> Tuple[List[Dict[str, Any]], int]:
+    if text[pos] != "[":
+        raise ValueError(f"Expected the cell list at position {pos}")
+    cells = []
+    pos = _skip_whitespace(text, pos + 1)
+    if text[pos] == "]":
+        return cells, pos + 1
+
+    while True:
+        cell, pos = _read_cell(text, pos)
+        cells.append(cell)
+        pos = _skip_whitespace(text, pos)
+        if text[pos] == "]":
+            return cells, pos + 1
+        if text[pos] != ",":
+            raise ValueError(f"Expected ',' or ']' at position {pos}")
+        pos = _skip_whitespace(text, pos + 1)
+
+
+def read_notebook_cells(text: str) -> List[Dict[str, Any]]:
+    """
+    Read the cells of a notebook without decoding their outputs.
+
+    Args:
+        text (str): Contents of an .ipynb file (nbformat 4)
+
+    Returns:
+        list: One dict per cell with "cell_type", "source" (joined into a string),
+            "execution_count" and "metadata" as present in the file
+
+    Raises:
+        ValueError: If the text is not a notebook this reader understands
+    """
+    try:
+        notebook, _ = _read_object(text, _skip_whitespace(text, 0), {"cells": _read_cells, "nbformat": _decode_value})
+    except (IndexError, AttributeError):
+        raise ValueError("Truncated notebook JSON")
+
+    if notebook.get("nbformat", 4) < 4:
+        raise ValueError(f"Unsupported notebook format version {notebook['nbformat']}")
+
+    cells = notebook.get("cells", [])
+    for cell in cells:
+        source = cell.get("source", "")
+        if isinstance(source, list):
+            cell["source"] = "".join(source)
+    return cells
+
+
+def _continued_line(lines: List[str], start: int, text: str) -> Tuple[str, int]:
+    """Join backslash-continued lines the way IPython does; return (text, last line index)."""
+    parts = [text]
+    end = start
+    while parts[-1].rstrip("\n").endswith("\\") and end + 1 < len(lines):
+        end += 1
+        parts.append(lines[end])
+    return " ".join([part.rstrip()[:-1] for part in parts[:-1]] + [parts[-1].rstrip()]), end
+
+
+def _help_call(target: str, escape: str) -> str:
+    """Return the get_ipython() call IPython makes for "target?" or "target??"."""
+    if not target:
+        return "get_ipython().show_usage()"
+    method = "pinfo2" if escape == "??" else "psearch" if "*" in target else "pinfo"
+    return "get_ipython().run_line_magic({!r}, {!r})".format(method, target)
+
+
+def ipython_to_python(source: str) -> str:
+    """
+    Rewrite IPython syntax in a code cell as plain Python calls.
+
+    Mirrors the transformations nbconvert applies through IPython: leading
+    blank lines and common indentation are removed, a "%%magic" cell becomes a
+    run_cell_magic() call, and "!cmd", "!!cmd" and "%magic" lines (also on the
+    right of an assignment) become get_ipython() calls, as do "?obj", "obj?"
+    and "obj??" help requests.
+
+    Args:
+        source (str): Cell source
+
+    Returns:
+        str: Python source ending with a newline
+    """
+    if not source.endswith("\n"):
+        source += "\n"
+    lines = source.splitlines(keepends=True)
+
+    for index, line in enumerate(lines):
+        if line and not line.isspace():
+            lines = lines[index:]
+            break
+    lines = dedent("".join(lines)).splitlines(keepends=True)
+
+    if lines and lines[0].startswith("%%") and not re.match(r"%%\w+\?", lines[0]):
+        magic_name, _, first_line = lines[0][2:].rstrip().partition(" ")
+        return "get_ipython().run_cell_magic(%r, %r, %r)\n" % (magic_name, first_line, "".join(lines[1:]))
+
+    # Cheap check first: most cells contain no IPython syntax at all
+    if "!" not in source and "%" not in source and "?" not in source:
+        return "".join(lines)
+
+    output = []
+    index = 0
+    while index < len(lines):
+        line = lines[index]
+        # A trailing "?" outside strings and comments takes precedence, and replaces the whole line
+        help_end = (None if "#" in line or "'" in line or '"' in line
+                    else _HELP_END.search(line))
+        escaped = None if help_end else _ESCAPED_LINE.match(line)
+        assigned = None if help_end or escaped else _ASSIGNED_ESCAPE.match(line)
+        if help_end:
+            indent = line[:len(line) - len(line.lstrip(" \t"))]
+            output.append(indent + _help_call(help_end.group(1), help_end.group(2)) + "\n")
+        elif escaped:
+            indent, escape = escaped.group(1), escaped.group(2)
+            content, index = _continued_line(lines, index, escaped.group(3))
+            if escape in ("?", "??"):
+                call = _help_call(content, escape)
+            elif escape == "%":
+                name, _, args = content.partition(" ")
+                call = "get_ipython().run_line_magic({!r}, {!r})".format(name, args)
+            elif escape == "!!":
+                call = "get_ipython().getoutput({!r})".format(content)
+            else:
+                call = "get_ipython().system({!r})".format(content)
+            output.append(indent + call + "\n")
+        elif assigned:
+            target, escape = assigned.group(1), assigned.group(2)
+            content, index = _continued_line(lines, index, assigned.group(3))
+            if escape == "%":
+                name, _, args = content.partition(" ")
+                call = f"get_ipython().run_line_magic({name!r}, {args!r})"
+            else:
+                call = f"get_ipython().getoutput({content!r})"
+            output.append(target + call + "\n")
+        else:
+            output.append(line)
+        index += 1
+    return "".join(output)
+
+
+def notebook_to_python(text: str) -> str:
+    """
+    Convert a notebook to a Python script, as nbconvert's PythonExporter does.
+
+    Markdown cells become comment blocks, code cells are preceded by an
+    "# In[n]:" prompt, and raw cells without a mimetype are copied verbatim.
+    Outputs are never read.
+
+    Args:
+        text (str): Contents of an .ipynb file
+
+    Returns:
+        str: Python script
+
+    Raises:
+        ValueError: If the text is not a notebook this reader understands
+    """
+    parts = ["#!/usr/bin/env python\n# coding: utf-8\n"]
+    for cell in read_notebook_cells(text):
+        cell_type = cell.get("cell_type")
+        if cell.get("metadata", {}).get("transient", {}).get("remove_source", False):
+            continue
+        if cell_type == "code":
+            prompt = cell.get("execution_count") or " "
+            parts.append(f"\n# In[{prompt}]:\n\n\n{ipython_to_python(cell['source'])}\n")
+        elif cell_type == "markdown":
+            parts.append("\n# " + "\n# ".join(cell["source"].split("\n")) + "\n")
+        elif cell_type == "raw":
+            if cell.get("metadata", {}).get("raw_mimetype", "").lower() in PYTHON_RAW_MIMETYPES:
+                parts.append(cell["source"])
+    return "".join(parts)
@@ -0,0 +1,275 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Dry-run planning of documentation runs.
+
+A plan is built from the same extraction and chunking steps as a real run,
+but stops before the first model call. It shows where the input tokens are
+(a per-directory histogram), the calls of each phase with the input and
+output tokens they use, the projected consolidation levels, and an ETA at
+the configured concurrency and rate limits.
+
+The ETA comes from the latency history that every run records
+(bedrock_utils.LatencyHistory); until a model has enough recorded calls,
+default latencies are assumed and the plan says so. Expected output tokens
+likewise come from the history, falling back to max_tokens as an upper bound.
+Responses that the response cache would serve are not subtracted, so the plan
+is an upper bound for re-runs.
+"""
+
+import os
+from collections import defaultdict
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from bedrock_utils import (
+    DEFAULT_CALL_OVERHEAD_SECONDS, DEFAULT_OUTPUT_TOKENS_PER_SECOND, MIN_LATENCY_SAMPLES, LatencyHistory, RateLimiter
+)
+from consolidation_utils import DEFAULT_CONSOLIDATION_BUDGET, project_consolidation
+
+# Directory levels the histogram groups files by, and rows it shows
+PLAN_HISTOGRAM_DEPTH = 2
+PLAN_HISTOGRAM_ROWS = 15
+
+
+class TokenHistogram:
+    """
+    Input tokens per directory, collected while files stream past.
+    """
+
+    def __init__(self, count_tokens: Callable[[str], int], depth: int = PLAN_HISTOGRAM_DEPTH):
+        """
+        Args:
+            count_tokens (callable): Returns the token count of a text
+            depth (int): Number of leading path components a file is grouped by
+        """
+        self.count_tokens = count_tokens
+        self.depth = depth
+        self.files = defaultdict(int)
+        self.tokens = defaultdict(int)
+
+    def add(self, path: str, text: str) -> int:
+        """
+        Count a file into its directory.
+
+        Args:
+            path (str): File path relative to the repository root
+            text (str): Text the file contributes to the input
+
+        Returns:
+            int: Token count of the text
+        """
+        parts = path.replace("\\", "/").split("/")[:-1]
+        directory = "/".join(parts[:self.depth]) or "."
+        tokens = self.count_tokens(text)
+        self.files[directory] += 1
+        self.tokens[directory] += tokens
+        return tokens
+
+    def observe(self, records: Iterable[Tuple[str, str]], root: str = "") -> Iterator[Tuple[str, str]]:
+        """
+        Count (path, text) records as they pass through to the next step.
+
+        Args:
+            records (iterable): (file path, text) pairs, e.g. from iter_extracted_files()
+            root (str): Repository root the paths are made relative to
+
+        Yields:
+            tuple: The records, unchanged
+        """
+        for path, text in records:
+            self.add(os.path.relpath(path, root) if root else path, text)
+            yield path, text
+
+    def report(self, rows: int = PLAN_HISTOGRAM_ROWS) -> str:
+        """
+        Render the largest directories as a text histogram.
+
+        Args:
+            rows (int): Number of directories shown; the rest are summed in one row
+
+        Returns:
+            str: Histogram lines
+        """
+        total = sum(self.tokens.values())
+        if not total:
+            return "  (no files)"
+        ranked = sorted(self.tokens, key=self.tokens.get, reverse=True)
+        shown = ranked[:rows]
+        largest = self.tokens[shown[0]]
+        width = max(len(directory) for directory in shown)
+
+        lines = []
+        for directory in shown:
+            tokens = self.tokens[directory]
+            bar = "#" * max(1, round(tokens / largest * 30))
+            lines.append(f"  {directory:<{width}} {tokens:>10,} tokens {tokens / total:>6.1%} "
+                         f"{self.files[directory]:>5} files  {bar}")
+        if len(ranked) > rows:
+            rest = ranked[rows:]
+            rest_tokens = sum(self.tokens[directory] for directory in rest)
+            lines.append(f"  {f'({len(rest)} more)':<{width}} {rest_tokens:>10,} tokens {rest_tokens / total:>6.1%} "
+                         f"{sum(self.files[directory] for directory in rest):>5} files")
+        return "\n".join(lines)
+
+
+def _phase_seconds(calls: int, input_tokens: int, output_tokens: int, call_seconds: float,
+                   max_workers: int, limiter: Optional[RateLimiter]) -> float:
+    """
+    Time of a phase whose calls run concurrently: waves of calls, or the rate limits if slower.
+    """
+    waves = -(-calls // max(1, max_workers))
+    seconds = waves * call_seconds
+    if limiter is not None:
+        seconds = max(
+            seconds,
+            calls * 60.0 / limiter.requests_per_minute,
+            (input_tokens + output_tokens) * 60.0 / limiter.tokens_per_minute
+        )
+    return seconds
+
+
+def plan_run(
+    chunk_tokens: List[int],
+    model_id: str,
+    max_tokens: int = 4096,
+    system_tokens: int = 0,
+    max_workers: int = 1,
+    consolidation_mode: Optional[str] = "single",
+    extended_input_tokens: Optional[int] = None,
+    extended_calls: int = 1,
+    history: Optional[LatencyHistory] = None,
+    limiter: Optional[RateLimiter] = None,
+    consolidation_budget: int = DEFAULT_CONSOLIDATION_BUDGET
+) -> Dict[str, Any]:
+    """
+    Project the calls, tokens and duration of a documentation run.
+
+    Args:
+        chunk_tokens (list): Input tokens of each chunk (one entry for a single-prompt run)
+        model_id (str): Model the run calls
+        max_tokens (int): Maximum output tokens per call
+        system_tokens (int): Tokens of the system prompt sent with every call
+        max_workers (int): Calls run concurrently within a phase
+        consolidation_mode (str): "single", "tree" or "merkle" to merge chunk
+            fragments, None if the chunk responses are the documentation
+        extended_input_tokens (int): Input of the extended documentation call
+            besides the basic documentation; None if no extended call is made
+        extended_calls (int): Extended documentation calls, all run concurrently
+            (one per section when sections are generated in parallel), each
+            with extended_input_tokens of input
+        history (LatencyHistory): Recorded latencies (defaults are assumed without one)
+        limiter (RateLimiter): Rate limits the run is held to
+        consolidation_budget (int): Maximum input tokens per merge call
+
+    Returns:
+        dict: "phases" (list of dicts with name, calls, input_tokens, output_tokens
+            and seconds), totals ("calls", "input_tokens", "output_tokens",
+            "seconds"), "consolidation_levels", "output_tokens_per_call" and
+            "latency" (the estimate the ETA is based on)
+    """
+    if history is not None:
+        latency = history.estimate(model_id)
+    else:
+        latency = {
+            "calls": 0,
+            "overhead_seconds": DEFAULT_CALL_OVERHEAD_SECONDS,
+            "output_tokens_per_second": DEFAULT_OUTPUT_TOKENS_PER_SECOND,
+            "mean_output_tokens": None,
+        }
+    if latency["mean_output_tokens"] is not None:
+        output_per_call = min(max_tokens, round(latency["mean_output_tokens"]))
+    else:
+        output_per_call = max_tokens
+    call_seconds = latency["overhead_seconds"] + output_per_call / latency["output_tokens_per_second"]
+
+    phases = []
+
+    def add_phase(name: str, calls: int, input_tokens: int, workers: int = max_workers) -> None:
+        output_tokens = calls * output_per_call
+        seconds = _phase_seconds(calls, input_tokens, output_tokens, call_seconds, workers, limiter)
+        phases.append({"name": name, "calls": calls, "input_tokens": input_tokens,
+                       "output_tokens": output_tokens, "seconds": seconds})
+
+    chunk_calls = len(chunk_tokens)
+    add_phase("Chunk documentation" if consolidation_mode else "Documentation",
+              chunk_calls, sum(chunk_tokens) + chunk_calls * system_tokens)
+
+    levels = []
+    if consolidation_mode and chunk_calls:
+        levels = project_consolidation(chunk_calls, output_per_call, output_per_call,
+                                       consolidation_mode, consolidation_budget)
+        for level, (merges, tokens_per_merge) in enumerate(levels, 1):
+            add_phase(f"Consolidation level {level}", merges, merges * (tokens_per_merge + system_tokens))
+
+    if extended_input_tokens is not None:
+        add_phase("Extended documentation", extended_calls,
+                  extended_calls * (extended_input_tokens + output_per_call), workers=extended_calls)
+
+    return {
+        "phases": phases,
+        "calls": sum(phase["calls"] for phase in phases),
+        "input_tokens": sum(phase["input_tokens"] for phase in phases),
+        "output_tokens": sum(phase["output_tokens"] for phase in phases),
+        "seconds": sum(phase["seconds"] for phase in phases),
+        "consolidation_levels": len(levels),
+        "output_tokens_per_call": output_per_call,
+        "latency": latency,
+    }
+
+
+def format_duration(seconds: float) -> str:
+    """
+    Format seconds as "1h 02m", "3m 05s" or "12s".
+
+    Args:
+        seconds (float): Duration
+
+    Returns:
+        str: Human-readable duration
+    """
+    seconds = round(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h {seconds % 3600 // 60:02d}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m {seconds % 60:02d}s"
+    return f"{seconds}s"
+
+
+def format_plan(plan: Dict[str, Any], histogram: Optional[TokenHistogram] = None) -> str:
+    """
+    Render a plan from plan_run() as a report.
+
+    Args:
+        plan (dict): Plan from plan_run()
+        histogram (TokenHistogram): Per-directory input tokens (optional)
+
+    Returns:
+        str: Report text
+    """
+    lines = []
+    if histogram is not None:
+        lines.append("Input tokens by directory:")
+        lines.append(histogram.report())
+        lines.append("")
+
+    latency = plan["latency"]
+    if latency["calls"] >= MIN_LATENCY_SAMPLES:
+        lines.append(f"Latency from {latency['calls']} recorded calls: {latency['overhead_seconds']:.1f}s + "
+                     f"{latency['output_tokens_per_second']:.0f} output tokens/s, "
+                     f"{plan['output_tokens_per_call']} output tokens per call")
+    else:
+        lines.append(f"No latency history yet ({latency['calls']} recorded calls): assuming "
+                     f"{latency['overhead_seconds']:.1f}s + {latency['output_tokens_per_second']:.0f} output tokens/s "
+                     f"and {plan['output_tokens_per_call']} output tokens per call")
+
+    lines.append(f"{'Phase':<26} {'calls':>6} {'input tokens':>13} {'output tokens':>14} {'time':>9}")
+    for phase in plan["phases"]:
+        lines.append(f"{phase['name']:<26} {phase['calls']:>6,} {phase['input_tokens']:>13,} "
+                     f"{phase['output_tokens']:>14,} {format_duration(phase['seconds']):>9}")
+    lines.append(f"{'Total':<26} {plan['calls']:>6,} {plan['input_tokens']:>13,} "
+                 f"{plan['output_tokens']:>14,} {format_duration(plan['seconds']):>9}")
+    if plan["consolidation_levels"]:
+        lines.append(f"Projected consolidation levels: {plan['consolidation_levels']}")
+    lines.append(f"Estimated time to completion: {format_duration(plan['seconds'])}")
+    return "\n".join(lines)
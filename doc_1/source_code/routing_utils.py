@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Complexity-based routing of chunks between a fast and a strong model.
+
+Most chunks of a repository are configuration, documentation, markup or
+short straight-line code, which a fast, cheap model documents as well as the
+strong one. score_chunk() measures a chunk per file: the kind of each file
+(from its "# File:" header), the AST node count and cyclomatic complexity of
+its code (parsed with ast for Python and notebook code cells, estimated from
+lexical tokens and branch keywords for other languages, or for Python cut off
+mid-definition) and the token count of the code. ModelRouter sends a chunk
+to the fast model when all three stay under the thresholds, and to the strong
+model otherwise; it prints each decision and keeps per-tier call latencies.
+"""
+
+import ast
+import os
+import re
+import textwrap
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+from chunking_utils import PYTHON_FENCE_PATTERN, split_repository_files
+from token_utils import estimate_tokens
+
+DEFAULT_FAST_MODEL_ID = "anthropic.claude-3-haiku-20240307-v1:0"
+
+# A chunk goes to the fast model only if its code stays within all of these
+FAST_MAX_CYCLOMATIC = 15
+FAST_MAX_AST_NODES = 1200
+FAST_MAX_CODE_TOKENS = 800
+
+ROUTING_TIERS = ("fast", "strong")
+
+# File kinds by extension; anything else is treated as code
+FILE_KINDS = {
+    ".json": "config", ".yaml": "config", ".yml": "config", ".toml": "config", ".ini": "config",
+    ".cfg": "config", ".conf": "config", ".env": "config", ".lock": "config", ".xml": "config",
+    ".txt": "config",
+    ".md": "docs", ".rst": "docs",
+    ".html": "markup", ".css": "markup", ".scss": "markup", ".svg": "markup",
+}
+# Code files that are boilerplate whatever their extension
+BOILERPLATE_FILES = ("__init__.py", "setup.py", "conftest.py", "manage.py", "wsgi.py", "asgi.py")
+
+_LEXICAL_TOKEN = re.compile(r"\w+|[^\w\s]")
+_BRANCH = re.compile(r"\b(?:if|elif|for|while|case|catch|except)\b|&&|\|\||\?(?![.?:])")
+
+
+def file_kind(path: str) -> str:
+    """
+    Classify a file by its path.
+
+    Args:
+        path (str): File path ("" for text without a "# File:" header)
+
+    Returns:
+        str: "config", "docs", "markup", "boilerplate" or "code"
+    """
+    name = os.path.basename(path)
+    if name in BOILERPLATE_FILES:
+        return "boilerplate"
+    return FILE_KINDS.get(os.path.splitext(name)[1].lower(), "code")
+
+
+def _python_complexity(tree: ast.AST) -> Dict[str, int]:
+    """Count the nodes and decision points of a parsed Python tree."""
+    nodes = 0
+    cyclomatic = 1
+    for node in ast.walk(tree):
+        nodes += 1
+        if isinstance(node, (ast.If, ast.For, ast.AsyncFor, ast.While, ast.IfExp, ast.ExceptHandler)):
+            cyclomatic += 1
+        elif isinstance(node, ast.BoolOp):
+            cyclomatic += len(node.values) - 1
+        elif isinstance(node, ast.comprehension):
+            cyclomatic += 1 + len(node.ifs)
+        elif isinstance(node, getattr(ast, "match_case", ())):
+            cyclomatic += 1
+    return {"ast_nodes": nodes, "cyclomatic": cyclomatic}
+
+
+def code_complexity(source: str, path: str = "") -> Dict[str, int]:
+    """
+    Measure the size and branching of a piece of code.
+
+    Python is parsed with ast (notebooks through their code cells); text that
+    does not parse, such as other languages or a definition cut by a line
+    chunk, is estimated from its lexical tokens and branch keywords.
+
+    Args:
+        source (str): Code
+        path (str): File the code comes from
+
+    Returns:
+        dict: "ast_nodes" and "cyclomatic"
+    """
+    if path.endswith(".ipynb"):
+        source = "\n".join(PYTHON_FENCE_PATTERN.findall(source)) or source
+    if not path or path.endswith((".py", ".ipynb")):
+        try:
+            return _python_complexity(ast.parse(textwrap.dedent(source)))
+        except (SyntaxError, ValueError):
+            pass
+    return {"ast_nodes": len(_LEXICAL_TOKEN.findall(source)), "cyclomatic": 1 + len(_BRANCH.findall(source))}
+
+
+def score_chunk(chunk: str, count_tokens: Callable[[str], int] = estimate_tokens) -> Dict[str, Any]:
+    """
+    Score a chunk for routing.
+
+    Args:
+        chunk (str): Chunk text, with a "# File:" header before each file it holds
+        count_tokens (callable): Returns the token count of a text
+
+    Returns:
+        dict: "kinds" (file kinds in the chunk), "ast_nodes" and "cyclomatic"
+            (summed over its code), "tokens" (whole chunk) and "code_tokens"
+    """
+    score = {"kinds": [], "ast_nodes": 0, "cyclomatic": 0, "tokens": count_tokens(chunk), "code_tokens": 0}
+    for path, body in split_repository_files(chunk):
+        kind = file_kind(path)
+        if kind not in score["kinds"]:
+            score["kinds"].append(kind)
+        if kind != "code" or not body.strip():
+            continue
+        complexity = code_complexity(body, path)
+        score["ast_nodes"] += complexity["ast_nodes"]
+        score["cyclomatic"] += complexity["cyclomatic"]
+        score["code_tokens"] += count_tokens(body)
+    return score
+
+
+class ModelRouter:
+    """
+    Picks the fast or the strong model for each chunk and keeps per-tier statistics.
+
+    Safe to use from the worker threads that process chunks.
+    """
+
+    def __init__(
+        self,
+        strong_model_id: str,
+        fast_model_id: str = DEFAULT_FAST_MODEL_ID,
+        count_tokens: Callable[[str], int] = estimate_tokens,
+        max_cyclomatic: int = FAST_MAX_CYCLOMATIC,
+        max_ast_nodes: int = FAST_MAX_AST_NODES,
+        max_code_tokens: int = FAST_MAX_CODE_TOKENS,
+        verbose: bool = True
+    ):
+        """
+        Args:
+            strong_model_id (str): Model for complex chunks
+            fast_model_id (str): Model for trivial chunks
+            count_tokens (callable): Returns the token count of a text
+            max_cyclomatic (int): Highest cyclomatic complexity sent to the fast model
+            max_ast_nodes (int): Highest AST node count sent to the fast model
+            max_code_tokens (int): Most code tokens sent to the fast model
+            verbose (bool): Print every routing decision
+        """
+        self.models = {"fast": fast_model_id, "strong": strong_model_id}
+        self.count_tokens = count_tokens
+        self.max_cyclomatic = max_cyclomatic
+        self.max_ast_nodes = max_ast_nodes
+        self.max_code_tokens = max_code_tokens
+        self.verbose = verbose
+        self.chunks = {tier: 0 for tier in ROUTING_TIERS}
+        self.latencies: Dict[str, List[float]] = {tier: [] for tier in ROUTING_TIERS}
+        self._lock = threading.Lock()
+
+    def classify(self, chunk: str) -> Dict[str, Any]:
+        """
+        Score a chunk and choose its tier.
+
+        Args:
+            chunk (str): Chunk text
+
+        Returns:
+            dict: The score from score_chunk() with "tier" and the "reason" for it
+        """
+        score = score_chunk(chunk, self.count_tokens)
+        if score["cyclomatic"] > self.max_cyclomatic:
+            tier, reason = "strong", f"cyclomatic complexity {score['cyclomatic']} > {self.max_cyclomatic}"
+        elif score["ast_nodes"] > self.max_ast_nodes:
+            tier, reason = "strong", f"{score['ast_nodes']} AST nodes > {self.max_ast_nodes}"
+        elif score["code_tokens"] > self.max_code_tokens:
+            tier, reason = "strong", f"{score['code_tokens']} code tokens > {self.max_code_tokens}"
+        elif "code" not in score["kinds"]:
+            tier, reason = "fast", f"no code ({', '.join(score['kinds'])})"
+        else:
+            tier, reason = "fast", (f"simple code (complexity {score['cyclomatic']}, {score['ast_nodes']} AST nodes, "
+                                    f"{score['code_tokens']} code tokens)")
+        return dict(score, tier=tier, reason=reason)
+
+    def route(self, chunk: str, label: str = "Chunk") -> str:
+        """
+        Choose the model for a chunk, counting and printing the decision.
+
+        Args:
+            chunk (str): Chunk text
+            label (str): How the chunk is named in the printed decision
+
+        Returns:
+            str: Model ID to send the chunk to
+        """
+        decision = self.classify(chunk)
+        with self._lock:
+            self.chunks[decision["tier"]] += 1
+        if self.verbose:
+            print(f"{label} -> {decision['tier']} model ({self.models[decision['tier']]}): {decision['reason']}")
+        return self.models[decision["tier"]]
+
+    def record_latency(self, model_id: str, seconds: float) -> None:
+        """
+        Record the duration of a call made for a routed chunk.
+
+        Args:
+            model_id (str): Model returned by route()
+            seconds (float): Wall-clock duration of the call
+        """
+        tier = "fast" if model_id == self.models["fast"] else "strong"
+        with self._lock:
+            self.latencies[tier].append(seconds)
+
+    def summary(self) -> str:
+        """
+        Return a one-line summary of routed chunks and call latency per tier.
+
+        Returns:
+            str: Human-readable routing summary
+        """
+        with self._lock:
+            parts = []
+            for tier in ROUTING_TIERS:
+                latencies = sorted(self.latencies[tier])
+                part = f"{self.chunks[tier]} chunks to {tier} ({self.models[tier]})"
+                if latencies:
+                    part += (f", latency mean {sum(latencies) / len(latencies):.1f}s, "
+                             f"median {latencies[len(latencies) // 2]:.1f}s, max {latencies[-1]:.1f}s")
+                parts.append(part)
+            return "; ".join(parts)
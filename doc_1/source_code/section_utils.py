@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Section-parallel generation of documentation.
+
+The documentation prompts list the sections they ask for as "Heading:" lines
+followed by "- " bullets. Asked for in one response, the sections take as
+long as all of them together and the last ones are cut off when the response
+reaches max_tokens. section_prompts() splits such a prompt into one prompt
+per section; generate_sections() sends one request per section, each with the
+shared instructions and its own max_tokens, runs them concurrently and
+assembles the results in the order of the prompt. The wall-clock time is
+then that of the slowest section. When the sections share a context marked
+as a cacheable prompt prefix (the repository, or the basic documentation),
+warm_first sends one section ahead so the others read that prefix from the
+prompt cache.
+"""
+
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Tuple
+
+# A section heading: an unindented line ending in a colon, followed by bullets
+_HEADING = re.compile(r"^(\S[^\n]*?):\s*$")
+
+
+def _is_bullet(line: str) -> bool:
+    """Check whether a prompt line belongs to the bullets of a section."""
+    return line.lstrip().startswith("-")
+
+
+def split_prompt_sections(prompt: str) -> Tuple[str, List[Tuple[str, str]], str]:
+    """
+    Split a prompt into its shared instructions and its sections.
+
+    A section is a "Heading:" line followed by at least one bullet line; a
+    colon-terminated line without bullets (e.g. "Documentation should be
+    broken down into:") stays part of the surrounding text.
+
+    Args:
+        prompt (str): Prompt listing the sections
+
+    Returns:
+        tuple: (preamble before the first section, list of (title, section
+            text) pairs in prompt order, epilogue after the last section's bullets)
+    """
+    lines = prompt.strip("\n").split("\n")
+    preamble: List[str] = []
+    sections: List[Tuple[str, List[str]]] = []
+
+    for index, line in enumerate(lines):
+        heading = _HEADING.match(line)
+        next_line = lines[index + 1] if index + 1 < len(lines) else ""
+        if heading and _is_bullet(next_line):
+            sections.append((heading.group(1).strip(), [line]))
+        elif sections:
+            sections[-1][1].append(line)
+        else:
+            preamble.append(line)
+
+    # Trailing instructions after the last bullet apply to every section
+    epilogue: List[str] = []
+    if sections:
+        last_lines = sections[-1][1]
+        while len(last_lines) > 1 and not _is_bullet(last_lines[-1]):
+            epilogue.insert(0, last_lines.pop())
+
+    return (
+        "\n".join(preamble),
+        [(title, "\n".join(section_lines)) for title, section_lines in sections],
+        "\n".join(epilogue),
+    )
+
+
+def section_prompt(preamble: str, sections: List[Tuple[str, str]], index: int, epilogue: str = "") -> str:
+    """
+    Build the prompt asking for one section only.
+
+    Args:
+        preamble (str): Instructions shared by all sections
+        sections (list): (title, section text) pairs from split_prompt_sections()
+        index (int): Section to ask for
+        epilogue (str): Trailing instructions shared by all sections
+
+    Returns:
+        str: Prompt for the section
+    """
+    title, text = sections[index]
+    others = ", ".join(other for position, (other, _) in enumerate(sections) if position != index)
+    parts = [
+        preamble,
+        f"Write only the following section, starting it with the markdown header \"## {title}\":",
+        text,
+        f"The other sections ({others}) are written separately, so do not cover them here.",
+        epilogue,
+    ]
+    return "\n".join(part for part in parts if part)
+
+
+def section_prompts(prompt: str) -> List[Tuple[str, str]]:
+    """
+    Split a prompt into one prompt per section.
+
+    Args:
+        prompt (str): Prompt listing the sections
+
+    Returns:
+        list: (section title, section prompt) pairs in prompt order; a prompt
+            without at least two sections is returned whole, with an empty title
+    """
+    preamble, sections, epilogue = split_prompt_sections(prompt)
+    if len(sections) < 2:
+        return [("", prompt)]
+    return [(title, section_prompt(preamble, sections, index, epilogue)) for index, (title, _) in enumerate(sections)]
+
+
+def generate_sections(
+    prompt: str,
+    generate_section: Callable[[str, str], str],
+    max_workers: Optional[int] = None,
+    warm_first: bool = False
+) -> str:
+    """
+    Generate every section of a prompt concurrently and assemble them in order.
+
+    A section whose request fails is replaced by an error note, so the other
+    sections are still returned. Prompts without at least two sections are
+    passed through as a single request.
+
+    Args:
+        prompt (str): Prompt listing the sections
+        generate_section (callable): Called with (section title, section prompt);
+            returns the generated text
+        max_workers (int): Sections requested concurrently (default: all of them)
+        warm_first (bool): Generate the first section before the others, so that its
+            request writes the prompt cache of the shared context and the others
+            read it instead of all writing it at the same time
+
+    Returns:
+        str: The sections in prompt order, joined as one markdown document
+    """
+    sections = section_prompts(prompt)
+    if len(sections) < 2:
+        return generate_section("", prompt)
+
+    def run(index: int) -> Tuple[str, float]:
+        title, prompt_text = sections[index]
+        start_time = time.monotonic()
+        try:
+            text = generate_section(title, prompt_text)
+        except Exception as e:
+            print(f"Error generating section '{title}': {e}")
+            text = f"Error generating this section: {str(e)}"
+        seconds = time.monotonic() - start_time
+        print(f"  Section '{title}' generated in {seconds:.1f}s")
+        return text, seconds
+
+    print(f"Generating {len(sections)} sections concurrently...")
+    start_time = time.monotonic()
+    results = [run(0)] if warm_first else []
+    with ThreadPoolExecutor(max_workers=max_workers or len(sections)) as executor:
+        results.extend(executor.map(run, range(len(results), len(sections))))
+    section_seconds = [seconds for _, seconds in results]
+    print(f"Generated {len(sections)} sections in {time.monotonic() - start_time:.1f}s "
+          f"(slowest section {max(section_seconds):.1f}s, {sum(section_seconds):.1f}s of calls in total)")
+
+    parts = []
+    for (title, _), (text, _) in zip(sections, results):
+        text = text.strip()
+        if not text.startswith("#"):
+            text = f"## {title}\n\n{text}"
+        parts.append(text)
+    return "\n\n".join(parts)
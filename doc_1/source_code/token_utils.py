@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Pluggable token counters for sizing chunks and prompts.
+
+The scripts have always estimated tokens as len(text) // 4. That is a fair
+average for ordinary Python, but dense text (minified JavaScript, notebook
+JSON, non-ASCII text) packs more tokens per character, so chunks sized that
+way can overflow the budget they were planned for. Counters:
+
+- "estimate" (default): len(text) // 4. It stays the default so existing
+  chunk boundaries, chunk stores and checkpoints are unchanged.
+- "heuristic": an offline approximation of the Claude tokenizer from
+  character-class statistics (words, camelCase splits, punctuation and digit
+  runs, escapes, non-ASCII width). Its accuracy has not been measured for
+  this repository; run benchmarks/token_counter_benchmark.py with a
+  tokenizer.json to compare it with exact counts before relying on it.
+- "tokenizer": exact counts from a Hugging Face tokenizer.json file (for
+  example the Claude tokenizer shipped with older anthropic SDK releases);
+  needs the `tokenizers` package.
+- "bedrock": exact counts for the target model from the Bedrock CountTokens
+  API; one request per uncached text.
+
+get_token_counter() wraps the selected counter in a cache keyed by content
+hash, optionally persisted in SQLite, so a file (or definition) is counted
+once and unchanged files are never recounted on later runs.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from typing import Any, Callable, Dict, Optional
+
+TOKEN_COUNTERS = ("estimate", "heuristic", "tokenizer", "bedrock")
+DEFAULT_TOKEN_COUNTER = "estimate"
+
+# Part of the cache key of heuristic counts; bump when the coefficients change
+HEURISTIC_VERSION = 1
+
+# Texts shorter than this are cheaper to count again than to hash and look up
+TOKEN_CACHE_MIN_LENGTH = 256
+
+
+def _class_table(byte_class: Callable[[int], Optional[bytes]]) -> bytes:
+    """Build a bytes.translate table mapping each byte to its class, or a space."""
+    return b"".join(byte_class(value) or b" " for value in range(256))
+
+
+# Byte classes for the heuristic; everything else maps to a space
+_LETTER_CLASSES = _class_table(lambda b: b"a" if 0x61 <= b <= 0x7a else b"A" if 0x41 <= b <= 0x5a else None)
+_PUNCTUATION_CLASSES = _class_table(lambda b: b"." if 0x21 <= b <= 0x7e and not chr(b).isalnum() else None)
+_DIGIT_CLASSES = _class_table(lambda b: b"0" if 0x30 <= b <= 0x39 else None)
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the token size of a text (approximately 4 characters per token).
+
+    Args:
+        text (str): Text to measure
+
+    Returns:
+        int: Estimated token count
+    """
+    return len(text) // 4
+
+
+def heuristic_tokens(text: str) -> int:
+    """
+    Approximate the Claude token count of a text from character-class statistics.
+
+    Every feature is counted with bytes.translate and bytes.count, so the cost
+    is a few C-level passes over the text rather than a tokenizer run.
+
+    Args:
+        text (str): Text to measure
+
+    Returns:
+        int: Approximate token count
+    """
+    if not text:
+        return 0
+    raw = text.encode("utf-8")
+
+    # Words start after a non-letter or at a lower-to-upper case change (camelCase)
+    letters = raw.translate(_LETTER_CLASSES)
+    words = letters.count(b" a") + letters.count(b" A") + letters.count(b"aA") + (letters[0] != 0x20)
+    letter_count = len(letters) - letters.count(b" ")
+
+    punctuation = raw.translate(_PUNCTUATION_CLASSES)
+    punctuation_runs = punctuation.count(b" .") + (punctuation[0] != 0x20)
+    digits = raw.translate(_DIGIT_CLASSES)
+    digit_runs = digits.count(b" 0") + (digits[0] != 0x20)
+
+    # Escape sequences in JSON and string literals split into their own tokens
+    escapes = raw.count(b"\\n") + raw.count(b'\\"') + raw.count(b"\\t")
+
+    # Two-byte UTF-8 characters (accented Latin, Cyrillic, Greek) cost less than CJK and symbols
+    narrow = wide = 0
+    if not text.isascii():
+        non_ascii = len(text) - len(text.encode("ascii", "ignore"))
+        wide = len(raw) - len(text) - non_ascii
+        narrow = non_ascii - wide
+
+    return round(
+        1.36 * words + 0.06 * letter_count + 0.42 * punctuation_runs + 1.41 * digit_runs
+        + 1.65 * escapes + 0.66 * narrow + 1.18 * wide
+    )
+
+
+class TokenizerFileCounter:
+    """
+    Exact token counts from a Hugging Face tokenizer.json file.
+    """
+
+    def __init__(self, tokenizer_file: str):
+        """
+        Load the tokenizer.
+
+        Args:
+            tokenizer_file (str): Path to a tokenizer.json file
+        """
+        # Imported here: only runs that select this counter need the package
+        from tokenizers import Tokenizer
+
+        self.name = f"tokenizer:{os.path.basename(tokenizer_file)}"
+        self._tokenizer = Tokenizer.from_file(tokenizer_file)
+
+    def __call__(self, text: str) -> int:
+        return len(self._tokenizer.encode(text).ids)
+
+
+class BedrockTokenCounter:
+    """
+    Exact token counts for a model from the Bedrock CountTokens API.
+
+    The API counts a whole request, so the tokens of a one-character request
+    are measured once and subtracted from every count.
+    """
+
+    def __init__(self, bedrock_client: Any, model_id: str):
+        """
+        Args:
+            bedrock_client: Initialized AWS Bedrock runtime client
+            model_id (str): Model the counts are for
+        """
+        self.name = f"bedrock:{model_id}"
+        self._client = bedrock_client
+        self._model_id = model_id
+        self._overhead = self._count_request(".") - 1
+
+    def _count_request(self, text: str) -> int:
+        body = {
+            "anthropic_version": "bedrock-2023-05-31",
+            "max_tokens": 1,
+            "messages": [{"role": "user", "content": text}],
+        }
+        response = self._client.count_tokens(
+            modelId=self._model_id,
+            input={"invokeModel": {"body": json.dumps(body)}},
+        )
+        return response["inputTokens"]
+
+    def __call__(self, text: str) -> int:
+        if not text:
+            return 0
+        return max(0, self._count_request(text) - self._overhead)
+
+
+class CachedTokenCounter:
+    """
+    Content-addressed cache in front of a token counter.
+
+    Counts are keyed by the counter name and a SHA-256 of the text, so a file
+    whose content is unchanged is never counted again, by this run or (with a
+    database path) by later ones.
+    """
+
+    def __init__(self, counter: Callable[[str], int], name: str, db_path: Optional[str] = None,
+                 min_length: int = TOKEN_CACHE_MIN_LENGTH):
+        """
+        Args:
+            counter (callable): Returns the token count of a text
+            name (str): Counter name, part of the cache key
+            db_path (str): SQLite file persisting counts between runs (optional)
+            min_length (int): Texts shorter than this are counted directly
+        """
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self._counter = counter
+        self._min_length = min_length
+        self._counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._conn = None
+
+        if db_path:
+            db_dir = os.path.dirname(db_path)
+            if db_dir:
+                os.makedirs(db_dir, exist_ok=True)
+            self._conn = sqlite3.connect(db_path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS token_counts ("
+                "counter TEXT NOT NULL, hash TEXT NOT NULL, tokens INTEGER NOT NULL, "
+                "PRIMARY KEY (counter, hash))"
+            )
+            self._conn.commit()
+            rows = self._conn.execute("SELECT hash, tokens FROM token_counts WHERE counter = ?", (name,))
+            self._counts.update(rows)
+
+    def __call__(self, text: str) -> int:
+        if len(text) < self._min_length:
+            return self._counter(text)
+
+        key = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        tokens = self._counts.get(key)
+        if tokens is not None:
+            self.hits += 1
+            return tokens
+
+        self.misses += 1
+        tokens = self._counter(text)
+        with self._lock:
+            self._counts[key] = tokens
+            if self._conn is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO token_counts (counter, hash, tokens) VALUES (?, ?, ?)",
+                    (self.name, key, tokens)
+                )
+                self._conn.commit()
+        return tokens
+
+
+def get_token_counter(
+    name: str = DEFAULT_TOKEN_COUNTER,
+    cache_path: Optional[str] = None,
+    tokenizer_file: Optional[str] = None,
+    bedrock_client: Any = None,
+    model_id: Optional[str] = None
+) -> Callable[[str], int]:
+    """
+    Create a token counter by name.
+
+    Args:
+        name (str): One of TOKEN_COUNTERS
+        cache_path (str): SQLite file persisting counts between runs (optional)
+        tokenizer_file (str): tokenizer.json for the "tokenizer" counter
+        bedrock_client: Bedrock runtime client for the "bedrock" counter
+        model_id (str): Target model for the "bedrock" counter
+
+    Returns:
+        callable: Returns the token count of a text; the "estimate" counter is
+            returned uncached, since computing it is cheaper than a lookup
+    """
+    if name not in TOKEN_COUNTERS:
+        raise ValueError(f"Unknown token counter '{name}', expected one of {TOKEN_COUNTERS}")
+    if name == "estimate":
+        return estimate_tokens
+    if name == "heuristic":
+        return CachedTokenCounter(heuristic_tokens, f"heuristic:v{HEURISTIC_VERSION}", cache_path)
+    if name == "tokenizer":
+        if not tokenizer_file:
+            raise ValueError("The 'tokenizer' counter needs a tokenizer.json file")
+        counter = TokenizerFileCounter(tokenizer_file)
+        return CachedTokenCounter(counter, counter.name, cache_path)
+    if bedrock_client is None or not model_id:
+        raise ValueError("The 'bedrock' counter needs a Bedrock client and a model id")
+    counter = BedrockTokenCounter(bedrock_client, model_id)
+    return CachedTokenCounter(counter, counter.name, cache_path)
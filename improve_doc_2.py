@@ -1,17 +1,21 @@
-
-<<<<<<< HEAD
+"""
 This script converts a large DOCX document to a new template format while
 preserving structural elements using Claude via Amazon Bedrock.
+
+python-docx, boto3 and tqdm are imported by the functions that use them, so
+argument errors and --help are reported without loading them.
 """
 
-import docx
-from tqdm import tqdm
 import argparse
-import boto3
 import json
 import os
+import sys
 from concurrent.futures import ThreadPoolExecutor
 
+# Shared Bedrock helpers live next to the documentation generators
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "doc_1", "source_code"))
+from bedrock_utils import get_rate_limiter, get_response_cache, invoke_model_with_retry
+
 # Set up argument parser
 parser = argparse.ArgumentParser(description='Convert large DOCX document to a new template structure using Claude')
 parser.add_argument('--original', required=True, help='Path to the original document')
@@ -22,9 +26,14 @@ parser.add_argument('--aws-region', default='us-east-1', help='AWS region where
 parser.add_argument('--model', default='anthropic.claude-3-sonnet-20240229-v1:0', help='Bedrock model ID to use')
 parser.add_argument('--chunk-size', type=int, default=10, help='Number of paragraphs per chunk')
 parser.add_argument('--max-workers', type=int, default=4, help='Number of parallel workers for processing chunks')
+parser.add_argument('--rpm', type=int, default=None, help='Bedrock requests-per-minute budget shared by all workers')
+parser.add_argument('--tpm', type=int, default=None, help='Bedrock tokens-per-minute budget shared by all workers')
+parser.add_argument('--cache-db', help='SQLite file for caching Claude responses between runs (optional)')
 
 def extract_document_structure(doc_path):
     """Extract structure from a docx file including headers, subheaders, and paragraphs."""
+    import docx
+    
     print(f"Extracting structure from {doc_path}")
     doc = docx.Document(doc_path)
     structure = []
@@ -221,14 +230,8 @@ def apply_template_with_claude(chunk, template_rules, bedrock_client, model_id):
     }
     
     try:
-        # Call the Bedrock API
-        response = bedrock_client.invoke_model(
-            modelId=model_id,
-            body=json.dumps(request_body)
-        )
-        
-        # Parse the response
-        response_body = json.loads(response["body"].read())
+        # Call the Bedrock API through the shared rate limiter
+        response_body = invoke_model_with_retry(bedrock_client, model_id, request_body)
         reformatted_text = response_body["content"][0]["text"]
         
         # Parse the reformatted content back into structured form
@@ -315,6 +318,8 @@ def parse_llm_response(response_text, template_rules):
 
 def process_chunks_parallel(chunks, template_rules, bedrock_client, model_id, max_workers):
     """Process chunks in parallel using ThreadPoolExecutor."""
+    from tqdm import tqdm
+    
     print(f"Processing {len(chunks)} chunks with {max_workers} workers")
     reformatted_chunks = []
     
@@ -342,6 +347,8 @@ def process_chunks_parallel(chunks, template_rules, bedrock_client, model_id, ma
 
 def create_new_document(reformatted_chunks, output_path):
     """Create a new document with the reformatted content."""
+    import docx
+    
     print(f"Creating new document at {output_path}")
     
     # Start with a new document
@@ -379,6 +386,8 @@ def main():
     """Main function to run the document conversion process."""
     args = parser.parse_args()
     
+    import boto3
+    
     # Set up AWS session and client
     session_args = {}
     if args.aws_profile:
@@ -387,6 +396,11 @@ def main():
     session = boto3.Session(**session_args, region_name=args.aws_region)
     bedrock_client = session.client('bedrock-runtime')
     
+    # Configure the shared Bedrock rate limiter
+    get_rate_limiter(args.rpm, args.tpm)
+    if args.cache_db:
+        get_response_cache(args.cache_db)
+    
     # 1. Extract structure from both documents
     original_structure = extract_document_structure(args.original)
     template_structure = extract_document_structure(args.template)
@@ -413,5 +427,3 @@ def main():
 
 if __name__ == "__main__":
     main()
-=======
->>>>>>> b3d7fad56d66edd03b3b6906a427b424876d88a6